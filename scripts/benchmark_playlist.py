@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Playlist Generator Benchmark
+
+Builds a reproducible synthetic corpus (click tracks at known BPMs, rendered by ffmpeg
+in several formats, with and without tags/cover art) and times every stage of
+PlaylistGenerator.process_audio_file as well as an end-to-end process_directory run.
+Uploads go to a local directory through the local storage backend, so no network
+access is needed. Results are written as JSON so runs can be compared.
+
+Usage:
+    python benchmark_playlist.py --output bench.json
+    python benchmark_playlist.py --output bench.json --compare previous.json
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import platform
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_playlist import PlaylistGenerator, percentile, pil_available, which  # noqa: E402
+
+logger = logging.getLogger("benchmark")
+
+DEFAULT_BPMS = [80, 96, 110, 124]
+DEFAULT_FORMATS = ["mp3", "flac", "m4a", "wav"]
+TAGGABLE_FORMATS = {"mp3", "flac", "m4a"}
+
+# ffmpeg encoder arguments per corpus format
+FORMAT_ARGS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "192k"],
+    "flac": ["-c:a", "flac"],
+    "m4a": ["-c:a", "aac", "-b:a", "160k"],
+    "wav": ["-c:a", "pcm_s16le"],
+}
+
+
+def synthesize_click_track(path: str, bpm: int, duration: int, fmt: str) -> None:
+    """Render a decaying click on every beat at the given BPM."""
+    expression = f"0.8*sin(2*PI*1500*t)*exp(-60*mod(t\\,60/{bpm}))"
+    command = [which("ffmpeg") or "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+               "-f", "lavfi", "-i", f"aevalsrc={expression}:s=44100:d={duration}",
+               *FORMAT_ARGS[fmt], path]
+    subprocess.run(command, check=True)
+
+
+def create_cover_art(seed: int) -> Optional[bytes]:
+    """Solid colour JPEG used as embedded cover art."""
+    if not pil_available():
+        return None
+    import io
+    from PIL import Image
+    image = Image.new("RGB", (600, 600), color=((seed * 53) % 256, (seed * 97) % 256, (seed * 193) % 256))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def write_tags(path: str, fmt: str, bpm: int, name: str, cover: Optional[bytes]) -> None:
+    """Write title/artist/album/BPM, a fingerprint tag and optional cover art."""
+    fingerprint = f"BENCHMARK-{name}"
+    if fmt == "mp3":
+        from mutagen.id3 import ID3, TIT2, TPE1, TALB, TBPM, TXXX, APIC
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text=[name]))
+        tags.add(TPE1(encoding=3, text=["Benchmark"]))
+        tags.add(TALB(encoding=3, text=[f"Album {bpm}"]))
+        tags.add(TBPM(encoding=3, text=[str(bpm)]))
+        tags.add(TXXX(encoding=3, desc="ACOUSTID_FINGERPRINT", text=[fingerprint]))
+        if cover:
+            tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="", data=cover))
+        tags.save(path)
+    elif fmt == "flac":
+        from mutagen.flac import FLAC, Picture
+        audio = FLAC(path)
+        audio["TITLE"] = name
+        audio["ARTIST"] = "Benchmark"
+        audio["ALBUM"] = f"Album {bpm}"
+        audio["BPM"] = str(bpm)
+        audio["ACOUSTID_FINGERPRINT"] = fingerprint
+        if cover:
+            picture = Picture()
+            picture.type = 3
+            picture.mime = "image/jpeg"
+            picture.data = cover
+            audio.add_picture(picture)
+        audio.save()
+    elif fmt == "m4a":
+        from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
+        audio = MP4(path)
+        audio["\xa9nam"] = [name]
+        audio["\xa9ART"] = ["Benchmark"]
+        audio["\xa9alb"] = [f"Album {bpm}"]
+        audio["tmpo"] = [bpm]
+        audio["----:com.apple.iTunes:Acoustid Fingerprint"] = [MP4FreeForm(fingerprint.encode("utf-8"))]
+        if cover:
+            audio["covr"] = [MP4Cover(cover, imageformat=MP4Cover.FORMAT_JPEG)]
+        audio.save()
+
+
+def build_corpus(corpus_dir: str, bpms: List[int], formats: List[str], duration: int) -> List[Dict]:
+    """Build (or reuse) the synthetic corpus. Returns one descriptor per file."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    corpus = []
+    for bpm in bpms:
+        for fmt in formats:
+            variants = ["tagged", "untagged"] if fmt in TAGGABLE_FORMATS else ["untagged"]
+            for variant in variants:
+                name = f"click_{bpm}bpm_{variant}"
+                path = os.path.join(corpus_dir, f"{name}.{fmt}")
+                if not os.path.exists(path):
+                    synthesize_click_track(path, bpm, duration, fmt)
+                    if variant == "tagged":
+                        write_tags(path, fmt, bpm, f"{name}_{fmt}", create_cover_art(bpm))
+                corpus.append({"path": path, "bpm": bpm, "format": fmt, "tagged": variant == "tagged",
+                               "bytes": os.path.getsize(path)})
+    logger.info(f"Corpus ready: {len(corpus)} files in {corpus_dir}")
+    return corpus
+
+
+def summarize_timings(timings: Dict[str, List[float]], errors: Dict[str, int]) -> Dict:
+    """Per-stage count, total, mean, p50 and p95 in seconds."""
+    stages = {}
+    for stage, values in timings.items():
+        if not values:
+            stages[stage] = {"count": 0, "errors": errors.get(stage, 0)}
+            continue
+        stages[stage] = {
+            "count": len(values),
+            "errors": errors.get(stage, 0),
+            "total_s": round(sum(values), 4),
+            "mean_s": round(sum(values) / len(values), 4),
+            "p50_s": round(percentile(values, 50), 4),
+            "p95_s": round(percentile(values, 95), 4),
+        }
+    return stages
+
+
+def make_generator(work_dir: str, temp_dir: str) -> PlaylistGenerator:
+    """PlaylistGenerator wired to local output directories and a local storage target."""
+    os.makedirs(temp_dir, exist_ok=True)
+    generator = PlaylistGenerator(None, "benchmark", "benchmark", temp_dir=temp_dir)
+    generator.config["output"]["playlists_dir"] = os.path.join(work_dir, "public", "playlists")
+    generator.config["output"]["styles_dir"] = os.path.join(work_dir, "public", "styles")
+    generator.config["output"]["tempo_index_dir"] = os.path.join(work_dir, "public", "tempo_index")
+    server_root = os.path.join(work_dir, "server")
+    os.makedirs(server_root, exist_ok=True)
+    # Copy instead of hard-linking so upload timings stay comparable with a real transfer
+    generator.config["storage"] = {"type": "local", "root": server_root, "hardlink": False}
+    generator.config["catalog"] = {"path": os.path.join(work_dir, "catalog.db")}
+    return generator
+
+
+def benchmark_stages(corpus: List[Dict], work_dir: str) -> Dict:
+    """Time each process_audio_file stage separately on every corpus file."""
+    stages_dir = os.path.join(work_dir, "stages")
+    shutil.rmtree(stages_dir, ignore_errors=True)
+    temp_dir = os.path.join(stages_dir, "tmp")
+    generator = make_generator(stages_dir, temp_dir)
+    timings: Dict[str, List[float]] = {stage: [] for stage in
+                                       ["extract_metadata", "fingerprint", "measure_tempo",
+                                        "convert_to_mp3", "save_cover_image", "upload"]}
+    errors: Dict[str, int] = {}
+    tempo_results = []
+
+    def timed(stage: str, func: Callable, *args):
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            logger.warning(f"{stage} raised for {args[0] if args else ''}: {e}")
+            result = None
+        timings[stage].append(time.perf_counter() - start)
+        if result is None or result is False:
+            errors[stage] = errors.get(stage, 0) + 1
+        return result
+
+    for item in corpus:
+        path = item["path"]
+        metadata = timed("extract_metadata", generator.extract_metadata, path)
+
+        # Fingerprint a scratch copy so tagged corpus files keep their synthetic fingerprint
+        scratch = os.path.join(temp_dir, "fingerprint_" + os.path.basename(path))
+        shutil.copyfile(path, scratch)
+        timed("fingerprint", generator.get_acoustid_fingerprint, scratch)
+        os.remove(scratch)
+
+        measured = timed("measure_tempo", generator.measure_tempo, path)
+        tempo_results.append({"file": os.path.basename(path), "expected": item["bpm"], "measured": measured})
+
+        mp3_path = os.path.join(temp_dir, f"{os.path.basename(path)}.mp3")
+        timed("convert_to_mp3", generator.convert_to_mp3, path, mp3_path)
+
+        if metadata and metadata.get("cover_data"):
+            cover_path = timed("save_cover_image", generator.save_cover_image, metadata["cover_data"],
+                               f"{os.path.basename(path)}.jpg", temp_dir)
+            if cover_path:
+                os.remove(cover_path)
+
+        if os.path.exists(mp3_path):
+            timed("upload", generator.upload_file, mp3_path, os.path.basename(mp3_path), "audio")
+            os.remove(mp3_path)
+
+    return {
+        "stages": summarize_timings(timings, errors),
+        "tempo_accuracy": tempo_accuracy(tempo_results),
+        "bytes_uploaded": generator._get_storage().bytes_put,
+    }
+
+
+def tempo_accuracy(results: List[Dict], tolerance: int = 2) -> Dict:
+    """Compare measured tempos with the known corpus BPMs (half/double tempo counted separately)."""
+    measured = [r for r in results if r["measured"]]
+    exact = [r for r in measured if abs(r["measured"] - r["expected"]) <= tolerance]
+    octave = [r for r in measured if r not in exact and
+              min(abs(r["measured"] - 2 * r["expected"]), abs(r["measured"] * 2 - r["expected"])) <= tolerance]
+    return {
+        "files": len(results),
+        "measured": len(measured),
+        "within_tolerance": len(exact),
+        "octave_errors": len(octave),
+        "tolerance_bpm": tolerance,
+        "mean_abs_error": round(sum(abs(r["measured"] - r["expected"]) for r in measured) / len(measured), 2) if measured else None,
+        "results": results,
+    }
+
+
+def benchmark_end_to_end(corpus: List[Dict], work_dir: str) -> Dict:
+    """Run process_directory over the whole corpus against a fresh local storage target."""
+    e2e_dir = os.path.join(work_dir, "e2e")
+    shutil.rmtree(e2e_dir, ignore_errors=True)
+    temp_dir = os.path.join(e2e_dir, "tmp")
+    generator = make_generator(e2e_dir, temp_dir)
+    server = generator._get_storage()  # process_directory closes (and drops) the backend
+
+    # process_audio_file writes fingerprint/tempo tags back, so run on a copy of the corpus
+    input_dir = os.path.join(e2e_dir, "input")
+    os.makedirs(input_dir)
+    for item in corpus:
+        shutil.copy2(item["path"], input_dir)
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    generator.process_directory(input_dir, temp_dir)
+    wall = time.perf_counter() - start_wall
+
+    return {
+        "files": len(corpus),
+        "input_bytes": sum(item["bytes"] for item in corpus),
+        "wall_s": round(wall, 3),
+        "cpu_s": round(time.process_time() - start_cpu, 3),
+        "tracks_per_min": round(len(corpus) / wall * 60, 2) if wall else None,
+        "processed": len(generator.processed_files),
+        "skipped": len(generator.skipped_files),
+        "errors": len(generator.errors) + len(generator.metadata_errors),
+        "bytes_uploaded": server.bytes_put,
+    }
+
+
+# Startup probes, run in a fresh interpreter each: what each CLI mode loads before doing real work
+STARTUP_PROBES = {
+    "import": "import generate_playlist",
+    "help": "run_cli(['--help'])",
+    "recalculate-tempos": "run_cli(['--recalculate-tempos', '--config', CONFIG, '--temp-dir', TEMP_DIR])",
+    "upload-public": "import generate_playlist as g; g.require_dependencies(*g.SSH_DEPENDENCIES)",
+    "ingest": ("import generate_playlist as g; g.require_dependencies(*g.AUDIO_DEPENDENCIES, *g.SSH_DEPENDENCIES); "
+               "g.pil_available(); g.librosa_available()"),
+}
+
+STARTUP_HARNESS = """
+import contextlib, io, json, resource, runpy, sys, time
+sys.path.insert(0, SCRIPT_DIR)
+def run_cli(argv):
+    sys.argv = [SCRIPT] + argv
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            runpy.run_path(SCRIPT, run_name="__main__")
+        except SystemExit:
+            pass
+start = time.perf_counter()
+exec(PROBE)
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def benchmark_startup(work_dir: str, runs: int) -> Dict:
+    """Time interpreter + module startup for each CLI mode in fresh processes (median of runs)."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    startup_dir = os.path.join(work_dir, "startup")
+    shutil.rmtree(startup_dir, ignore_errors=True)
+    os.makedirs(os.path.join(startup_dir, "public", "playlists"))
+    os.makedirs(os.path.join(startup_dir, "public", "styles"))
+    config_path = os.path.join(startup_dir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump({"output": {"playlists_dir": os.path.join(startup_dir, "public", "playlists"),
+                              "styles_dir": os.path.join(startup_dir, "public", "styles"),
+                              "tempo_index_dir": os.path.join(startup_dir, "public", "tempo_index")}}, f)
+
+    results = {}
+    for mode, probe in STARTUP_PROBES.items():
+        samples = []
+        for _ in range(runs):
+            preamble = (f"SCRIPT_DIR = {script_dir!r}\nSCRIPT = {os.path.join(script_dir, 'generate_playlist.py')!r}\n"
+                        f"CONFIG = {config_path!r}\nTEMP_DIR = {os.path.join(startup_dir, 'tmp')!r}\nPROBE = {probe!r}\n")
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, "-c", preamble + STARTUP_HARNESS], cwd=startup_dir,
+                                       capture_output=True, text=True)
+            wall = time.perf_counter() - start
+            if completed.returncode != 0:
+                logger.warning(f"Startup probe {mode} failed: {completed.stderr.strip()[-500:]}")
+                break
+            probe_result = json.loads(completed.stdout.strip().splitlines()[-1])
+            samples.append({"process_s": wall, **probe_result})
+        if samples:
+            results[mode] = {
+                "runs": len(samples),
+                "process_p50_s": round(percentile([x["process_s"] for x in samples], 50), 4),
+                "probe_p50_s": round(percentile([x["seconds"] for x in samples], 50), 4),
+                "max_rss_kb": max(x["max_rss_kb"] for x in samples),
+            }
+    return results
+
+
+def compare_results(current: Dict, previous: Dict) -> str:
+    """Human readable p50 comparison between two benchmark result files."""
+    lines = ["Stage p50 comparison (previous → current):"]
+    for stage, stats in current.get("stages", {}).items():
+        before = previous.get("stages", {}).get(stage, {}).get("p50_s")
+        after = stats.get("p50_s")
+        if before and after:
+            lines.append(f"  {stage:<18} {before:.4f}s → {after:.4f}s ({(after - before) / before * 100:+.1f}%)")
+    before_e2e = previous.get("end_to_end", {}).get("wall_s")
+    after_e2e = current.get("end_to_end", {}).get("wall_s")
+    if before_e2e and after_e2e:
+        lines.append(f"  {'end_to_end':<18} {before_e2e:.3f}s → {after_e2e:.3f}s ({(after_e2e - before_e2e) / before_e2e * 100:+.1f}%)")
+    for mode, stats in current.get("startup", {}).items():
+        before = previous.get("startup", {}).get(mode, {}).get("process_p50_s")
+        after = stats.get("process_p50_s")
+        if before and after:
+            lines.append(f"  startup:{mode:<10} {before:.4f}s → {after:.4f}s ({(after - before) / before * 100:+.1f}%)")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the playlist generator on a synthetic corpus")
+    parser.add_argument("--work-dir", help="Directory for corpus and scratch files (default: a new temp dir)")
+    parser.add_argument("--bpms", help="Comma separated BPMs of the click tracks", default=",".join(map(str, DEFAULT_BPMS)))
+    parser.add_argument("--formats", help="Comma separated corpus formats", default=",".join(DEFAULT_FORMATS))
+    parser.add_argument("--duration", type=int, default=30, help="Length of each click track in seconds")
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run the per-stage benchmark")
+    parser.add_argument("--startup", action="store_true", help="Also measure CLI startup time and RSS per mode")
+    parser.add_argument("--startup-only", action="store_true", help="Only measure CLI startup (no corpus needed)")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh processes per startup probe")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose logging")
+
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="playlist_bench_")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    bpms = [int(b) for b in args.bpms.split(",") if b]
+    formats = [f for f in args.formats.split(",") if f]
+
+    results = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+    if not args.startup_only:
+        corpus = build_corpus(corpus_dir, bpms, formats, args.duration)
+        results["corpus"] = {"files": len(corpus), "bpms": bpms, "formats": formats, "duration_s": args.duration,
+                             "bytes": sum(item["bytes"] for item in corpus)}
+
+        logger.info("Benchmarking individual stages...")
+        results.update(benchmark_stages(corpus, work_dir))
+
+        if not args.skip_e2e:
+            logger.info("Benchmarking end-to-end process_directory...")
+            results["end_to_end"] = benchmark_end_to_end(corpus, work_dir)
+
+    if args.startup or args.startup_only:
+        logger.info("Benchmarking CLI startup per mode...")
+        results["startup"] = benchmark_startup(work_dir, args.startup_runs)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print(compare_results(results, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -16,92 +16,2293 @@ import sys
 import json
 import hashlib
 import logging
+import abc
 import argparse
+import importlib
+import bisect
+import contextlib
+import csv
+import glob
+import shutil
+import stat
+import posixpath
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, cast
+from shutil import which
+from urllib.parse import urlsplit
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, cast
 import time
 import io
+import base64
+import math
+import functools
+import heapq
+import itertools
+import queue
 import random
+import socket
+import sqlite3
+import threading
+import subprocess
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
 
-# External dependencies
-try:
+INSTALL_HINT = "pip install pydub mutagen pyacoustid paramiko requests pillow"
+
+
+class LazyImport:
+    """Stand-in for a module (or one of its attributes) that is imported on first use.
+    
+    Keeps heavy dependencies out of startup for CLI modes that never touch them.
+    """
+    
+    def __init__(self, module_name: str, attribute: Optional[str] = None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+    
+    def load(self):
+        if self._target is None:
+            module = importlib.import_module(self._module_name)
+            self._target = getattr(module, self._attribute) if self._attribute else module
+        return self._target
+    
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+    
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+
+def require_dependencies(*dependencies: LazyImport) -> None:
+    """Import required dependencies of a CLI mode up front, exiting with install hints if one is missing."""
+    for dependency in dependencies:
+        try:
+            dependency.load()
+        except ImportError as e:
+            print(f"Missing required dependency: {e}")
+            print("Please install required packages:")
+            print(INSTALL_HINT)
+            sys.exit(1)
+
+
+# External dependencies, loaded per subsystem on first use
+mutagen = LazyImport("mutagen")
+acoustid = LazyImport("acoustid")
+paramiko = LazyImport("paramiko")
+if TYPE_CHECKING:
     from pydub import AudioSegment
-    from pydub.utils import which
-    import mutagen  # type: ignore
-    from mutagen.mp4 import MP4Cover
-    import acoustid
-    import paramiko
-    from paramiko import SSHClient, SFTPClient
-    import requests
-except ImportError as e:
-    print(f"Missing required dependency: {e}")
-    print("Please install required packages:")
-    print("pip install pydub mutagen pyacoustid paramiko requests pillow")
-    sys.exit(1)
-
-# Import optional dependencies with graceful fallbacks
-PIL_AVAILABLE = False
+    from paramiko import SFTPClient, Transport
+else:
+    AudioSegment = LazyImport("pydub", "AudioSegment")
+
+AUDIO_DEPENDENCIES = (AudioSegment, mutagen, acoustid)
+SSH_DEPENDENCIES = (paramiko,)
+
+# Optional dependencies with graceful fallbacks, checked on first use
+PIL_AVAILABLE: Optional[bool] = None
 Image = None
 ImageDraw = None
 ImageFont = None
+
+LIBROSA_AVAILABLE: Optional[bool] = None
+librosa = None
+
+
+def pil_available() -> bool:
+    """Import PIL/Pillow on first call. Cover art processing is disabled without it."""
+    global PIL_AVAILABLE, Image, ImageDraw, ImageFont
+    if PIL_AVAILABLE is None:
+        try:
+            from PIL import Image, ImageDraw, ImageFont  # type: ignore
+            PIL_AVAILABLE = True
+        except ImportError:
+            PIL_AVAILABLE = False
+            print("Warning: PIL/Pillow not available. Cover art extraction will be disabled.")
+    return PIL_AVAILABLE
+
+
+def librosa_available() -> bool:
+    """Import librosa (numpy/scipy/numba) on first call. Tempo measurement is disabled without it."""
+    global LIBROSA_AVAILABLE, librosa
+    if LIBROSA_AVAILABLE is None:
+        try:
+            import librosa  # type: ignore
+            LIBROSA_AVAILABLE = True
+        except ImportError:
+            LIBROSA_AVAILABLE = False
+            print("Warning: librosa not available. Tempo measurement will be disabled.")
+    return LIBROSA_AVAILABLE
+
+
+NUMPY_AVAILABLE: Optional[bool] = None
+np = None
+
+
+def numpy_available() -> bool:
+    """Import NumPy on first call. Near-duplicate detection is disabled without it."""
+    global NUMPY_AVAILABLE, np
+    if NUMPY_AVAILABLE is None:
+        try:
+            import numpy as np  # type: ignore
+            NUMPY_AVAILABLE = True
+        except ImportError:
+            NUMPY_AVAILABLE = False
+            print("Warning: numpy not available. Near-duplicate detection will be disabled.")
+    return NUMPY_AVAILABLE
+
+# resource is POSIX only, used for peak RSS and child process CPU time
 try:
-    from PIL import Image, ImageDraw, ImageFont  # type: ignore
-    PIL_AVAILABLE = True
+    import resource
 except ImportError:
-    print("Warning: PIL/Pillow not available. Cover art extraction will be disabled.")
+    resource = None  # type: ignore
+
+# Rendition formats: format name -> (file extension, ffmpeg muxer, ffmpeg codec)
+RENDITION_FORMATS = {
+    "mp3": ("mp3", "mp3", None),
+    "opus": ("opus", "opus", "libopus"),
+    "aac": ("m4a", "ipod", "aac"),
+}
+
+# Input formats picked up by process_directory
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.flac', '.aac', '.m4a', '.ogg', '.wma'}
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class StageMetrics:
+    """Per-stage wall/CPU time and byte counters, plus the process peak RSS. Every call is a no-op when disabled.
+    
+    CPU time of child processes (ffmpeg, fpcalc) can only be read process-wide, so it is only added
+    to stages with child_cpu set (one track worker); otherwise a stage would be charged for the
+    children of stages running in parallel.
+    """
+    
+    def __init__(self, enabled: bool = False, child_cpu: bool = True):
+        self.enabled = enabled
+        self.child_cpu = child_cpu
+        self.started_at = time.time()
+        self.stages: Dict[str, Dict] = {}
+        self.file_times: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def _stage(self, name: str) -> Dict:
+        if name not in self.stages:
+            self.stages[name] = {"wall": [], "cpu": 0.0, "bytes": {}}
+        return self.stages[name]
+    
+    @staticmethod
+    def _children_cpu() -> float:
+        if resource is None:
+            return 0.0
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+    
+    @staticmethod
+    def peak_rss_kb() -> int:
+        if resource is None:
+            return 0
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    
+    def start(self) -> Tuple[float, float, float]:
+        """Snapshot taken when a stage starts."""
+        return time.perf_counter(), time.thread_time(), self._children_cpu() if self.child_cpu else 0.0
+    
+    def finish(self, name: str, started: Tuple[float, float, float], file_path: Optional[str] = None) -> None:
+        """Record a finished stage. CPU time includes ffmpeg/fpcalc child processes if child_cpu is set."""
+        wall = time.perf_counter() - started[0]
+        cpu = time.thread_time() - started[1]
+        if self.child_cpu:
+            cpu += self._children_cpu() - started[2]
+        with self._lock:
+            stage = self._stage(name)
+            stage["wall"].append(wall)
+            stage["cpu"] += cpu
+            if file_path is not None:
+                self.file_times[file_path] = self.file_times.get(file_path, 0.0) + wall
+    
+    def add_bytes(self, name: str, direction: str, count: int) -> None:
+        """Count bytes read, written or uploaded by a stage."""
+        if not self.enabled:
+            return
+        with self._lock:
+            counters = self._stage(name)["bytes"]
+            counters[direction] = counters.get(direction, 0) + count
+    
+    def slowest_files(self, count: int = 10) -> List[Tuple[str, float]]:
+        return sorted(self.file_times.items(), key=lambda item: item[1], reverse=True)[:count]
+    
+    def to_dict(self) -> Dict:
+        stages = {}
+        for name, stage in self.stages.items():
+            wall = stage["wall"]
+            stages[name] = {
+                "count": len(wall),
+                "wall_total_s": round(sum(wall), 4),
+                "wall_p50_s": round(percentile(wall, 50), 4) if wall else None,
+                "wall_p95_s": round(percentile(wall, 95), 4) if wall else None,
+                "cpu_total_s": round(stage["cpu"], 4),
+                "bytes": dict(stage["bytes"])
+            }
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "duration_s": round(time.time() - self.started_at, 3),
+            "peak_rss_kb": self.peak_rss_kb(),
+            "child_cpu": self.child_cpu,
+            "stages": stages,
+            "slowest_files": [{"file": f, "seconds": round(t, 3)} for f, t in self.slowest_files()]
+        }
+    
+    def to_prometheus(self) -> str:
+        """Render metrics in the Prometheus textfile collector format."""
+        prefix = "playlist_generator"
+        data = self.to_dict()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Wall time per stage call.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, stage in data["stages"].items():
+            if stage["count"]:
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="0.5"}} {stage["wall_p50_s"]}')
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="0.95"}} {stage["wall_p95_s"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage["wall_total_s"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines += [
+            f"# HELP {prefix}_stage_cpu_seconds_total CPU time per stage, including child processes with one track worker.",
+            f"# TYPE {prefix}_stage_cpu_seconds_total counter",
+        ]
+        for name, stage in data["stages"].items():
+            lines.append(f'{prefix}_stage_cpu_seconds_total{{stage="{name}"}} {stage["cpu_total_s"]}')
+        lines += [
+            f"# HELP {prefix}_stage_bytes_total Bytes read, written or uploaded per stage.",
+            f"# TYPE {prefix}_stage_bytes_total counter",
+        ]
+        for name, stage in data["stages"].items():
+            for direction, count in stage["bytes"].items():
+                lines.append(f'{prefix}_stage_bytes_total{{stage="{name}",direction="{direction}"}} {count}')
+        lines += [
+            f"# HELP {prefix}_peak_rss_bytes Peak resident set size of the generator process.",
+            f"# TYPE {prefix}_peak_rss_bytes gauge",
+            f"{prefix}_peak_rss_bytes {data['peak_rss_kb'] * 1024}",
+            f"# HELP {prefix}_run_duration_seconds Duration of the run.",
+            f"# TYPE {prefix}_run_duration_seconds gauge",
+            f"{prefix}_run_duration_seconds {data['duration_s']}",
+        ]
+        return "\n".join(lines) + "\n"
+    
+    def write(self, metrics_dir: str) -> Tuple[str, str]:
+        """Write metrics.json and metrics.prom (atomically, for textfile collectors) into metrics_dir."""
+        os.makedirs(metrics_dir, exist_ok=True)
+        json_path = os.path.join(metrics_dir, "metrics.json")
+        prom_path = os.path.join(metrics_dir, "metrics.prom")
+        for path, content in ((json_path, json.dumps(self.to_dict(), indent=2)), (prom_path, self.to_prometheus())):
+            with open(path + ".tmp", 'w') as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+        return json_path, prom_path
+
+
+class ProfilingHooks:
+    """Opt-in profilers for --profile, writing their results into a run directory.
+    
+    Modes:
+    - cprofile: one cProfile per stage, dumped as <stage>.prof (pstats/snakeviz) plus all_stages.prof
+    - memory: tracemalloc snapshots around MEMORY_STAGES, the worst call per stage is kept
+    - sample: a sampling thread that records the stacks of all threads as samples.folded (speedscope, flamegraph.pl)
+    """
+    
+    MODES = ("cprofile", "memory", "sample")
+    MEMORY_STAGES = {"extract_metadata", "convert_to_mp3", "decode"}
+    
+    def __init__(self, modes: List[str], run_dir: str, sample_interval: float = 0.005):
+        self.modes = set(self.MODES if "all" in modes else modes)
+        self.run_dir = run_dir
+        self.sample_interval = sample_interval
+        self.stage_profiles: Dict[str, object] = {}
+        self.memory_worst: Dict[str, Tuple[int, object, object]] = {}
+        self.samples: Dict[str, int] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop = threading.Event()
+        os.makedirs(run_dir, exist_ok=True)
+        
+        if "memory" in self.modes:
+            import tracemalloc
+            tracemalloc.start(25)
+        if "sample" in self.modes:
+            self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+            self._sampler.start()
+    
+    def enter(self, stage: str) -> Optional[Dict]:
+        """Start profiling a stage call. Nested stages are accounted to the outermost one."""
+        if getattr(self._local, "active", None) is not None:
+            return None
+        state: Dict = {"stage": stage}
+        self._local.active = stage
+        
+        if "memory" in self.modes and stage in self.MEMORY_STAGES:
+            import tracemalloc
+            tracemalloc.reset_peak()
+            state["snapshot"] = tracemalloc.take_snapshot()
+        
+        if "cprofile" in self.modes:
+            import cProfile
+            with self._lock:
+                profile = self.stage_profiles.setdefault(stage, cProfile.Profile())
+            try:
+                profile.enable()  # type: ignore
+                state["profile"] = profile
+            except ValueError:
+                # Another profiler is active (e.g. a stage running concurrently on another thread)
+                pass
+        
+        return state
+    
+    def exit(self, state: Optional[Dict]) -> None:
+        if state is None:
+            return
+        self._local.active = None
+        
+        if "profile" in state:
+            state["profile"].disable()
+        
+        if "snapshot" in state:
+            import tracemalloc
+            _, peak = tracemalloc.get_traced_memory()
+            stage = state["stage"]
+            with self._lock:
+                if peak > self.memory_worst.get(stage, (0, None, None))[0]:
+                    self.memory_worst[stage] = (peak, state["snapshot"], tracemalloc.take_snapshot())
+    
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+    
+    def close(self) -> List[str]:
+        """Stop all profilers and write their output. Returns the written files."""
+        written = []
+        
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            path = os.path.join(self.run_dir, "samples.folded")
+            with open(path, 'w') as f:
+                for stack, count in sorted(self.samples.items()):
+                    f.write(f"{stack} {count}\n")
+            written.append(path)
+        
+        if self.stage_profiles:
+            import pstats
+            combined = None
+            for stage, profile in self.stage_profiles.items():
+                path = os.path.join(self.run_dir, f"{stage}.prof")
+                profile.dump_stats(path)  # type: ignore
+                written.append(path)
+                if combined is None:
+                    combined = pstats.Stats(path)
+                else:
+                    combined.add(path)
+            if combined is not None:
+                path = os.path.join(self.run_dir, "all_stages.prof")
+                combined.dump_stats(path)
+                written.append(path)
+                with open(os.path.join(self.run_dir, "all_stages.txt"), 'w') as f:
+                    pstats.Stats(path, stream=f).sort_stats("cumulative").print_stats(40)
+        
+        if "memory" in self.modes:
+            import tracemalloc
+            for stage, (peak, before, after) in self.memory_worst.items():
+                after.dump(os.path.join(self.run_dir, f"{stage}.snapshot"))  # type: ignore
+                path = os.path.join(self.run_dir, f"{stage}.memory.txt")
+                with open(path, 'w') as f:
+                    f.write(f"Worst {stage} call: peak traced memory {peak / (1024 * 1024):.1f} MB\n\n")
+                    for difference in after.compare_to(before, "lineno")[:25]:  # type: ignore
+                        f.write(f"{difference}\n")
+                written.append(path)
+            tracemalloc.stop()
+        
+        return written
+
+
+class ProgressReporter:
+    """Live progress for process_directory: files done/total, active stages, tracks/min, upload MB/s and ETA.
+    
+    On a TTY a tqdm bar is drawn (log lines are routed through it so they don't break the bar);
+    otherwise, or when tqdm is missing, a progress line is logged every `interval` seconds.
+    """
+    
+    def __init__(self, total: int, interval: float = 30.0, interactive: Optional[bool] = None):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.uploaded_bytes = 0
+        self.active: Dict[str, int] = {}
+        self.started_at = time.monotonic()
+        self._last_report = self.started_at
+        self._lock = threading.Lock()
+        self._bar = None
+        self._redirect = None
+        self._closed = False
+        
+        if interactive is None:
+            interactive = sys.stderr.isatty()
+        if interactive:
+            try:
+                from tqdm import tqdm
+                from tqdm.contrib.logging import logging_redirect_tqdm
+                self._bar = tqdm(total=total or None, unit="track", dynamic_ncols=True, mininterval=0.5)
+                self._redirect = logging_redirect_tqdm()
+            except ImportError:
+                logger.debug("tqdm not available, falling back to periodic progress log lines")
+    
+    def __enter__(self) -> "ProgressReporter":
+        if self._redirect is not None:
+            self._redirect.__enter__()
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+        if self._redirect is not None:
+            self._redirect.__exit__(*exc_info)
+    
+    def stage_started(self, stage: str) -> None:
+        with self._lock:
+            self.active[stage] = self.active.get(stage, 0) + 1
+    
+    def stage_finished(self, stage: str) -> None:
+        with self._lock:
+            self.active[stage] = max(0, self.active.get(stage, 0) - 1)
+        self._refresh()
+    
+    def add_total(self, count: int = 1) -> None:
+        """Grow the total while the directory scan is still discovering files."""
+        with self._lock:
+            self.total += count
+            if self._bar is not None:
+                self._bar.total = self.total
+    
+    def add_uploaded(self, count: int) -> None:
+        with self._lock:
+            self.uploaded_bytes += count
+    
+    def file_done(self) -> None:
+        with self._lock:
+            self.done += 1
+        if self._bar is not None:
+            self._bar.update(1)
+        self._refresh()
+    
+    def snapshot(self) -> Dict:
+        """Current counters and derived rates."""
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        with self._lock:
+            done = self.done
+            active = {stage: count for stage, count in self.active.items() if count}
+            uploaded = self.uploaded_bytes
+        remaining = max(self.total - done, 0)
+        return {
+            "done": done,
+            "total": self.total,
+            "active": active,
+            "tracks_per_min": done / elapsed * 60,
+            "upload_mb_s": uploaded / elapsed / (1024 * 1024),
+            "eta_seconds": remaining * elapsed / done if done else None,
+        }
+    
+    @staticmethod
+    def _format_eta(seconds: Optional[float]) -> str:
+        if seconds is None:
+            return "--:--"
+        minutes, secs = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+    
+    def format_line(self) -> str:
+        snap = self.snapshot()
+        active = ", ".join(f"{stage}={count}" for stage, count in sorted(snap["active"].items())) or "idle"
+        return (f"Progress: {snap['done']}/{snap['total']} files | {snap['tracks_per_min']:.1f} tracks/min | "
+                f"upload {snap['upload_mb_s']:.2f} MB/s | ETA {self._format_eta(snap['eta_seconds'])} | active: {active}")
+    
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._bar is not None:
+            if now - self._last_report >= 0.5:
+                self._last_report = now
+                snap = self.snapshot()
+                active = ",".join(f"{stage}={count}" for stage, count in sorted(snap["active"].items()))
+                self._bar.set_postfix_str(f"{snap['tracks_per_min']:.1f}/min {snap['upload_mb_s']:.2f}MB/s {active}", refresh=True)
+        elif now - self._last_report >= self.interval:
+            self._last_report = now
+            logger.info(self.format_line())
+    
+    def close(self) -> None:
+        """Close the bar and log the final line. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._bar is not None:
+            self._bar.close()
+        logger.info(self.format_line())
+
+
+def scan_audio_files(root: str, extensions=AUDIO_EXTENSIONS, workers: int = 8, sort_by_size: bool = False, on_found: Optional[Callable[[], None]] = None) -> Iterator[str]:
+    """Walk `root` with os.scandir on a thread pool and yield audio file paths as they are found.
+    
+    Extensions are matched on the directory entry name, so non-audio files (covers, cue sheets, ...)
+    are never stat()ed, and subdirectories are listed concurrently, which hides the round-trip latency
+    of SMB/NFS mounts. Every directory is scanned once, also when symlinks lead to it from elsewhere
+    in the tree (the path it is first reached by is used). With sort_by_size the whole tree is
+    walked first and files are yielded largest first, so the slowest tracks start early.
+    on_found is called from the scanning threads for every match (e.g. to grow a progress total).
+    """
+    results: "queue.Queue[Tuple[Optional[str], int]]" = queue.Queue()
+    seen_dirs = {os.path.realpath(root)}
+    seen_lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="scan")
+    
+    def scan_dir(directory: str) -> None:
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            # Real paths of all directories, so a directory reached directly and through a symlink is scanned once
+                            real_path = os.path.realpath(entry.path)
+                            with seen_lock:
+                                if real_path in seen_dirs:
+                                    continue
+                                seen_dirs.add(real_path)
+                            subdirs.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                            results.put((entry.path, entry.stat().st_size if sort_by_size else 0))
+                            if on_found is not None:
+                                on_found()
+                    except OSError as e:
+                        logger.warning(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"Cannot scan directory {directory}: {e}")
+        finally:
+            # Directory marker: tells the consumer how many new directories are pending. It is queued before
+            # the subdirectories are submitted, so it always arrives ahead of their own markers.
+            results.put((None, len(subdirs)))
+            for subdir in subdirs:
+                executor.submit(scan_dir, subdir)
+    
+    try:
+        executor.submit(scan_dir, root)
+        pending = 1
+        found: List[Tuple[int, str]] = []
+        while pending:
+            path, count = results.get()
+            if path is None:
+                pending += count - 1
+            elif sort_by_size:
+                found.append((count, path))
+            else:
+                yield path
+        for _, path in sorted(found, reverse=True):
+            yield path
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PlaylistSpec(NamedTuple):
+    """A playlist to fill: style, playlist id, optional cover image and tempo filter, and its manifest inputs."""
+    style: str
+    playlist: str
+    cover: Optional[str] = None
+    min_tempo: Optional[float] = None
+    max_tempo: Optional[float] = None
+    inputs: Tuple[str, ...] = ()
+    
+    def accepts(self, tempo) -> bool:
+        """Whether a song with this tempo passes the tempo filter (songs without a tempo only pass without one)."""
+        if self.min_tempo is None and self.max_tempo is None:
+            return True
+        if not isinstance(tempo, (int, float)) or tempo <= 0:
+            return False
+        return (self.min_tempo is None or tempo >= self.min_tempo) and (self.max_tempo is None or tempo <= self.max_tempo)
+
+
+def load_manifest(manifest_path: str) -> List[PlaylistSpec]:
+    """Read a batch manifest: {"playlists": [{"style", "playlist", "inputs", "min_tempo", "max_tempo", "cover"}]}.
+    
+    Inputs are directories, audio files or glob patterns (``**`` recurses); relative paths and the cover
+    are resolved against the manifest's directory. Raises ValueError for an invalid manifest.
+    """
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    return parse_manifest(manifest, os.path.dirname(os.path.abspath(manifest_path)))
+
+
+def parse_manifest(manifest: Dict, base_dir: str) -> List[PlaylistSpec]:
+    """Playlist specs of a manifest dict; relative inputs and covers are resolved against base_dir."""
+    specs = []
+    for i, entry in enumerate(manifest.get("playlists", [])):
+        missing = [key for key in ("style", "playlist", "inputs") if not entry.get(key)]
+        if missing:
+            raise ValueError(f"Manifest entry {i} is missing {', '.join(missing)}")
+        inputs = entry["inputs"] if isinstance(entry["inputs"], list) else [entry["inputs"]]
+        cover = entry.get("cover")
+        specs.append(PlaylistSpec(
+            style=entry["style"],
+            playlist=entry["playlist"],
+            cover=os.path.join(base_dir, os.path.expanduser(cover)) if cover else None,
+            min_tempo=entry.get("min_tempo"),
+            max_tempo=entry.get("max_tempo"),
+            inputs=tuple(os.path.join(base_dir, os.path.expanduser(path)) for path in inputs)
+        ))
+    
+    if not specs:
+        raise ValueError("Manifest lists no playlists")
+    playlist_ids = [spec.playlist for spec in specs]
+    duplicates = sorted({playlist_id for playlist_id in playlist_ids if playlist_ids.count(playlist_id) > 1})
+    if duplicates:
+        raise ValueError(f"Manifest lists playlists more than once: {', '.join(duplicates)}")
+    return specs
+
+
+def resolve_playlist_inputs(spec: PlaylistSpec, workers: int = 8) -> Iterator[str]:
+    """Audio files matched by the inputs of a manifest playlist."""
+    for pattern in spec.inputs:
+        if glob.has_magic(pattern):
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path) and Path(path).suffix.lower() in AUDIO_EXTENSIONS:
+                    yield path
+        elif os.path.isdir(pattern):
+            yield from scan_audio_files(pattern, workers=workers)
+        elif os.path.isfile(pattern):
+            yield pattern
+        else:
+            logger.warning(f"Manifest input {pattern} of playlist {spec.playlist} does not exist")
+
+
+def load_plan(plan_path: str) -> Tuple[Dict, List[PlaylistSpec]]:
+    """Read a --plan result and the playlist specs it was planned for. Raises ValueError for an invalid plan."""
+    with open(plan_path, 'r') as f:
+        plan = json.load(f)
+    if not isinstance(plan, dict) or not plan.get("playlists") or "files" not in plan:
+        raise ValueError("Not a plan written by --plan")
+    specs = [PlaylistSpec(
+        style=entry["style"],
+        playlist=entry["playlist"],
+        cover=entry.get("cover"),
+        min_tempo=entry.get("min_tempo"),
+        max_tempo=entry.get("max_tempo"),
+        inputs=tuple(entry.get("inputs", ()))
+    ) for entry in plan["playlists"]]
+    return plan, specs
+
+
+class CostScheduler:
+    """Run jobs longest-expected-first on a pool of worker threads.
+    
+    Jobs can be submitted while the workers are already running (e.g. streamed from the directory
+    scan); whenever a worker becomes idle it takes the most expensive job queued at that moment,
+    so long tracks don't end up alone at the tail of the run.
+    """
+    
+    def __init__(self, handler: Callable, workers: int = 1):
+        self.handler = handler
+        self._heap: List[Tuple[float, int, object]] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._work, name=f"track-worker-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+    
+    def submit(self, cost: float, job) -> None:
+        with self._condition:
+            heapq.heappush(self._heap, (-cost, next(self._order), job))
+            self._condition.notify()
+    
+    def close(self) -> None:
+        """Stop accepting jobs and wait until the queue is drained."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+    
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._heap and not self._closed:
+                    self._condition.wait()
+                if not self._heap:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+            try:
+                self.handler(job)
+            except Exception as e:
+                logger.error(f"Worker failed on {job}: {e}")
+
+
+def serialized(func):
+    """Run a PlaylistGenerator method under the generator's remote lock.
+    
+    Publish target setup, the remote listing cache and read-modify-write playlist updates are shared
+    between track workers, so these methods run one at a time. Storage calls themselves run on the
+    per-target upload threads (see PublishTarget).
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._remote_lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def instrumented(stage: str, reads: Optional[int] = None, writes: Optional[int] = None, per_file: bool = False, profile: bool = True):
+    """Record a PlaylistGenerator method as a metrics stage (plus profiling and live progress stage when enabled).
+    
+    reads/writes are indexes of positional path arguments whose sizes are counted as bytes
+    read/written; per_file attributes the time to the first argument for the slowest-files table.
+    profile=False leaves container stages like process_audio_file to the stages they call, both for
+    profiling and for the active-stage counts shown by the progress reporter.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            profiler = self.profiler if profile else None
+            progress = self.progress if profile else None
+            if not metrics.enabled and profiler is None and progress is None:
+                return func(self, *args, **kwargs)
+            
+            started = metrics.start() if metrics.enabled else None
+            profile_state = profiler.enter(stage) if profiler is not None else None
+            if progress is not None:
+                progress.stage_started(stage)
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                if progress is not None:
+                    progress.stage_finished(stage)
+                if profiler is not None:
+                    profiler.exit(profile_state)
+                if started is not None:
+                    metrics.finish(stage, started, args[0] if per_file and args else None)
+                    for direction, index in (("read", reads), ("written", writes)):
+                        if index is not None and index < len(args) and os.path.exists(args[index]):
+                            metrics.add_bytes(stage, direction, os.path.getsize(args[index]))
+        return wrapper
+    return decorator
+
+
+class StorageEntry(NamedTuple):
+    name: str
+    size: int
+    mtime: float
+    is_dir: bool
+
+
+class StorageBackend(abc.ABC):
+    """Publish target for generated files. Paths are relative to the target root, e.g. "public/audio/<hash>.mp3".
+    
+    Missing paths raise FileNotFoundError. put/put_stream write to a temporary name first and rename
+    it into place, so readers never see partial files.
+    """
+    
+    name = "storage"
+    
+    def __init__(self):
+        self.bytes_put = 0
+        self.limiter: Optional["BandwidthLimiter"] = None
+    
+    def _transfer(self):
+        """Context of one upload, measured by the bandwidth limiter if there is one."""
+        return self.limiter.transfer() if self.limiter is not None else contextlib.nullcontext()
+    
+    def _throttle(self, path: str) -> Optional[Callable[[int, int], None]]:
+        """Progress callback (bytes sent so far, total) that holds an upload of path to the bandwidth cap."""
+        limiter = self.limiter
+        if limiter is None:
+            return None
+        priority = upload_priority(path)
+        sent = [0]
+        
+        def callback(transferred: int, total: int) -> None:
+            limiter.consume(transferred - sent[0], priority)
+            sent[0] = transferred
+        return callback
+    
+    @abc.abstractmethod
+    def list(self, path: str) -> List[StorageEntry]:
+        ...
+    
+    @abc.abstractmethod
+    def stat(self, path: str) -> StorageEntry:
+        ...
+    
+    @abc.abstractmethod
+    def makedirs(self, path: str) -> None:
+        ...
+    
+    def put(self, local_path: str, path: str, immutable: bool = False) -> None:
+        """Publish a local file. immutable marks content-addressed files that never change once published
+        and whose local file belongs to the generator (a temp file), so backends may share it instead of copying."""
+        with open(local_path, 'rb') as f:
+            self.put_stream(f, path)
+    
+    @abc.abstractmethod
+    def put_stream(self, stream: BinaryIO, path: str) -> None:
+        ...
+    
+    @abc.abstractmethod
+    def rename(self, source: str, target: str) -> None:
+        """Atomically move source over target."""
+    
+    @abc.abstractmethod
+    def get(self, path: str, local_path: str) -> None:
+        ...
+    
+    @abc.abstractmethod
+    def read(self, path: str) -> bytes:
+        """Contents of a small file, e.g. a lock or a JSON file."""
+    
+    @abc.abstractmethod
+    def create_exclusive(self, path: str, data: bytes) -> bool:
+        """Create a small file only if it doesn't exist (used for locks); returns False if it exists."""
+    
+    @abc.abstractmethod
+    def remove(self, path: str) -> None:
+        ...
+    
+    def close(self) -> None:
+        pass
+
+
+class SFTPStorage(StorageBackend):
+    """Publishing over SSH/SFTP below ssh.remote_path. Connects on first use."""
+    
+    def __init__(self, ssh_config: Dict):
+        super().__init__()
+        self.ssh_config = ssh_config
+        self.root = ssh_config["remote_path"]
+        self.name = f"sftp://{ssh_config['hostname']}"
+        self._ssh = None
+        self._sftp = None
+        self._known_dirs = set()
+    
+    def _connected(self) -> bool:
+        if self._sftp is None or self._ssh is None:
+            return False
+        transport = self._ssh.get_transport()
+        return transport is not None and transport.is_active()
+    
+    def _client(self) -> "SFTPClient":
+        if not self._connected():
+            if self._sftp is not None:
+                # Dropped by the server or a NAT timeout while idle (daemon mode, long analysis)
+                logger.info(f"Connection to {self.ssh_config['hostname']} was lost, reconnecting")
+                self.close()
+            self._ssh = paramiko.SSHClient()
+            self._ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            
+            # Connect using key file
+            key_path = os.path.expanduser(self.ssh_config["key_filename"])
+            self._ssh.connect(
+                hostname=self.ssh_config["hostname"],
+                username=self.ssh_config["username"],
+                port=self.ssh_config["port"],
+                key_filename=key_path,
+            )
+            keepalive = self.ssh_config.get("keepalive", 30)
+            if keepalive:
+                cast("Transport", self._ssh.get_transport()).set_keepalive(keepalive)
+            self._sftp = self._ssh.open_sftp()
+        return cast("SFTPClient", self._sftp)
+    
+    def _path(self, path: str) -> str:
+        return posixpath.join(self.root, path.replace("\\", "/"))
+    
+    @staticmethod
+    def _entry(name: str, attrs) -> StorageEntry:
+        return StorageEntry(name, attrs.st_size or 0, attrs.st_mtime or 0, stat.S_ISDIR(attrs.st_mode or 0))
+    
+    def list(self, path: str) -> List[StorageEntry]:
+        return [self._entry(attrs.filename, attrs) for attrs in self._client().listdir_attr(self._path(path))]
+    
+    def stat(self, path: str) -> StorageEntry:
+        return self._entry(posixpath.basename(path), self._client().stat(self._path(path)))
+    
+    def makedirs(self, path: str) -> None:
+        """Create missing directories with 755 permissions."""
+        self._makedirs(self._path(path).rstrip("/"))
+    
+    def _makedirs(self, remote_dir: str) -> None:
+        if not remote_dir or remote_dir in self._known_dirs:
+            return
+        sftp = self._client()
+        try:
+            sftp.stat(remote_dir)
+        except FileNotFoundError:
+            parent = posixpath.dirname(remote_dir)
+            if parent != remote_dir:
+                self._makedirs(parent)
+            logger.info(f"Creating remote directory: {remote_dir}")
+            sftp.mkdir(remote_dir)
+            sftp.chmod(remote_dir, 0o755)
+        self._known_dirs.add(remote_dir)
+    
+    def put(self, local_path: str, path: str, immutable: bool = False) -> None:
+        sftp = self._client()
+        partial = f"{path}.part"
+        with self._transfer():
+            sftp.put(local_path, self._path(partial), callback=self._throttle(path))
+        sftp.chmod(self._path(partial), 0o644)
+        self.rename(partial, path)
+        self.bytes_put += os.path.getsize(local_path)
+    
+    def put_stream(self, stream: BinaryIO, path: str) -> None:
+        sftp = self._client()
+        partial = f"{path}.part"
+        with self._transfer():
+            attrs = sftp.putfo(stream, self._path(partial), callback=self._throttle(path))
+        sftp.chmod(self._path(partial), 0o644)
+        self.rename(partial, path)
+        self.bytes_put += attrs.st_size or 0
+    
+    def rename(self, source: str, target: str) -> None:
+        sftp = self._client()
+        try:
+            sftp.posix_rename(self._path(source), self._path(target))
+        except IOError:
+            # Server without the posix-rename extension: plain SFTP rename refuses to overwrite
+            try:
+                sftp.remove(self._path(target))
+            except FileNotFoundError:
+                pass
+            sftp.rename(self._path(source), self._path(target))
+    
+    def get(self, path: str, local_path: str) -> None:
+        self._client().get(self._path(path), local_path)
+    
+    def read(self, path: str) -> bytes:
+        with self._client().open(self._path(path), 'rb') as f:
+            return f.read()
+    
+    def create_exclusive(self, path: str, data: bytes) -> bool:
+        sftp = self._client()
+        try:
+            with sftp.open(self._path(path), 'wx') as f:
+                f.write(data)
+            return True
+        except IOError as e:
+            # SFTP reports an existing file as a generic failure
+            try:
+                sftp.stat(self._path(path))
+            except FileNotFoundError:
+                raise e
+            return False
+    
+    def remove(self, path: str) -> None:
+        self._client().remove(self._path(path))
+    
+    def close(self) -> None:
+        if self._sftp is not None:
+            self._sftp.close()
+            self._sftp = None
+        if self._ssh is not None:
+            self._ssh.close()
+            self._ssh = None
+        self._known_dirs.clear()
+
+
+class LocalStorage(StorageBackend):
+    """Publishing into a local directory, e.g. the web root when the generator runs on the web server.
+    
+    Immutable (content-addressed) temp files are hard-linked into place when source and target are on
+    the same filesystem, so publishing copies no data; everything else is copied. Either way the final
+    name appears through os.replace, readable by the web server.
+    """
+    
+    def __init__(self, root: str, hardlink: bool = True):
+        super().__init__()
+        self.root = root
+        self.hardlink = hardlink
+        self.name = f"file://{os.path.abspath(root)}"
+    
+    def _path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip("/"))
+    
+    def list(self, path: str) -> List[StorageEntry]:
+        entries = []
+        with os.scandir(self._path(path)) as it:
+            for entry in it:
+                info = entry.stat()
+                entries.append(StorageEntry(entry.name, info.st_size, info.st_mtime, entry.is_dir()))
+        return entries
+    
+    def stat(self, path: str) -> StorageEntry:
+        info = os.stat(self._path(path))
+        return StorageEntry(os.path.basename(path), info.st_size, info.st_mtime, stat.S_ISDIR(info.st_mode))
+    
+    def makedirs(self, path: str) -> None:
+        os.makedirs(self._path(path), mode=0o755, exist_ok=True)
+    
+    def put(self, local_path: str, path: str, immutable: bool = False) -> None:
+        partial = self._path(f"{path}.part")
+        if os.path.lexists(partial):
+            os.remove(partial)
+        linked = False
+        if immutable and self.hardlink:
+            try:
+                os.link(local_path, partial)
+                linked = True
+            except OSError:
+                # Different filesystem (EXDEV) or no hard link support: fall back to copying
+                pass
+        if not linked:
+            if self.limiter is None:
+                shutil.copyfile(local_path, partial)
+            else:
+                with open(local_path, 'rb') as source, open(partial, 'wb') as f:
+                    self._copy(source, f, path)
+        os.chmod(partial, 0o644)
+        os.replace(partial, self._path(path))
+        self.bytes_put += os.path.getsize(local_path)
+    
+    def put_stream(self, stream: BinaryIO, path: str) -> None:
+        partial = self._path(f"{path}.part")
+        with open(partial, 'wb') as f:
+            self._copy(stream, f, path)
+            size = f.tell()
+        os.chmod(partial, 0o644)
+        os.replace(partial, self._path(path))
+        self.bytes_put += size
+    
+    def _copy(self, source: BinaryIO, target: BinaryIO, path: str, chunk_size: int = 64 * 1024) -> None:
+        """Copy in chunks under the bandwidth cap (a plain copyfileobj without a limiter)."""
+        callback = self._throttle(path)
+        if callback is None:
+            shutil.copyfileobj(source, target)
+            return
+        sent = 0
+        with self._transfer():
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                target.write(chunk)
+                sent += len(chunk)
+                callback(sent, 0)
+    
+    def rename(self, source: str, target: str) -> None:
+        os.replace(self._path(source), self._path(target))
+    
+    def get(self, path: str, local_path: str) -> None:
+        shutil.copyfile(self._path(path), local_path)
+    
+    def read(self, path: str) -> bytes:
+        with open(self._path(path), 'rb') as f:
+            return f.read()
+    
+    def create_exclusive(self, path: str, data: bytes) -> bool:
+        try:
+            fd = os.open(self._path(path), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return True
+    
+    def remove(self, path: str) -> None:
+        os.remove(self._path(path))
+
+
+def create_storage(storage_config: Dict, ssh_config: Dict) -> StorageBackend:
+    """Storage backend for a "storage" section or publish target (default: SFTP using the "ssh" settings)."""
+    storage_type = storage_config.get("type", "sftp")
+    if storage_type == "sftp":
+        return SFTPStorage({**ssh_config, **storage_config.get("ssh", {})})
+    if storage_type == "local":
+        return LocalStorage(storage_config.get("root", ssh_config["remote_path"]), storage_config.get("hardlink", True))
+    raise ValueError(f"Unknown storage type: {storage_type}")
+
+
+def storage_configs(config: Dict) -> List[Dict]:
+    """Publish targets from the "targets" list, or the single "storage" section when there is none."""
+    return config.get("targets") or [config.get("storage", {})]
+
+
+def storage_dependencies(config: Dict) -> Tuple:
+    """Lazily imported modules the configured storage backends need."""
+    if any(target.get("type", "sftp") == "sftp" for target in storage_configs(config)):
+        return SSH_DEPENDENCIES
+    return ()
+
+
+# Upload priority classes: lower goes first, both in a target's queue and for the bandwidth cap
+UPLOAD_PRIORITIES = {
+    "index": 0,   # playlist, style and tempo index JSON, so new songs appear quickly
+    "cover": 1,   # song and playlist covers
+    "audio": 2,   # bulk audio, renditions and previews
+}
+
+
+def upload_priority(path: str) -> int:
+    """Priority class of an upload from its remote name (staged names like <file>.json.<owner>.new included)."""
+    name = posixpath.basename(path)
+    if ".json" in name:
+        return UPLOAD_PRIORITIES["index"]
+    if name.endswith((".jpg", ".jpeg", ".png")):
+        return UPLOAD_PRIORITIES["cover"]
+    return UPLOAD_PRIORITIES["audio"]
+
+
+class BandwidthLimiter:
+    """Upload bandwidth cap shared by all publish targets, with time-of-day profiles and priority classes.
+    
+    Uploads report every chunk they send and wait while the token bucket (refilled at the cap in
+    effect, holding up to burst_seconds of it) is in debt. When uploads of several classes wait, the
+    most urgent class is served first. Each target uploads one file at a time in its queue's priority
+    order, so a playlist JSON only overtakes bulk audio between chunks when they are going to
+    different targets; on the same target it waits for the upload in progress to finish.
+    Profiles are {"start": "HH:MM", "end": "HH:MM", "max_kbps": n} in local time (may wrap past
+    midnight); outside them max_kbps applies, 0 meaning no cap. Achieved throughput is measured over
+    the time uploads are running, with or without a cap.
+    """
+    
+    def __init__(self, config: Dict):
+        self.max_kbps = config.get("max_kbps", 0)
+        self.schedule = config.get("schedule", [])
+        self.burst_seconds = config.get("burst_seconds", 1.0)
+        self._cond = threading.Condition()
+        self._tokens = 0.0
+        self._refilled = time.monotonic()
+        self._waiting: Dict[int, int] = {}
+        self._active = 0
+        self._busy_since = 0.0
+        self._busy_rate: Optional[float] = None
+        self.reset_stats()
+    
+    def reset_stats(self) -> None:
+        with self._cond:
+            self.bytes = 0
+            self.busy_seconds = 0.0
+            self.capped_seconds = 0.0
+            self.allowed_bytes = 0.0
+    
+    @staticmethod
+    def _minutes(clock: str) -> int:
+        hours, minutes = clock.split(":")
+        return int(hours) * 60 + int(minutes)
+    
+    def kbps(self) -> float:
+        """Cap in effect right now in kbit/s (0: no cap)."""
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for profile in self.schedule:
+            start, end = self._minutes(profile["start"]), self._minutes(profile["end"])
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                return profile.get("max_kbps", 0)
+        return self.max_kbps
+    
+    def rate(self) -> Optional[float]:
+        """Cap in effect in bytes per second, or None without a cap."""
+        kbps = self.kbps()
+        return kbps * 1000 / 8 if kbps else None
+    
+    @contextlib.contextmanager
+    def transfer(self):
+        """Mark an upload as running, for the achieved throughput."""
+        with self._cond:
+            if self._active == 0:
+                self._busy_since = time.monotonic()
+                self._busy_rate = self.rate()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                if self._active == 0:
+                    elapsed = time.monotonic() - self._busy_since
+                    self.busy_seconds += elapsed
+                    if self._busy_rate is not None:
+                        self.capped_seconds += elapsed
+                        self.allowed_bytes += self._busy_rate * elapsed
+    
+    def consume(self, nbytes: int, priority: int) -> None:
+        """Account for nbytes sent and wait until the cap allows more (and no more urgent upload is waiting)."""
+        with self._cond:
+            self.bytes += nbytes
+            self._waiting[priority] = self._waiting.get(priority, 0) + 1
+            try:
+                while True:
+                    rate = self.rate()
+                    if rate is None:
+                        return
+                    now = time.monotonic()
+                    self._tokens = min(self._tokens + (now - self._refilled) * rate, rate * self.burst_seconds)
+                    self._refilled = now
+                    urgent = any(count for waiting, count in self._waiting.items() if waiting < priority)
+                    if self._tokens > 0 and not urgent:
+                        self._tokens -= nbytes
+                        return
+                    self._cond.wait(max(-self._tokens / rate, 0.01))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+    
+    def stats(self) -> Dict:
+        """Bytes sent and achieved vs. configured throughput (kbit/s) while uploads were running."""
+        with self._cond:
+            return {
+                "bytes": self.bytes,
+                "busy_s": round(self.busy_seconds, 1),
+                "achieved_kbps": round(self.bytes * 8 / 1000 / self.busy_seconds, 1) if self.busy_seconds else None,
+                "configured_kbps": round(self.allowed_bytes * 8 / 1000 / self.capped_seconds, 1) if self.capped_seconds else None,
+                "capped_s": round(self.capped_seconds, 1)
+            }
+
+
+class PublishTarget:
+    """A storage backend with its own upload thread and counters.
+    
+    All operations on a target run on that thread, so the backend never sees concurrent calls,
+    and a slow or failing mirror only delays its own queue. Queued operations run by priority class
+    (see UPLOAD_PRIORITIES), in submission order within a class; everything but uploads runs first.
+    """
+    
+    def __init__(self, name: str, storage: StorageBackend):
+        self.name = name
+        self.storage = storage
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self._queue: List[Tuple] = []
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+    
+    def submit(self, func: Optional[Callable], *args, priority: float = -1) -> Future:
+        future: Future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name=f"publish-{self.name}", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._queue, (priority, next(self._sequence), future, func, args))
+            self._cond.notify()
+        return future
+    
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, future, func, args = heapq.heappop(self._queue)
+            if func is None:
+                # Stop marker queued by close(), after everything else
+                future.set_result(None)
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+    
+    def run(self, func: Callable, *args, priority: float = -1):
+        """Run func on the target thread and wait for its result."""
+        return self.submit(func, *args, priority=priority).result()
+    
+    def flush(self) -> None:
+        """Wait for queued uploads, keeping the backend connected."""
+        if self._thread is not None:
+            self.run(lambda: None, priority=math.inf)
+    
+    def close(self) -> None:
+        """Wait for queued uploads, then close the backend. The target reconnects on next use."""
+        if self._thread is not None:
+            self.submit(None, priority=math.inf).result()
+            self._thread.join()
+            self._thread = None
+        self.storage.close()
+
+
+def create_publish_targets(config: Dict, limiter: Optional[BandwidthLimiter] = None) -> List[PublishTarget]:
+    """One PublishTarget per configured target; the first one is the primary.
+    
+    Uploads to sftp targets go through limiter; other targets only with "throttle": true (e.g. a local
+    root on a network mount).
+    """
+    targets = []
+    for index, target_config in enumerate(storage_configs(config)):
+        storage = create_storage(target_config, config["ssh"])
+        if target_config.get("throttle", target_config.get("type", "sftp") == "sftp"):
+            storage.limiter = limiter
+        targets.append(PublishTarget(target_config.get("name", storage.name if index else "primary"), storage))
+    return targets
+
+
+class Catalog:
+    """Local SQLite catalog of tracks, playlists, styles, album covers and published objects.
+    
+    It is the source of truth for playlist and style state: ingest only updates rows and marks the
+    playlist or style dirty, and the JSON files are rendered (and uploaded) from it for dirty rows only.
+    Playlist and style fields other than songs/playlists are kept as JSON so unknown keys survive.
+    
+    Each playlist and style also keeps the version of its file on the server and the fields as last
+    published (base), which is what merging a concurrently published file is decided against.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tracks (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            artist TEXT,
+            album TEXT,
+            tempo INTEGER,
+            duration INTEGER,
+            audio TEXT,
+            cover TEXT,
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS tracks_tempo ON tracks (tempo);
+        CREATE INDEX IF NOT EXISTS tracks_album ON tracks (album);
+        CREATE TABLE IF NOT EXISTS playlists (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            min_tempo INTEGER,
+            max_tempo INTEGER,
+            dirty INTEGER NOT NULL DEFAULT 1,
+            version INTEGER NOT NULL DEFAULT 0,
+            base TEXT,
+            songs_hash TEXT,
+            updated_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS playlist_songs (
+            playlist_id TEXT NOT NULL,
+            track_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            tempo INTEGER,
+            entry TEXT NOT NULL,
+            PRIMARY KEY (playlist_id, track_id)
+        );
+        CREATE INDEX IF NOT EXISTS playlist_songs_track ON playlist_songs (track_id);
+        CREATE INDEX IF NOT EXISTS playlist_songs_order ON playlist_songs (playlist_id, position);
+        CREATE TABLE IF NOT EXISTS styles (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            dirty INTEGER NOT NULL DEFAULT 1,
+            version INTEGER NOT NULL DEFAULT 0,
+            base TEXT,
+            index_pending INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS style_playlists (
+            style_id TEXT NOT NULL,
+            playlist_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            entry TEXT NOT NULL,
+            PRIMARY KEY (style_id, playlist_id)
+        );
+        CREATE INDEX IF NOT EXISTS style_playlists_playlist ON style_playlists (playlist_id);
+        CREATE TABLE IF NOT EXISTS album_covers (
+            album TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            track_id TEXT PRIMARY KEY,
+            duration REAL,
+            items BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS remote_objects (
+            target TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER,
+            uploaded_at REAL,
+            PRIMARY KEY (target, path)
+        );
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        for table in ("playlists", "styles"):
+            # Catalogs created before files were versioned
+            columns = {row[1] for row in self._db.execute(f"PRAGMA table_info({table})")}
+            if "version" not in columns:
+                self._db.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if "base" not in columns:
+                self._db.execute(f"ALTER TABLE {table} ADD COLUMN base TEXT")
+            if table == "playlists" and "songs_hash" not in columns:
+                self._db.execute("ALTER TABLE playlists ADD COLUMN songs_hash TEXT")
+            if table == "styles" and "index_pending" not in columns:
+                self._db.execute("ALTER TABLE styles ADD COLUMN index_pending INTEGER NOT NULL DEFAULT 0")
+        self._db.commit()
+    
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+    
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT NOT EXISTS (SELECT 1 FROM playlists) AND NOT EXISTS (SELECT 1 FROM styles)").fetchone()[0] == 1
+    
+    # Playlists
+    
+    def ensure_playlist(self, playlist_id: str, data: Dict) -> None:
+        """Create the playlist with the given fields unless it exists."""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO playlists (id, data, songs_hash, updated_at) VALUES (?, ?, '', ?)",
+                             (playlist_id, json.dumps(data), time.time()))
+    
+    def add_song(self, playlist_id: str, entry: Dict) -> bool:
+        """Append a song entry to a playlist. Returns False if the song is already in it."""
+        tempo = entry.get("tempo")
+        tempo = int(tempo) if isinstance(tempo, (int, float)) and tempo > 0 else None
+        with self._lock, self._db:
+            if self._db.execute("SELECT 1 FROM playlist_songs WHERE playlist_id = ? AND track_id = ?",
+                                (playlist_id, entry["id"])).fetchone():
+                return False
+            self._upsert_track(entry)
+            position = self._db.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM playlist_songs WHERE playlist_id = ?",
+                                        (playlist_id,)).fetchone()[0]
+            self._db.execute("INSERT INTO playlist_songs (playlist_id, track_id, position, tempo, entry) VALUES (?, ?, ?, ?, ?)",
+                             (playlist_id, entry["id"], position, tempo, json.dumps(entry)))
+            self._chain_songs_hash(playlist_id, [(entry["id"], tempo)])
+            self._update_tempo_range(playlist_id)
+            return True
+    
+    @staticmethod
+    def _next_songs_hash(previous: str, track_id: str, tempo: Optional[int]) -> str:
+        return hashlib.sha1(f"{previous};{track_id}:{tempo}".encode()).hexdigest()
+    
+    def _chain_songs_hash(self, playlist_id: str, songs: List[Tuple[str, Optional[int]]]) -> None:
+        """Extend the stored songs hash by appended songs (a missing hash is computed on demand instead)."""
+        row = self._db.execute("SELECT songs_hash FROM playlists WHERE id = ?", (playlist_id,)).fetchone()
+        if row is None or row[0] is None:
+            return
+        songs_hash = row[0]
+        for track_id, tempo in songs:
+            songs_hash = self._next_songs_hash(songs_hash, track_id, tempo)
+        self._db.execute("UPDATE playlists SET songs_hash = ? WHERE id = ?", (songs_hash, playlist_id))
+    
+    def songs_hash(self, playlist_id: str) -> Optional[str]:
+        """Content hash of a playlist's song ids and tempos, or None if the playlist doesn't exist.
+        
+        It is chained in song order, so appending songs updates it without rereading the playlist.
+        """
+        with self._lock, self._db:
+            row = self._db.execute("SELECT songs_hash FROM playlists WHERE id = ?", (playlist_id,)).fetchone()
+            if row is None or row[0] is not None:
+                return row[0] if row else None
+            songs_hash = ""
+            for track_id, tempo in self._db.execute("SELECT track_id, tempo FROM playlist_songs WHERE playlist_id = ? ORDER BY position",
+                                                    (playlist_id,)):
+                songs_hash = self._next_songs_hash(songs_hash, track_id, tempo)
+            self._db.execute("UPDATE playlists SET songs_hash = ? WHERE id = ?", (songs_hash, playlist_id))
+            return songs_hash
+    
+    def playlist_tempos(self, playlist_id: str) -> List[Tuple[int, str]]:
+        """(tempo, song id) of the songs of a playlist that have a tempo."""
+        with self._lock:
+            return self._db.execute("SELECT tempo, track_id FROM playlist_songs WHERE playlist_id = ? AND tempo > 0",
+                                    (playlist_id,)).fetchall()
+    
+    def _upsert_track(self, entry: Dict) -> None:
+        tempo = entry.get("tempo")
+        self._db.execute(
+            "INSERT OR REPLACE INTO tracks (id, title, artist, album, tempo, duration, audio, cover, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (entry["id"], entry.get("title"), entry.get("artist"), entry.get("album"),
+             int(tempo) if isinstance(tempo, (int, float)) and tempo > 0 else None,
+             entry.get("duration"), entry.get("audio"), entry.get("cover"), time.time()))
+    
+    def _update_tempo_range(self, playlist_id: str) -> bool:
+        """Recompute minTempo/maxTempo from the songs; marks the playlist dirty if they changed."""
+        min_tempo, max_tempo = self._db.execute(
+            "SELECT MIN(tempo), MAX(tempo) FROM playlist_songs WHERE playlist_id = ? AND tempo > 0", (playlist_id,)).fetchone()
+        cursor = self._db.execute(
+            "UPDATE playlists SET min_tempo = ?, max_tempo = ?, dirty = 1, updated_at = ? "
+            "WHERE id = ? AND (min_tempo IS NOT ? OR max_tempo IS NOT ?)",
+            (min_tempo, max_tempo, time.time(), playlist_id, min_tempo, max_tempo))
+        # Adding a song always changes the rendered file, even when the range stays the same
+        self._db.execute("UPDATE playlists SET dirty = 1 WHERE id = ?", (playlist_id,))
+        return cursor.rowcount > 0
+    
+    def recalculate_tempo_ranges(self) -> List[str]:
+        """Recompute the tempo range of every playlist; returns the ids whose range changed.
+        
+        Changed ranges are copied into the playlists' entries in styles, which marks those styles dirty.
+        """
+        with self._lock:
+            with self._db:
+                changed = [row[0] for row in self._db.execute(
+                    "SELECT p.id FROM playlists p LEFT JOIN "
+                    "(SELECT playlist_id, MIN(tempo) AS lo, MAX(tempo) AS hi FROM playlist_songs WHERE tempo > 0 GROUP BY playlist_id) r "
+                    "ON r.playlist_id = p.id WHERE p.min_tempo IS NOT r.lo OR p.max_tempo IS NOT r.hi")]
+                for playlist_id in changed:
+                    self._update_tempo_range(playlist_id)
+            for playlist_id in changed:
+                self._update_style_entries(playlist_id)
+            return changed
+    
+    def update_playlist(self, playlist_id: str, **fields) -> None:
+        """Set playlist fields (e.g. cover) and mark the playlist dirty if anything changed."""
+        with self._lock, self._db:
+            row = self._db.execute("SELECT data FROM playlists WHERE id = ?", (playlist_id,)).fetchone()
+            if row is None:
+                return
+            data = json.loads(row[0])
+            if all(data.get(key) == value for key, value in fields.items()):
+                return
+            data.update(fields)
+            self._db.execute("UPDATE playlists SET data = ?, dirty = 1, updated_at = ? WHERE id = ?",
+                             (json.dumps(data), time.time(), playlist_id))
+    
+    def track_entries(self, track_id: str) -> List[Dict]:
+        """The entries a track was added to playlists with, newest first."""
+        with self._lock:
+            return [json.loads(entry) for entry, in self._db.execute(
+                "SELECT entry FROM playlist_songs WHERE track_id = ? ORDER BY rowid DESC", (track_id,))]
+    
+    def get_playlist(self, playlist_id: str) -> Optional[Dict]:
+        """The playlist as rendered to JSON, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT data, min_tempo, max_tempo FROM playlists WHERE id = ?", (playlist_id,)).fetchone()
+            if row is None:
+                return None
+            playlist = json.loads(row[0])
+            playlist["songs"] = [json.loads(entry) for entry, in self._db.execute(
+                "SELECT entry FROM playlist_songs WHERE playlist_id = ? ORDER BY position", (playlist_id,))]
+            if row[1] is not None:
+                playlist["minTempo"] = row[1]
+                playlist["maxTempo"] = row[2]
+            return playlist
+    
+    def playlist_ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT id FROM playlists ORDER BY id")]
+    
+    # Styles
+    
+    def get_style(self, style_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM styles WHERE id = ?", (style_id,)).fetchone()
+            if row is None:
+                return None
+            style_data = json.loads(row[0])
+            style_data["playlists"] = [json.loads(entry) for entry, in self._db.execute(
+                "SELECT entry FROM style_playlists WHERE style_id = ? ORDER BY position", (style_id,))]
+            return style_data
+    
+    def style_ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT id FROM styles ORDER BY id")]
+    
+    def upsert_style_playlist(self, style_id: str, style_data: Dict, entry: Dict) -> Optional[Dict]:
+        """Add or replace a playlist entry of a style (creating the style); returns the previous entry."""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO styles (id, data, updated_at) VALUES (?, ?, ?)",
+                             (style_id, json.dumps(style_data), time.time()))
+            row = self._db.execute("SELECT position, entry FROM style_playlists WHERE style_id = ? AND playlist_id = ?",
+                                   (style_id, entry["id"])).fetchone()
+            if row is not None:
+                position, previous = row[0], json.loads(row[1])
+                if previous == entry:
+                    return previous
+            else:
+                previous = None
+                position = self._db.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM style_playlists WHERE style_id = ?",
+                                            (style_id,)).fetchone()[0]
+            self._db.execute("INSERT OR REPLACE INTO style_playlists (style_id, playlist_id, position, entry) VALUES (?, ?, ?, ?)",
+                             (style_id, entry["id"], position, json.dumps(entry)))
+            self._db.execute("UPDATE styles SET dirty = 1, updated_at = ? WHERE id = ?", (time.time(), style_id))
+            return previous
+    
+    def update_style_playlist(self, style_id: str, playlist_id: str, **fields) -> bool:
+        """Set fields of a playlist entry in a style. Returns False if the entry doesn't exist."""
+        with self._lock, self._db:
+            row = self._db.execute("SELECT entry FROM style_playlists WHERE style_id = ? AND playlist_id = ?",
+                                   (style_id, playlist_id)).fetchone()
+            if row is None:
+                return False
+            entry = json.loads(row[0])
+            if any(entry.get(key) != value for key, value in fields.items()):
+                entry.update(fields)
+                self._db.execute("UPDATE style_playlists SET entry = ? WHERE style_id = ? AND playlist_id = ?",
+                                 (json.dumps(entry), style_id, playlist_id))
+                self._db.execute("UPDATE styles SET dirty = 1, updated_at = ? WHERE id = ?", (time.time(), style_id))
+            return True
+    
+    # Rendering state
+    
+    def dirty(self, table: str) -> List[str]:
+        """Ids of playlists or styles whose JSON file is out of date."""
+        assert table in ("playlists", "styles")
+        with self._lock:
+            return [row[0] for row in self._db.execute(f"SELECT id FROM {table} WHERE dirty = 1 ORDER BY id")]
+    
+    def mark_clean(self, table: str, row_id: str) -> None:
+        assert table in ("playlists", "styles")
+        with self._lock, self._db:
+            self._db.execute(f"UPDATE {table} SET dirty = 0 WHERE id = ?", (row_id,))
+    
+    def version(self, table: str, row_id: str) -> int:
+        """Version of the file on the server this row was last published as or merged from (0 if never)."""
+        assert table in ("playlists", "styles")
+        with self._lock:
+            row = self._db.execute(f"SELECT version FROM {table} WHERE id = ?", (row_id,)).fetchone()
+            return row[0] if row else 0
+    
+    def tempo_index_pending(self, style_id: str) -> bool:
+        """Whether the local tempo index of a style was rewritten but not uploaded yet."""
+        with self._lock:
+            row = self._db.execute("SELECT index_pending FROM styles WHERE id = ?", (style_id,)).fetchone()
+            return bool(row and row[0])
+    
+    def mark_tempo_index(self, style_id: str, pending: bool) -> None:
+        with self._lock, self._db:
+            self._db.execute("UPDATE styles SET index_pending = ? WHERE id = ?", (int(pending), style_id))
+    
+    def mark_published(self, table: str, row_id: str, version: int) -> None:
+        """Mark a row clean as of the given server version; the current fields become the merge base.
+        
+        A published playlist's version and tempo range are copied into its entries in styles, so other
+        runs can tell from a style file which of its playlists changed.
+        """
+        assert table in ("playlists", "styles")
+        with self._lock:
+            with self._db:
+                self._db.execute(f"UPDATE {table} SET dirty = 0, version = ?, base = data WHERE id = ?", (version, row_id))
+            if table == "playlists":
+                self._update_style_entries(row_id, version=version)
+    
+    def _update_style_entries(self, playlist_id: str, **fields) -> None:
+        """Copy a playlist's tempo range (and the given fields) into its entries in styles."""
+        with self._lock:
+            row = self._db.execute("SELECT min_tempo, max_tempo FROM playlists WHERE id = ?", (playlist_id,)).fetchone()
+            if row is not None and row[0] is not None:
+                fields.update(minTempo=row[0], maxTempo=row[1])
+            if not fields:
+                return
+            for style_id, in self._db.execute("SELECT style_id FROM style_playlists WHERE playlist_id = ?", (playlist_id,)).fetchall():
+                self.update_style_playlist(style_id, playlist_id, **fields)
+    
+    # Merging files published by other runs
+    
+    @staticmethod
+    def _merge_fields(base: Dict, local: Dict, remote: Dict) -> Tuple[Dict, List[str]]:
+        """Three-way merge of top-level fields; returns the merged fields and the keys both sides changed.
+        
+        A field changed (or removed) on one side only takes that side's value; on a conflict the local
+        value wins.
+        """
+        missing = object()
+        merged = {}
+        conflicts = []
+        for key in list(local) + [key for key in remote if key not in local]:
+            ours, theirs, original = local.get(key, missing), remote.get(key, missing), base.get(key, missing)
+            if ours == theirs or theirs == original:
+                value = ours
+            elif ours == original:
+                value = theirs
+            else:
+                value = ours
+                conflicts.append(key)
+            if value is not missing:
+                merged[key] = value
+        return merged, conflicts
+    
+    def merge_playlist(self, playlist_id: str, remote: Dict) -> Tuple[int, List[str]]:
+        """Merge a playlist file published by another run into the catalog (creating the playlist).
+        
+        Songs missing locally are appended in the file's order; playlist fields are merged three-way
+        against the base. Returns the number of songs added and the conflicting field names.
+        """
+        fields = {key: value for key, value in remote.items() if key not in ("songs", "minTempo", "maxTempo", "version")}
+        with self._lock, self._db:
+            row = self._db.execute("SELECT data, base FROM playlists WHERE id = ?", (playlist_id,)).fetchone()
+            if row is None:
+                conflicts: List[str] = []
+                self._db.execute("INSERT INTO playlists (id, data, songs_hash, updated_at) VALUES (?, ?, '', ?)",
+                                 (playlist_id, json.dumps(fields), time.time()))
+            else:
+                data, conflicts = self._merge_fields(json.loads(row[1] or "{}"), json.loads(row[0]), fields)
+                self._db.execute("UPDATE playlists SET data = ?, dirty = 1, updated_at = ? WHERE id = ?",
+                                 (json.dumps(data), time.time(), playlist_id))
+            
+            known = {row[0] for row in self._db.execute("SELECT track_id FROM playlist_songs WHERE playlist_id = ?", (playlist_id,))}
+            position = self._db.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM playlist_songs WHERE playlist_id = ?",
+                                        (playlist_id,)).fetchone()[0]
+            appended = []
+            for entry in remote.get("songs", []):
+                if entry["id"] in known:
+                    continue
+                tempo = entry.get("tempo")
+                tempo = int(tempo) if isinstance(tempo, (int, float)) and tempo > 0 else None
+                self._upsert_track(entry)
+                self._db.execute("INSERT INTO playlist_songs (playlist_id, track_id, position, tempo, entry) VALUES (?, ?, ?, ?, ?)",
+                                 (playlist_id, entry["id"], position, tempo, json.dumps(entry)))
+                known.add(entry["id"])
+                appended.append((entry["id"], tempo))
+                position += 1
+            added = len(appended)
+            self._chain_songs_hash(playlist_id, appended)
+            self._update_tempo_range(playlist_id)
+        return added, conflicts
+    
+    def merge_style(self, style_id: str, remote: Dict) -> Tuple[int, List[str]]:
+        """Merge a style file published by another run into the catalog (creating the style).
+        
+        Playlist entries missing locally are appended, and an entry whose playlist version is newer in
+        the file replaces the local one; style fields are merged three-way against the base. Returns
+        the number of entries added or replaced and the conflicting field names.
+        """
+        fields = {key: value for key, value in remote.items() if key not in ("playlists", "version")}
+        changed = 0
+        with self._lock, self._db:
+            row = self._db.execute("SELECT data, base FROM styles WHERE id = ?", (style_id,)).fetchone()
+            if row is None:
+                conflicts: List[str] = []
+                self._db.execute("INSERT INTO styles (id, data, updated_at) VALUES (?, ?, ?)",
+                                 (style_id, json.dumps(fields), time.time()))
+            else:
+                data, conflicts = self._merge_fields(json.loads(row[1] or "{}"), json.loads(row[0]), fields)
+                self._db.execute("UPDATE styles SET data = ?, dirty = 1, updated_at = ? WHERE id = ?",
+                                 (json.dumps(data), time.time(), style_id))
+            
+            for entry in remote.get("playlists", []):
+                row = self._db.execute("SELECT entry FROM style_playlists WHERE style_id = ? AND playlist_id = ?",
+                                       (style_id, entry["id"])).fetchone()
+                if row is None:
+                    position = self._db.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM style_playlists WHERE style_id = ?",
+                                                (style_id,)).fetchone()[0]
+                    self._db.execute("INSERT INTO style_playlists (style_id, playlist_id, position, entry) VALUES (?, ?, ?, ?)",
+                                     (style_id, entry["id"], position, json.dumps(entry)))
+                elif entry.get("version", 0) > json.loads(row[0]).get("version", 0):
+                    self._db.execute("UPDATE style_playlists SET entry = ? WHERE style_id = ? AND playlist_id = ?",
+                                     (json.dumps(entry), style_id, entry["id"]))
+                else:
+                    continue
+                changed += 1
+        return changed, conflicts
+    
+    # Covers and published objects
+    
+    def add_album_cover(self, album: str, data: bytes) -> None:
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO album_covers (album, data) VALUES (?, ?)", (album, data))
+    
+    def album_cover(self, album: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM album_covers WHERE album = ?", (album,)).fetchone()
+            return row[0] if row else None
+    
+    def playlist_album_covers(self, playlist_id: str, limit: int = 4) -> List[bytes]:
+        """Cover art of up to `limit` random distinct albums of a playlist."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT c.data FROM album_covers c WHERE c.album IN "
+                "(SELECT t.album FROM playlist_songs s JOIN tracks t ON t.id = s.track_id WHERE s.playlist_id = ?) "
+                "ORDER BY RANDOM() LIMIT ?", (playlist_id, limit))]
+    
+    def add_fingerprint(self, track_id: str, duration: Optional[float], items: bytes) -> None:
+        """Store a decoded fingerprint (little-endian uint32 sub-fingerprints) for the similarity index."""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO fingerprints (track_id, duration, items) VALUES (?, ?, ?)",
+                             (track_id, duration, items))
+    
+    def fingerprints(self) -> List[Tuple[str, Optional[float], bytes]]:
+        with self._lock:
+            return self._db.execute("SELECT track_id, duration, items FROM fingerprints").fetchall()
+    
+    def record_remote_object(self, target: str, path: str, size: int) -> None:
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO remote_objects (target, path, size, uploaded_at) VALUES (?, ?, ?, ?)",
+                             (target, path, size, time.time()))
+    
+    def forget_remote_objects(self, target: str, paths: List[str]) -> None:
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM remote_objects WHERE target = ? AND path = ?", [(target, path) for path in paths])
+    
+    def remove_fingerprints(self, track_ids: List[str]) -> None:
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM fingerprints WHERE track_id = ?", [(track_id,) for track_id in track_ids])
+    
+    # JSON import
+    
+    def import_json(self, playlists_dir: str, styles_dir: str) -> Tuple[int, int]:
+        """Import playlist and style JSON files, replacing the catalog rows of the same ids.
+        
+        Imported rows are marked clean since the files already reflect them.
+        """
+        playlist_count = style_count = 0
+        with self._lock, self._db:
+            for file_path in sorted(Path(playlists_dir).glob("*.json")) if os.path.isdir(playlists_dir) else []:
+                with open(file_path, 'r') as f:
+                    playlist = json.load(f)
+                playlist_id = playlist.get("id", file_path.stem)
+                songs = playlist.pop("songs", [])
+                min_tempo = playlist.pop("minTempo", None)
+                max_tempo = playlist.pop("maxTempo", None)
+                version = playlist.pop("version", 0)
+                self._db.execute("INSERT OR REPLACE INTO playlists (id, data, min_tempo, max_tempo, dirty, version, base, updated_at) "
+                                 "VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+                                 (playlist_id, json.dumps(playlist), min_tempo, max_tempo, version, json.dumps(playlist), time.time()))
+                self._db.execute("DELETE FROM playlist_songs WHERE playlist_id = ?", (playlist_id,))
+                for position, entry in enumerate(songs):
+                    tempo = entry.get("tempo")
+                    self._upsert_track(entry)
+                    self._db.execute("INSERT OR REPLACE INTO playlist_songs (playlist_id, track_id, position, tempo, entry) VALUES (?, ?, ?, ?, ?)",
+                                     (playlist_id, entry["id"], position,
+                                      int(tempo) if isinstance(tempo, (int, float)) and tempo > 0 else None, json.dumps(entry)))
+                playlist_count += 1
+            
+            for file_path in sorted(Path(styles_dir).glob("*.json")) if os.path.isdir(styles_dir) else []:
+                with open(file_path, 'r') as f:
+                    style_data = json.load(f)
+                entries = style_data.pop("playlists", [])
+                version = style_data.pop("version", 0)
+                self._db.execute("INSERT OR REPLACE INTO styles (id, data, dirty, version, base, updated_at) VALUES (?, ?, 0, ?, ?, ?)",
+                                 (file_path.stem, json.dumps(style_data), version, json.dumps(style_data), time.time()))
+                self._db.execute("DELETE FROM style_playlists WHERE style_id = ?", (file_path.stem,))
+                for position, entry in enumerate(entries):
+                    self._db.execute("INSERT INTO style_playlists (style_id, playlist_id, position, entry) VALUES (?, ?, ?, ?)",
+                                     (file_path.stem, entry["id"], position, json.dumps(entry)))
+                style_count += 1
+        return playlist_count, style_count
 
-LIBROSA_AVAILABLE = False
-librosa = None
-try:
-    import librosa  # type: ignore
-    LIBROSA_AVAILABLE = True
-except ImportError:
-    print("Warning: librosa not available. Tempo measurement will be disabled.")
 
-# Import ID3 classes with error handling for different mutagen versions
-ID3NoHeaderError = Exception
-APIC = None
-try:
-    from mutagen.id3._util import ID3NoHeaderError
-except ImportError:
+def decode_fingerprint(fingerprint: str) -> "np.ndarray":
+    """Decode a compressed chromaprint fingerprint (as printed by fpcalc) into its 32-bit sub-fingerprints.
+    
+    The format is URL-safe base64 of a 4-byte header (algorithm, 24-bit item count) followed by the
+    XOR deltas of consecutive items as bit-position gaps: 3-bit values terminated by 0 per item, with
+    gaps of 7 or more continued in a trailing 5-bit exception stream. Raises ValueError if malformed.
+    """
     try:
-        from mutagen.id3 import ID3NoHeaderError  # type: ignore
-    except ImportError:
-        pass
+        data = base64.urlsafe_b64decode(fingerprint + "=" * (-len(fingerprint) % 4))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"not base64: {e}")
+    if len(data) < 4:
+        raise ValueError("fingerprint too short")
+    count = (data[1] << 16) | (data[2] << 8) | data[3]
+    if count == 0:
+        return np.zeros(0, dtype=np.uint32)
+    
+    def unpack(offset: int, width: int) -> "np.ndarray":
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, offset=offset), bitorder='little')
+        usable = len(bits) // width * width
+        return bits[:usable].reshape(-1, width).astype(np.int64) @ (1 << np.arange(width))
+    
+    gaps = unpack(4, 3)
+    terminators = np.flatnonzero(gaps == 0)
+    if len(terminators) < count:
+        raise ValueError(f"expected {count} items, found {len(terminators)}")
+    gaps = gaps[:terminators[count - 1] + 1]
+    
+    exceptions = np.flatnonzero(gaps == 7)
+    if len(exceptions):
+        extra = unpack(4 + (len(gaps) * 3 + 7) // 8, 5)
+        if len(extra) < len(exceptions):
+            raise ValueError("truncated exception bits")
+        gaps[exceptions] += extra[:len(exceptions)]
+    
+    # Bit positions restart after every terminator
+    is_end = gaps == 0
+    item = np.cumsum(is_end) - is_end
+    positions = np.cumsum(gaps)
+    positions -= np.concatenate(([0], positions[terminators[:count - 1]]))[item]
+    if positions.max() > 32:
+        raise ValueError("bit position out of range")
+    weights = np.where(is_end, 0.0, np.exp2(positions - 1.0))
+    deltas = np.bincount(item, weights=weights, minlength=count).astype(np.uint32)
+    return np.bitwise_xor.accumulate(deltas)
 
-try:
-    from mutagen.id3._frames import APIC
-except ImportError:
-    try:
-        from mutagen.id3 import APIC  # type: ignore
-    except ImportError:
-        pass
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+def popcount32(values: "np.ndarray") -> "np.ndarray":
+    """Set bits per uint32 element."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    return table[np.ascontiguousarray(values).view(np.uint8)].reshape(-1, 4).sum(axis=1)
+
+
+class FingerprintIndex:
+    """Near-duplicate lookup over decoded chromaprint fingerprints.
+    
+    Candidates come from LSH buckets: every band samples a fixed set of bits from each sub-fingerprint
+    at the start of a track, so two encodes of the same recording share many bucket keys regardless of
+    time offset while unrelated tracks share almost none. Bucket keys are kept in a sorted array and
+    searched with NumPy, so a lookup does not touch every track. The best candidates are verified with a
+    vectorized Hamming comparison of the whole fingerprints over a range of alignments.
+    """
+    
+    BANDS = 4
+    BAND_BITS = 20
+    INDEX_ITEMS = 240       # ~30 s of audio at ~8 sub-fingerprints per second
+    MAX_OFFSET = 80         # ~10 s of alignment search (different leading silence)
+    MIN_HITS = 8
+    CANDIDATES = 5
+    MERGE_EVERY = 256       # Bucket keys added since the last sort are searched linearly until then
+    
+    def __init__(self, threshold: float = 0.85, max_duration_diff: float = 10.0):
+        self.threshold = threshold
+        self.max_duration_diff = max_duration_diff
+        rng = np.random.default_rng(0x5EED)
+        self._masks = np.array([sum(1 << int(bit) for bit in rng.choice(32, self.BAND_BITS, replace=False))
+                                for _ in range(self.BANDS)], dtype=np.uint64)
+        self._bands = np.arange(self.BANDS, dtype=np.uint64)[:, None] << np.uint64(32)
+        self.ids: List[str] = []
+        self.fingerprints: List["np.ndarray"] = []
+        self.durations: List[Optional[float]] = []
+        self._slots: Dict[str, int] = {}
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._key_slots = np.zeros(0, dtype=np.int64)
+        self._pending_keys: List["np.ndarray"] = []
+        self._pending_slots: List["np.ndarray"] = []
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __contains__(self, track_id: str) -> bool:
+        return track_id in self._slots
+    
+    def _bucket_keys(self, items: "np.ndarray") -> "np.ndarray":
+        head = items[:self.INDEX_ITEMS].astype(np.uint64)
+        return np.unique(self._bands | (head[None, :] & self._masks[:, None]))
+    
+    def add(self, track_id: str, items: "np.ndarray", duration: Optional[float] = None) -> None:
+        with self._lock:
+            if track_id in self._slots or not len(items):
+                return
+            slot = len(self.ids)
+            self._slots[track_id] = slot
+            self.ids.append(track_id)
+            self.fingerprints.append(items)
+            self.durations.append(duration)
+            keys = self._bucket_keys(items)
+            self._pending_keys.append(keys)
+            self._pending_slots.append(np.full(len(keys), slot, dtype=np.int64))
+            if len(self._pending_keys) >= self.MERGE_EVERY:
+                self._merge_pending()
+    
+    def _merge_pending(self) -> None:
+        keys = np.concatenate([self._keys] + self._pending_keys)
+        slots = np.concatenate([self._key_slots] + self._pending_slots)
+        order = np.argsort(keys, kind='stable')
+        self._keys, self._key_slots = keys[order], slots[order]
+        self._pending_keys, self._pending_slots = [], []
+    
+    def _candidates(self, keys: "np.ndarray") -> "np.ndarray":
+        """Slots sharing at least MIN_HITS bucket keys, most shared first."""
+        left = np.searchsorted(self._keys, keys, side='left')
+        counts = np.searchsorted(self._keys, keys, side='right') - left
+        # Expand each [left, left + count) range into flat positions
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(left, counts)
+        slots = [self._key_slots[positions]]
+        if self._pending_keys:
+            pending_keys = np.concatenate(self._pending_keys)
+            slots.append(np.concatenate(self._pending_slots)[np.isin(pending_keys, keys)])
+        hits = np.bincount(np.concatenate(slots), minlength=len(self.ids))
+        candidates = np.flatnonzero(hits >= self.MIN_HITS)
+        return candidates[np.argsort(-hits[candidates], kind='stable')][:self.CANDIDATES]
+    
+    @classmethod
+    def similarity(cls, a: "np.ndarray", b: "np.ndarray") -> float:
+        """1 - bit error rate of the best alignment of two fingerprints (about 0.5 for unrelated audio)."""
+        best = 0.0
+        for offset in range(-cls.MAX_OFFSET, cls.MAX_OFFSET + 1):
+            x = a[max(offset, 0):]
+            y = b[max(-offset, 0):]
+            length = min(len(x), len(y))
+            # Require the alignment to cover at least half of the shorter fingerprint
+            if length == 0 or length < min(len(a), len(b)) // 2:
+                continue
+            errors = int(popcount32(x[:length] ^ y[:length]).sum())
+            best = max(best, 1.0 - errors / (32.0 * length))
+        return best
+    
+    def find(self, items: "np.ndarray", duration: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """(track id, similarity) of the most similar indexed track at or above the threshold."""
+        if not len(items):
+            return None
+        with self._lock:
+            best: Optional[Tuple[str, float]] = None
+            for slot in self._candidates(self._bucket_keys(items)):
+                other_duration = self.durations[slot]
+                if duration and other_duration and abs(duration - other_duration) > self.max_duration_diff:
+                    continue
+                similarity = self.similarity(items, self.fingerprints[slot])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (self.ids[slot], similarity)
+            return best
+
+
+class JobQueue:
+    """Per-file ingest jobs shared between a coordinator and worker machines through SQLite.
+    
+    The database lives on a shared mount (rollback journal, since WAL needs shared memory that network
+    file systems don't provide). Workers claim the most expensive pending job with a lease and renew it
+    while working; a job whose lease expires (crashed or disconnected worker) is claimed again, up to
+    max_attempts. Results are collected by the coordinator, which owns all playlist and style updates.
+    
+    The database also carries what workers would otherwise only know locally: the fingerprints of the
+    similarity index (shared by the coordinator and extended by workers) and the objects workers
+    uploaded, which the coordinator records in its catalog.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            path TEXT NOT NULL,
+            cost REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            collected INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, cost);
+        CREATE INDEX IF NOT EXISTS jobs_run ON jobs (run_id, status, collected);
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            track_id TEXT NOT NULL UNIQUE,
+            duration REAL,
+            items BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS remote_objects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            target TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            collected INTEGER NOT NULL DEFAULT 0
+        );
+    """
+    
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Transactions are explicit: claims need BEGIN IMMEDIATE to lock out other hosts
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.executescript(self.SCHEMA)
+    
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+    
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+    
+    # Coordinator
+    
+    def enqueue(self, run_id: str, jobs: List[Tuple[str, float]]) -> None:
+        """Queue (path, expected cost) jobs for a run."""
+        now = time.time()
+        with self._transaction():
+            self._db.executemany("INSERT INTO jobs (run_id, path, cost, updated_at) VALUES (?, ?, ?, ?)",
+                                 [(run_id, path, cost, now) for path, cost in jobs])
+    
+    def collect(self, run_id: str) -> List[Tuple[str, str, Optional[Dict], Optional[str]]]:
+        """Finished jobs of a run not collected before, as (path, status, result, error)."""
+        with self._transaction():
+            rows = self._db.execute("SELECT id, path, status, result, error FROM jobs "
+                                    "WHERE run_id = ? AND status IN ('done', 'failed') AND collected = 0", (run_id,)).fetchall()
+            self._db.executemany("UPDATE jobs SET collected = 1 WHERE id = ?", [(row[0],) for row in rows])
+        return [(path, status, json.loads(result) if result else None, error) for _, path, status, result, error in rows]
+    
+    def outstanding(self, run_id: str) -> int:
+        """Jobs of a run that are not finished and collected yet."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE run_id = ? AND collected = 0 AND status != 'cancelled'",
+                                    (run_id,)).fetchone()[0]
+    
+    def cancel_run(self, run_id: str) -> int:
+        """Cancel the pending jobs of a run; leased ones finish. Returns the number cancelled."""
+        with self._transaction():
+            return self._db.execute("UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE run_id = ? AND status = 'pending'",
+                                    (time.time(), run_id)).rowcount
+    
+    def fingerprint_ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT track_id FROM fingerprints")}
+    
+    def collect_remote_objects(self) -> List[Tuple[str, str, int]]:
+        """Objects uploaded by workers and not collected before, as (target, path, size)."""
+        with self._transaction():
+            rows = self._db.execute("SELECT id, target, path, size FROM remote_objects WHERE collected = 0").fetchall()
+            self._db.executemany("UPDATE remote_objects SET collected = 1 WHERE id = ?", [(row[0],) for row in rows])
+        return [(target, path, size) for _, target, path, size in rows]
+    
+    # Shared by both sides
+    
+    def share_fingerprints(self, rows: List[Tuple[str, Optional[float], bytes]]) -> None:
+        """Add (track id, duration, decoded items) fingerprints to the shared similarity index."""
+        if not rows:
+            return
+        with self._transaction():
+            self._db.executemany("INSERT OR IGNORE INTO fingerprints (track_id, duration, items) VALUES (?, ?, ?)", rows)
+    
+    def fingerprints_since(self, seq: int) -> List[Tuple[int, str, Optional[float], bytes]]:
+        """Shared fingerprints added after `seq`, as (seq, track id, duration, items)."""
+        with self._lock:
+            return self._db.execute("SELECT seq, track_id, duration, items FROM fingerprints WHERE seq > ? ORDER BY seq",
+                                    (seq,)).fetchall()
+    
+    # Workers
+    
+    def record_remote_object(self, target: str, path: str, size: int) -> None:
+        with self._transaction():
+            self._db.execute("INSERT INTO remote_objects (target, path, size) VALUES (?, ?, ?)", (target, path, size))
+    
+    def claim(self, worker: str, lease_seconds: float) -> Optional[Tuple[int, str]]:
+        """Lease the most expensive pending (or abandoned) job; returns (job id, path) or None."""
+        now = time.time()
+        with self._transaction():
+            # Jobs whose worker vanished are retried, or failed once they ran out of attempts
+            self._db.execute("UPDATE jobs SET status = 'failed', error = 'lease expired ' || attempts || ' times', updated_at = ? "
+                             "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, now, self.max_attempts))
+            row = self._db.execute("SELECT id, path FROM jobs WHERE status = 'pending' "
+                                   "OR (status = 'leased' AND lease_expires < ?) ORDER BY cost DESC, id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                             "WHERE id = ?", (worker, now + lease_seconds, now, row[0]))
+        return row[0], row[1]
+    
+    def renew(self, job_ids: List[int], worker: str, lease_seconds: float) -> None:
+        if not job_ids:
+            return
+        with self._transaction():
+            self._db.executemany("UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                                 [(time.time() + lease_seconds, job_id, worker) for job_id in job_ids])
+    
+    def finish(self, job_id: int, worker: str, result: Optional[Dict] = None, error: Optional[str] = None) -> bool:
+        """Report a job's result (or error). False if the lease was lost to another worker meanwhile."""
+        with self._transaction():
+            return self._db.execute("UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? "
+                                    "WHERE id = ? AND worker = ? AND status = 'leased'",
+                                    ("failed" if error else "done", json.dumps(result) if result is not None else None,
+                                     error, time.time(), job_id, worker)).rowcount > 0
+    
+    def idle(self) -> bool:
+        """No pending or leased jobs left."""
+        with self._lock:
+            return self._db.execute("SELECT NOT EXISTS (SELECT 1 FROM jobs WHERE status IN ('pending', 'leased'))").fetchone()[0] == 1
+
 
 class PlaylistGenerator:
-    def __init__(self, config_path: Optional[str] = None, style: Optional[str] = None, playlist_name: Optional[str] = None, allow_dummy: bool = False, skip_no_tempo: bool = False, temp_dir: str = "./temp_audio", cover_image: Optional[str] = None):
-        """Initialize the playlist generator with configuration."""
+    def __init__(self, config_path: Optional[str] = None, style: Optional[str] = None, playlist_name: Optional[str] = None, allow_dummy: bool = False, skip_no_tempo: bool = False, temp_dir: str = "./temp_audio", cover_image: Optional[str] = None, silence_mode: Optional[str] = None, encoding_profile: Optional[str] = None, metrics_dir: Optional[str] = None, profiler: Optional[ProfilingHooks] = None, show_progress: bool = True, progress_interval: float = 30.0, scan_workers: Optional[int] = None, sort_by_size: bool = False, workers: Optional[int] = None, dedup: bool = True, dedup_threshold: Optional[float] = None, playlists: Optional[List[PlaylistSpec]] = None):
+        """Initialize the playlist generator with configuration.
+        
+        Pass `playlists` (from a batch manifest) instead of style/playlist_name to fill several playlists in one run.
+        """
         self.config = self._load_config(config_path)
-        self.style = style
-        self.playlist_name = playlist_name
+        self.style = style or (playlists[0].style if playlists else None)
+        self.playlist_name = playlist_name or (playlists[0].playlist if playlists else None)
         self.skip_no_tempo = skip_no_tempo
         self.temp_dir = temp_dir
         self.cover_image = cover_image
+        self.playlist_specs = playlists or ([PlaylistSpec(self.style, self.playlist_name, cover_image)]
+                                            if self.style and self.playlist_name else [])
+        self.routes: Optional[Dict[str, List[PlaylistSpec]]] = None  # Input file -> manifest playlists, batch runs only
+        # Silence handling: None/"off", "offsets" (record in playlist) or "trim" (cut during transcoding)
+        self.silence_mode = silence_mode or self.config["audio"].get("silence_mode")
+        if self.silence_mode == "off":
+            self.silence_mode = None
+        # Encoding profile: "default" uploads MP3s as-is, "streaming" rewrites them for fast start
+        self.encoding_profile = encoding_profile or self.config["audio"].get("encoding_profile", "default")
         self.processed_files = []
         self.skipped_files = []
         self.errors = []
         self.metadata_errors = []
         self.tempo_measured_files = []
-        self.ssh_client = None
-        self.sftp_client = None
+        self.encoding_savings = []  # Bytes saved per track by the streaming encoding profile
+        self.metrics_dir = metrics_dir
+        self.profiler = profiler
+        self.show_progress = show_progress
+        self.progress_interval = progress_interval
+        self.progress: Optional[ProgressReporter] = None  # Set while process_directory runs
+        scan_config = self.config.get("scan", {})
+        self.scan_workers = scan_workers or scan_config.get("workers", 8)
+        self.sort_by_size = sort_by_size or scan_config.get("sort_by_size", False)
+        # Track workers: tracks are scheduled longest-expected-first, already uploaded ones take the fast lane
+        self.workers = workers or self.config.get("processing", {}).get("workers", 1)
+        self.metrics = StageMetrics(enabled=metrics_dir is not None, child_cpu=self.workers == 1)
+        self.fast_lane_files = 0
+        self._remote_lock = threading.RLock()
+        # Tracks being processed by fingerprint hash (done event, decoded fingerprint, duration): an input with the
+        # same fingerprint or a near-duplicate of one waits for it instead of uploading it a second time
+        self._in_flight: Dict[str, Tuple[threading.Event, Optional["np.ndarray"], Optional[float]]] = {}
+        self._in_flight_lock = threading.Lock()
+        self.targets: Optional[List[PublishTarget]] = None  # Publish targets, created on first use
+        self.bandwidth = BandwidthLimiter(self.config.get("bandwidth", {}))  # Shared by all targets
+        self._staging_counter = itertools.count()
+        self.catalog: Optional[Catalog] = None  # Local catalog, opened on first use
+        # Near-duplicate detection: other rips/encodes of an indexed recording are linked instead of uploaded
+        dedup_config = self.config.get("dedup", {})
+        self.dedup_enabled = dedup and dedup_config.get("enabled", True)
+        self.dedup_threshold = dedup_threshold or dedup_config.get("threshold", 0.85)
+        self.fingerprint_index: Optional[FingerprintIndex] = None
+        self.near_duplicates = []
         self.remote_audio_files = None  # Cache for remote audio files list
-        self.album_covers = {}  # Store cover data by album for playlist cover generation
+        self.keep_connections = False  # Daemon mode: storage stays connected between runs
+        # Distributed runs: the coordinator queues tracks for workers; workers hand entries back through entry_sink
+        distributed_config = self.config.get("distributed", {})
+        self.job_queue: Optional[JobQueue] = None
+        self.lease_seconds = distributed_config.get("lease_seconds", 300)
+        self.poll_interval = distributed_config.get("poll_interval", 2.0)
+        self.entry_sink: Optional[Callable[[str, Dict], None]] = None
+        # Set on queue workers: fingerprints and upload records go to the queue database instead of the local catalog
+        self.worker_queue: Optional[JobQueue] = None
+        self._shared_fingerprint_seq = 0  # Last queue database fingerprint merged into the similarity index
+        self.cancel_event: Optional[threading.Event] = None  # Set to stop a run early
+        # Playlist, style and tempo index files are replaced under a lock file on the primary target
+        locking_config = self.config.get("locking", {})
+        self.lock_owner = f"{socket.gethostname()}-{os.getpid()}-{id(self):x}"
+        self.lock_lease = locking_config.get("lease_seconds", 120)
+        self.lock_timeout = locking_config.get("timeout", 600)
         
         # Create and ensure temp directory exists
         Path(self.temp_dir).mkdir(exist_ok=True)
@@ -131,18 +2332,74 @@ class PlaylistGenerator:
                 "remote_path": "/var/www/",
                 "audio_path": "public/audio",
                 "playlists_path": "public/playlists",
-                "styles_path": "public/styles"
+                "styles_path": "public/styles",
+                "tempo_index_path": "public/tempo_index",
+                "keepalive": 30  # Seconds between SSH keepalives, 0 to disable
+            },
+            "storage": {
+                "type": "sftp"  # "sftp" (uses the ssh section) or "local" (root directory on this host)
             },
             "urls": {
                 "base_url": "https://your-server.com"
             },
             "output": {
                 "playlists_dir": "public/playlists",
-                "styles_dir": "public/styles"
+                "styles_dir": "public/styles",
+                "tempo_index_dir": "public/tempo_index"
             },
             "audio": {
                 "bitrate": "128k",
-                "sample_rate": 44100
+                "sample_rate": 44100,
+                "silence_mode": "off",
+                "silence_threshold_db": -50,
+                "silence_window_ms": 10,
+                "min_silence_ms": 250,
+                "encoding_profile": "default",
+                "max_id3_frame_kb": 64,
+                "reencode_oversized": False,
+                "renditions": [],
+                "waveform_points": 0,
+                "preview_seconds": 0,
+                "preview_bitrate": "96k"
+            },
+            "scan": {
+                "workers": 8,
+                "sort_by_size": False
+            },
+            "processing": {
+                "workers": 1
+            },
+            "catalog": {
+                "path": "catalog.db"
+            },
+            "dedup": {
+                "enabled": True,
+                "threshold": 0.85,
+                "max_duration_diff": 10
+            },
+            "daemon": {
+                "address": "127.0.0.1:8765",
+                "inventory_ttl": 600
+            },
+            "distributed": {
+                "lease_seconds": 300,
+                "max_attempts": 3,
+                "poll_interval": 2
+            },
+            "locking": {
+                "lease_seconds": 120,
+                "timeout": 600
+            },
+            "bandwidth": {
+                "max_kbps": 0,
+                "schedule": [],
+                "burst_seconds": 1.0
+            },
+            "gc": {
+                "grace_days": 7,
+                "batch_size": 200,
+                "connections": 4,
+                "quarantine_path": "gc_quarantine"
             }
         }
         
@@ -153,149 +2410,221 @@ class PlaylistGenerator:
         
         return default_config
     
-    def _get_ssh_connection(self) -> Tuple[SSHClient, object]:
-        """Get or create SSH connection and SFTP client."""
-        if self.ssh_client is None or self.sftp_client is None:
-            ssh_config = self.config["ssh"]
-            
-            self.ssh_client = SSHClient()
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Connect using key file
-            key_path = os.path.expanduser(ssh_config["key_filename"])
-            self.ssh_client.connect(
-                hostname=ssh_config["hostname"],
-                username=ssh_config["username"],
-                port=ssh_config["port"],
-                key_filename=key_path,
-            )
-            
-            self.sftp_client = self.ssh_client.open_sftp()
+    @serialized
+    def _get_targets(self) -> List[PublishTarget]:
+        """Get or create the publish targets ("targets" list or the single "storage" section)."""
+        if self.targets is None:
+            self.targets = create_publish_targets(self.config, self.bandwidth)
+        return self.targets
+    
+    def _get_storage(self) -> StorageBackend:
+        """Storage backend of the primary target."""
+        return self._get_targets()[0].storage
+    
+    @serialized
+    def _get_catalog(self) -> Catalog:
+        """Open the local catalog, importing the local JSON files into it the first time."""
+        if self.catalog is None:
+            self.catalog = Catalog(self.config.get("catalog", {}).get("path", "catalog.db"))
+            if self.catalog.is_empty():
+                playlists, styles = self.catalog.import_json(self.config["output"]["playlists_dir"],
+                                                             self.config["output"]["styles_dir"])
+                if playlists or styles:
+                    logger.info(f"Imported {playlists} playlists and {styles} styles into catalog {self.catalog.path}")
+        return self.catalog
+    
+    @serialized
+    def _get_fingerprint_index(self) -> Optional[FingerprintIndex]:
+        """Similarity index of the fingerprints stored in the catalog, or None if dedup is disabled.
+        
+        Queue workers load the index the coordinator shared through the queue database instead.
+        """
+        if not self.dedup_enabled:
+            return None
+        if self.fingerprint_index is None:
+            if not numpy_available():
+                self.dedup_enabled = False
+                return None
+            index = FingerprintIndex(self.dedup_threshold, self.config.get("dedup", {}).get("max_duration_diff", 10))
+            if self.worker_queue is not None:
+                self._merge_shared_fingerprints(index)
+            else:
+                for track_id, duration, items in self._get_catalog().fingerprints():
+                    index.add(track_id, np.frombuffer(items, dtype='<u4'), duration)
+            logger.debug(f"Loaded {len(index)} fingerprints into the similarity index")
+            self.fingerprint_index = index
+        return self.fingerprint_index
+    
+    def merge_shared_fingerprints(self) -> int:
+        """Add fingerprints shared through the queue database since the last merge; returns how many were new.
         
-        return self.ssh_client, self.sftp_client
+        Workers add them to their similarity index, the coordinator also stores them in its catalog.
+        """
+        index = self.fingerprint_index
+        if self.worker_queue is not None and index is None:
+            return 0  # Loaded with the index on first use
+        return self._merge_shared_fingerprints(index)
     
-    def _close_ssh_connection(self) -> None:
-        """Close SSH connection and SFTP client."""
-        if self.sftp_client:
-            self.sftp_client.close()
-            self.sftp_client = None
-        if self.ssh_client:
-            self.ssh_client.close()
-            self.ssh_client = None
+    def _merge_shared_fingerprints(self, index: Optional[FingerprintIndex]) -> int:
+        job_queue = self.worker_queue or self.job_queue
+        if job_queue is None:
+            return 0
+        rows = job_queue.fingerprints_since(self._shared_fingerprint_seq)
+        if not rows:
+            return 0
+        self._shared_fingerprint_seq = rows[-1][0]
+        added = [(track_id, duration, items) for _, track_id, duration, items in rows if index is None or track_id not in index]
+        for track_id, duration, items in added:
+            if index is not None:
+                index.add(track_id, np.frombuffer(items, dtype='<u4'), duration)
+            if self.worker_queue is None:
+                self._get_catalog().add_fingerprint(track_id, duration, items)
+        return len(added)
     
-    def sync_playlists_from_server(self) -> bool:
-        """Sync playlists directory from server. Fail if this step fails."""
+    def share_fingerprints(self) -> None:
+        """Coordinator: publish the catalog's fingerprints missing from the queue database for the workers."""
+        job_queue = cast(JobQueue, self.job_queue)
+        if self._get_fingerprint_index() is None:
+            return
+        shared = job_queue.fingerprint_ids()
+        missing = [row for row in self._get_catalog().fingerprints() if row[0] not in shared]
+        job_queue.share_fingerprints(missing)
+        if missing:
+            logger.info(f"Shared {len(missing)} fingerprints with the workers")
+    
+    def _record_remote_object(self, target: PublishTarget, remote_path: str, size: int) -> None:
+        """Record an uploaded object in the catalog (the coordinator's, when running as a queue worker)."""
+        if self.worker_queue is not None:
+            self.worker_queue.record_remote_object(target.name, remote_path, size)
+        else:
+            self._get_catalog().record_remote_object(target.name, remote_path, size)
+    
+    @contextlib.contextmanager
+    def _use_playlist(self, spec: PlaylistSpec) -> Iterator[None]:
+        """Point the single-playlist steps (cover, style entry) at another playlist for the duration of the block."""
+        previous = (self.style, self.playlist_name, self.cover_image)
+        self.style, self.playlist_name, self.cover_image = spec.style, spec.playlist, spec.cover
         try:
-            logger.info("Syncing playlists from server...")
-            ssh, sftp = self._get_ssh_connection()
-            sftp = cast(SFTPClient, sftp)
-            ssh_config = self.config["ssh"]
-            
-            # Create local playlists directory
-            local_playlists_dir = self.config["output"]["playlists_dir"]
-            os.makedirs(local_playlists_dir, exist_ok=True)
-            
-            # Remote playlists path
-            remote_playlists_path = os.path.join(ssh_config["remote_path"], ssh_config.get("playlists_path", "public/playlists"))
+            yield
+        finally:
+            self.style, self.playlist_name, self.cover_image = previous
+    
+    def reset_run(self, playlists: List[PlaylistSpec], cancel_event: Optional[threading.Event] = None) -> None:
+        """Prepare a warm generator for another run: new playlists, empty per-run results and counters.
+        
+        Connections, the remote listing, the catalog and the fingerprint index are kept.
+        """
+        self.style, self.playlist_name, self.cover_image = playlists[0].style, playlists[0].playlist, playlists[0].cover
+        self.playlist_specs = playlists
+        self.routes = None
+        self.cancel_event = cancel_event
+        self.processed_files = []
+        self.skipped_files = []
+        self.errors = []
+        self.metadata_errors = []
+        self.tempo_measured_files = []
+        self.encoding_savings = []
+        self.near_duplicates = []
+        self.fast_lane_files = 0
+        self.metrics = StageMetrics(enabled=self.metrics.enabled, child_cpu=self.metrics.child_cpu)
+        for target in self.targets or []:
+            target.uploaded = target.skipped = target.failed = 0
+            target.seconds = 0.0
+            target.storage.bytes_put = 0
+        self.bandwidth.reset_stats()
+    
+    def cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+    
+    def _close_storage(self) -> None:
+        """Wait for pending mirror uploads and close all storage backends."""
+        if self.targets is not None:
+            for target in self.targets:
+                target.close()
+    
+    def get_remote_dir(self, subfolder: str) -> str:
+        """Directory of a publish subfolder relative to the storage root."""
+        ssh_config = self.config["ssh"]
+        if subfolder == "audio":
+            return ssh_config.get("audio_path", "public/audio")
+        elif subfolder == "playlists":
+            return ssh_config.get("playlists_path", "public/playlists")
+        elif subfolder == "styles":
+            return ssh_config.get("styles_path", "public/styles")
+        elif subfolder == "tempo_index":
+            return ssh_config.get("tempo_index_path", "public/tempo_index")
+        return subfolder
+    
+    def _sync_json_from_server(self, subfolder: str, local_dir: str, kind: str) -> bool:
+        """Download the JSON files of a publish subfolder into a local directory."""
+        try:
+            logger.info(f"Syncing {kind}s from server...")
+            primary = self._get_targets()[0]
+            storage = primary.storage
+            os.makedirs(local_dir, exist_ok=True)
+            remote_dir = self.get_remote_dir(subfolder)
             
             try:
-                # List files in remote playlists directory
-                remote_files = sftp.listdir(remote_playlists_path)
-                
-                for remote_file in remote_files:
-                    if remote_file.endswith('.json'):
-                        remote_file_path = os.path.join(remote_playlists_path, remote_file).replace("\\", "/")
-                        local_file_path = os.path.join(local_playlists_dir, remote_file)
-                        
-                        logger.info(f"Downloading playlist: {remote_file}")
-                        sftp.get(remote_file_path, local_file_path)
-                
-                logger.info(f"Successfully synced {len([f for f in remote_files if f.endswith('.json')])} playlists from server")
-                return True
-                
+                json_files = [entry.name for entry in primary.run(storage.list, remote_dir) if entry.name.endswith('.json')]
             except FileNotFoundError:
-                logger.info("Remote playlists directory does not exist yet, starting fresh")
+                logger.info(f"Remote {subfolder} directory does not exist yet, starting fresh")
                 return True
+            
+            for remote_file in json_files:
+                logger.info(f"Downloading {kind}: {remote_file}")
+                primary.run(storage.get, posixpath.join(remote_dir, remote_file), os.path.join(local_dir, remote_file))
+            
+            logger.info(f"Successfully synced {len(json_files)} {kind}s from server")
+            return True
                 
         except Exception as e:
-            logger.error(f"Failed to sync playlists from server: {e}")
+            logger.error(f"Failed to sync {subfolder} from server: {e}")
             return False
     
+    def sync_playlists_from_server(self) -> bool:
+        """Sync playlists directory from server. Fail if this step fails."""
+        return self._sync_json_from_server("playlists", self.config["output"]["playlists_dir"], "playlist")
+    
     def sync_styles_from_server(self) -> bool:
         """Sync styles directory from server. Fail if this step fails."""
-        try:
-            logger.info("Syncing styles from server...")
-            ssh, sftp = self._get_ssh_connection()
-            sftp = cast(SFTPClient, sftp)
-            ssh_config = self.config["ssh"]
-            
-            # Create local styles directory
-            local_styles_dir = self.config["output"]["styles_dir"]
-            os.makedirs(local_styles_dir, exist_ok=True)
-            
-            # Remote styles path
-            remote_styles_path = os.path.join(ssh_config["remote_path"], ssh_config.get("styles_path", "public/styles"))
-            
-            try:
-                # List files in remote styles directory
-                remote_files = sftp.listdir(remote_styles_path)
-                
-                for remote_file in remote_files:
-                    if remote_file.endswith('.json'):
-                        remote_file_path = os.path.join(remote_styles_path, remote_file).replace("\\", "/")
-                        local_file_path = os.path.join(local_styles_dir, remote_file)
-                        
-                        logger.info(f"Downloading style: {remote_file}")
-                        sftp.get(remote_file_path, local_file_path)
-                
-                logger.info(f"Successfully synced {len([f for f in remote_files if f.endswith('.json')])} styles from server")
-                return True
-                
-            except FileNotFoundError:
-                logger.info("Remote styles directory does not exist yet, starting fresh")
-                return True
-                
-        except Exception as e:
-            logger.error(f"Failed to sync styles from server: {e}")
-            return False
+        return self._sync_json_from_server("styles", self.config["output"]["styles_dir"], "style")
     
+    @serialized
+    @instrumented("remote_listing")
     def fetch_remote_audio_files(self) -> List[str]:
-        """Fetch list of all files in remote audio folder."""
+        """Fetch list of files in the remote audio folder that are present on every publish target.
+        
+        A track missing from a mirror is processed again and uploaded where it is missing. Targets whose
+        listing fails are left out, so an unreachable mirror doesn't force a full re-run.
+        """
         if self.remote_audio_files is not None:
             return self.remote_audio_files
         
-        try:
-            logger.info("Fetching list of remote audio files...")
-            ssh, sftp = self._get_ssh_connection()
-            sftp = cast(SFTPClient, sftp)
-            ssh_config = self.config["ssh"]
-            
-            # Remote audio path
-            remote_audio_path = os.path.join(ssh_config["remote_path"], ssh_config.get("audio_path", "public/audio"))
-            
+        logger.info("Fetching list of remote audio files...")
+        targets = self._get_targets()
+        audio_dir = self.get_remote_dir("audio")
+        audio_suffixes = tuple(f".{ext}" for ext, _, _ in RENDITION_FORMATS.values())
+        listings = []
+        for target, future in [(target, target.submit(target.storage.list, audio_dir)) for target in targets]:
             try:
-                # List files in remote audio directory
-                remote_files = sftp.listdir(remote_audio_path)
-                # Filter for MP3 files only
-                self.remote_audio_files = [f for f in remote_files if f.endswith('.mp3')]
-                logger.info(f"Found {len(self.remote_audio_files)} audio files on remote server")
-                return self.remote_audio_files
-                
+                listings.append({entry.name for entry in future.result() if entry.name.endswith(audio_suffixes)})
             except FileNotFoundError:
-                logger.info("Remote audio directory does not exist yet, starting fresh")
-                self.remote_audio_files = []
-                return self.remote_audio_files
-                
-        except Exception as e:
-            logger.error(f"Failed to fetch remote audio files: {e}")
-            self.remote_audio_files = []
-            return self.remote_audio_files
+                logger.info(f"Remote audio directory does not exist yet on {target.name}, starting fresh")
+                listings.append(set())
+            except Exception as e:
+                logger.error(f"Failed to fetch remote audio files from {target.name}: {e}")
+        
+        self.remote_audio_files = sorted(set.intersection(*listings)) if listings else []
+        logger.info(f"Found {len(self.remote_audio_files)} audio files on remote server")
+        return self.remote_audio_files
     
-    def convert_to_mp3(self, input_path: str, output_path: str) -> bool:
-        """Convert audio file to MP3 format."""
+    @instrumented("convert_to_mp3", reads=0, writes=1)
+    def convert_to_mp3(self, input_path: str, output_path: str, audio: Optional["AudioSegment"] = None) -> bool:
+        """Convert audio file to MP3 format. An already decoded segment can be passed to skip decoding."""
         try:
-            logger.info(f"Converting {input_path} to MP3...")
-            audio = AudioSegment.from_file(input_path)
+            logger.debug(f"Converting {input_path} to MP3...")
+            if audio is None:
+                audio = AudioSegment.from_file(input_path)
             audio.export(
                 output_path,
                 format="mp3",
@@ -308,14 +2637,254 @@ class PlaylistGenerator:
             self.errors.append(f"Conversion error for {input_path}: {e}")
             return False
     
+    @instrumented("streaming_profile", reads=0, writes=1)
+    def optimize_mp3_for_streaming(self, input_path: str, output_path: str) -> bool:
+        """Rewrite MP3 for fast start: drop large ID3 frames, write Xing/LAME header, re-encode oversized files."""
+        try:
+            audio_config = self.config["audio"]
+            original_size = os.path.getsize(input_path)
+            
+            target_kbps = int(str(audio_config["bitrate"]).rstrip("kK"))
+            source_kbps = 0
+            audio_file = mutagen.File(input_path)  # type: ignore
+            if audio_file is not None and hasattr(audio_file, 'info'):
+                source_kbps = int(getattr(audio_file.info, 'bitrate', 0) / 1000)
+            
+            if audio_config.get("reencode_oversized", False) and source_kbps > target_kbps:
+                # Re-encoding through LAME writes the Xing/LAME header and drops embedded art
+                logger.debug(f"Re-encoding {input_path} from {source_kbps}k to {target_kbps}k")
+                if not self.convert_to_mp3(input_path, output_path):
+                    return False
+            else:
+                # Stream copy through the ffmpeg MP3 muxer: audio only (no attached pictures), with Xing header
+                result = subprocess.run(
+                    [which("ffmpeg") or "ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", input_path,
+                     "-map", "0:a", "-c:a", "copy", "-write_xing", "1", "-id3v2_version", "3", output_path],
+                    capture_output=True, text=True
+                )
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr.strip() or f"ffmpeg exited with {result.returncode}")
+            
+            self.strip_large_id3_frames(output_path, int(audio_config.get("max_id3_frame_kb", 64)) * 1024)
+            
+            optimized_size = os.path.getsize(output_path)
+            self.encoding_savings.append({
+                "file": input_path,
+                "original_bytes": original_size,
+                "optimized_bytes": optimized_size
+            })
+            logger.debug(f"Streaming profile for {input_path}: {original_size} -> {optimized_size} bytes")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not optimize {input_path} for streaming, uploading as-is: {e}")
+            return False
+    
+    def strip_large_id3_frames(self, file_path: str, max_frame_bytes: int) -> None:
+        """Remove ID3 frames bigger than max_frame_bytes (embedded art, PRIV/GEOB blobs, lyrics)."""
+        audio_file = mutagen.File(file_path)  # type: ignore
+        if audio_file is None or not audio_file.tags or not hasattr(audio_file.tags, 'delall'):
+            return
+        
+        removed = []
+        for key, frame in list(audio_file.tags.items()):
+            data = getattr(frame, 'data', None)
+            size = len(data) if isinstance(data, bytes) else len(str(frame).encode('utf-8'))
+            if size > max_frame_bytes:
+                del audio_file.tags[key]
+                removed.append(key)
+        
+        if removed:
+            audio_file.save()
+            logger.debug(f"Removed large ID3 frames from {file_path}: {', '.join(removed)}")
+
+    def get_rendition_filename(self, fingerprint_hash: str, rendition: Dict) -> str:
+        """Remote file name of a rendition: <hash>.<variant>.<ext>."""
+        ext = RENDITION_FORMATS[rendition.get("format", "mp3")][0]
+        return f"{fingerprint_hash}.{rendition['name']}.{ext}"
+    
+    @instrumented("renditions")
+    def create_renditions(self, audio: "AudioSegment", fingerprint_hash: str, temp_dir: str, renditions: Optional[List[Dict]] = None) -> List[Tuple[Dict, str]]:
+        """Encode the given (default: all configured) renditions from one decoded segment in parallel. Returns (rendition, path) pairs."""
+        if renditions is None:
+            renditions = self.config["audio"].get("renditions", [])
+        sample_rate = str(self.config["audio"]["sample_rate"])
+        
+        def encode(rendition: Dict) -> Optional[Tuple[Dict, str]]:
+            _, muxer, codec = RENDITION_FORMATS[rendition.get("format", "mp3")]
+            output_path = os.path.join(temp_dir, self.get_rendition_filename(fingerprint_hash, rendition))
+            try:
+                # Opus only supports 48 kHz output, let the encoder pick its own rate
+                parameters = [] if muxer == "opus" else ["-ar", sample_rate]
+                audio.export(output_path, format=muxer, codec=codec, bitrate=rendition["bitrate"], parameters=parameters)
+                return rendition, output_path
+            except Exception as e:
+                logger.error(f"Error encoding {rendition['name']} rendition for {fingerprint_hash}: {e}")
+                self.errors.append(f"Rendition error for {fingerprint_hash} ({rendition['name']}): {e}")
+                return None
+        
+        max_workers = self.config["audio"].get("rendition_workers") or len(renditions) or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(encode, renditions))
+        
+        return [result for result in results if result is not None]
+    
+    def missing_renditions(self, fingerprint_hash: str) -> List[Dict]:
+        """Configured renditions of a track that are not on the server, e.g. added to the config since it was published."""
+        remote_audio_files = self.fetch_remote_audio_files()
+        return [rendition for rendition in self.config["audio"].get("renditions", [])
+                if self.get_rendition_filename(fingerprint_hash, rendition) not in remote_audio_files]
+    
+    def backfill_renditions(self, input_file: str, fingerprint_hash: str, temp_dir: str) -> List[Dict]:
+        """Encode and upload the renditions a published track is missing from its input file; returns those uploaded."""
+        missing = self.missing_renditions(fingerprint_hash)
+        if not missing:
+            return []
+        audio = self.load_audio(input_file)
+        if audio is None:
+            return []
+        if self.silence_mode == "trim":
+            # The published audio was trimmed, its renditions have to match
+            trim_range = self.apply_silence_bounds(audio, {})
+            if trim_range:
+                audio = audio[trim_range[0]:trim_range[1]]
+        
+        uploaded = []
+        for rendition, rendition_path in self.create_renditions(audio, fingerprint_hash, temp_dir, missing):
+            if self.upload_file(rendition_path, os.path.basename(rendition_path), "audio"):
+                uploaded.append(rendition)
+            os.remove(rendition_path)
+        logger.info(f"Added {len(uploaded)} missing renditions of {fingerprint_hash} from {input_file}")
+        return uploaded
+    
+    def create_rendition_entries(self, fingerprint_hash: str, renditions: List[Dict]) -> List[Dict]:
+        """Playlist entry descriptions of the given renditions, so the player can pick one."""
+        entries = []
+        for rendition in renditions:
+            entries.append({
+                "variant": rendition["name"],
+                "format": rendition.get("format", "mp3"),
+                "bitrate": int(str(rendition["bitrate"]).rstrip("kK")),
+                "audio": self.get_audio_url(self.get_rendition_filename(fingerprint_hash, rendition))
+            })
+        return entries
+    
+    @instrumented("waveform_peaks")
+    def compute_waveform_peaks(self, audio: "AudioSegment", points: int) -> str:
+        """Compact waveform: `points` peak levels (0-127, stored as int8) encoded as base64."""
+        bucket_ms = len(audio) / points
+        max_amplitude = audio.max_possible_amplitude
+        peaks = bytearray(points)
+        for i in range(points):
+            bucket = audio[int(i * bucket_ms):max(int((i + 1) * bucket_ms), int(i * bucket_ms) + 1)]
+            peaks[i] = min(127, int(round(bucket.max / max_amplitude * 127)))
+        return base64.b64encode(bytes(peaks)).decode('ascii')
+    
+    def find_drop_position(self, audio: "AudioSegment", preview_ms: int, context_ms: int = 4000) -> int:
+        """Find the "drop": the point with the largest loudness increase where a preview still fits."""
+        step_ms = 500
+        envelope = [audio[t:t + step_ms].rms for t in range(0, len(audio), step_ms)]
+        context = context_ms // step_ms
+        last_start = (len(audio) - preview_ms) // step_ms
+        
+        best_index, best_score = 0, float("-inf")
+        for i in range(context, last_start + 1):
+            before = sum(envelope[i - context:i]) / context
+            after = sum(envelope[i:i + context]) / context
+            if after - before > best_score:
+                best_index, best_score = i, after - before
+        
+        return best_index * step_ms
+    
+    @instrumented("preview_clip")
+    def create_preview_clip(self, audio: "AudioSegment", fingerprint_hash: str, temp_dir: str) -> Optional[Tuple[str, int]]:
+        """Export a short preview clip starting at the drop. Returns (path, start_ms)."""
+        preview_ms = int(self.config["audio"].get("preview_seconds", 0) * 1000)
+        try:
+            start_ms = self.find_drop_position(audio, preview_ms) if len(audio) > preview_ms else 0
+            clip = audio[start_ms:start_ms + preview_ms].fade_in(500).fade_out(1500)
+            preview_path = os.path.join(temp_dir, f"{fingerprint_hash}.preview.mp3")
+            clip.export(preview_path, format="mp3", bitrate=self.config["audio"].get("preview_bitrate", "96k"))
+            return preview_path, start_ms
+        except Exception as e:
+            logger.error(f"Error creating preview clip for {fingerprint_hash}: {e}")
+            self.errors.append(f"Preview error for {fingerprint_hash}: {e}")
+            return None
+    
+    def needs_decoded_audio(self) -> bool:
+        """Whether any enabled ingest stage works on decoded samples."""
+        audio_config = self.config["audio"]
+        return bool(self.silence_mode or audio_config.get("renditions")
+                    or audio_config.get("waveform_points") or audio_config.get("preview_seconds"))
+    
+    def get_audio_url(self, filename: str) -> str:
+        """Public URL of a file in the remote audio folder."""
+        base_url = self.config.get("urls", {}).get("base_url", f"https://{self.config['ssh']['hostname']}")
+        audio_path = self.config["ssh"].get("audio_path", "public/audio")
+        return f"{base_url.rstrip('/')}/{audio_path.strip('/')}/{filename}"
+
+    @instrumented("decode", reads=0)
+    def load_audio(self, file_path: str) -> Optional["AudioSegment"]:
+        """Decode audio file once so several analysis stages can share the samples."""
+        try:
+            logger.debug(f"Decoding {file_path}...")
+            return AudioSegment.from_file(file_path)
+        except Exception as e:
+            logger.error(f"Error decoding {file_path}: {e}")
+            self.errors.append(f"Decoding error for {file_path}: {e}")
+            return None
+
+    @instrumented("silence_detection")
+    def detect_silence_bounds(self, audio: "AudioSegment") -> Tuple[int, int]:
+        """Detect leading/trailing silence with an RMS pass. Returns (start_ms, end_ms) of the audible part."""
+        audio_config = self.config["audio"]
+        threshold_db = audio_config.get("silence_threshold_db", -50)
+        window_ms = max(1, int(audio_config.get("silence_window_ms", 10)))
+        threshold = audio.max_possible_amplitude * (10 ** (threshold_db / 20))
+        length_ms = len(audio)
+
+        # Walk inwards from both ends, so only the silent edges are ever scanned
+        start_ms = 0
+        while start_ms < length_ms and audio[start_ms:start_ms + window_ms].rms <= threshold:
+            start_ms += window_ms
+
+        end_ms = length_ms
+        while end_ms > start_ms and audio[max(start_ms, end_ms - window_ms):end_ms].rms <= threshold:
+            end_ms -= window_ms
+
+        if start_ms >= end_ms:
+            # Whole track is below the threshold, leave it alone
+            return 0, length_ms
+
+        return min(start_ms, length_ms), max(end_ms, 0)
+
+    def apply_silence_bounds(self, audio: "AudioSegment", metadata: Dict) -> Optional[Tuple[int, int]]:
+        """Record silence bounds in metadata. Returns the (start_ms, end_ms) range to keep when trimming."""
+        start_ms, end_ms = self.detect_silence_bounds(audio)
+        silent_ms = start_ms + (len(audio) - end_ms)
+        if silent_ms < self.config["audio"].get("min_silence_ms", 250):
+            return None
+        
+        logger.debug(f"Detected silence: audible part {start_ms}-{end_ms} ms of {len(audio)} ms")
+        
+        if self.silence_mode == "trim":
+            metadata["duration"] = int((end_ms - start_ms) / 1000)
+            if metadata.get("first_beat") is not None:
+                metadata["first_beat"] = round(max(0.0, metadata["first_beat"] - start_ms / 1000), 3)
+            return start_ms, end_ms
+        
+        metadata["start_offset"] = round(start_ms / 1000, 3)
+        metadata["end_offset"] = round(end_ms / 1000, 3)
+        return None
+
+    @instrumented("fingerprint", reads=0)
     def get_acoustid_fingerprint(self, file_path: str, existing_fingerprint: Optional[str] = None, original_file_path: Optional[str] = None) -> Optional[str]:
         """Get AcoustID fingerprint for audio file - either from existing tag or calculate new one."""
         if existing_fingerprint:
-            logger.info(f"Using existing AcoustID fingerprint for {file_path}")
+            logger.debug(f"Using existing AcoustID fingerprint for {file_path}")
             return existing_fingerprint
         
         try:
-            logger.info(f"Generating new AcoustID fingerprint for {file_path}...")
+            logger.debug(f"Generating new AcoustID fingerprint for {file_path}...")
             duration, fingerprint = acoustid.fingerprint_file(file_path)
             if fingerprint is not None:
                 fingerprint_str = fingerprint.decode('utf-8')
@@ -331,7 +2900,7 @@ class PlaylistGenerator:
     def save_acoustid_fingerprint_to_file(self, file_path: str, fingerprint: str) -> bool:
         """Save AcoustID fingerprint to the original audio file's metadata."""
         try:
-            logger.info(f"Saving AcoustID fingerprint to {file_path}...")
+            logger.debug(f"Saving AcoustID fingerprint to {file_path}...")
             
             # Load the audio file for tag editing
             audio_file = mutagen.File(file_path)  # type: ignore
@@ -354,18 +2923,110 @@ class PlaylistGenerator:
             
             # Save the changes
             audio_file.save()
-            logger.info(f"Successfully saved AcoustID fingerprint to {file_path}")
+            logger.debug(f"Successfully saved AcoustID fingerprint to {file_path}")
             return True
             
         except Exception as e:
-            logger.warning(f"Could not save AcoustID fingerprint to {file_path}: {e}")
-            # Don't treat this as a fatal error, just log it
-            return False
+            logger.warning(f"Could not save AcoustID fingerprint to {file_path}: {e}")
+            # Don't treat this as a fatal error, just log it
+            return False
+    
+    def match_near_duplicate(self, input_file: str, fingerprint: str, fingerprint_hash: str, duration: Optional[float]) -> Optional[Tuple[str, float]]:
+        """(id, similarity) of an already published track this fingerprint is a near-duplicate of, without recording it."""
+        try:
+            index = self._get_fingerprint_index()
+            if index is None or fingerprint_hash in index:
+                return None
+            return index.find(decode_fingerprint(fingerprint), duration)
+        except ValueError as e:
+            logger.debug(f"Fingerprint of {input_file} cannot be decoded, skipping near-duplicate check: {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"Near-duplicate check failed for {input_file}: {e}")
+            return None
+    
+    def find_near_duplicate(self, input_file: str, fingerprint: str, fingerprint_hash: str, duration: Optional[float]) -> Optional[str]:
+        """Id of an already published track this fingerprint is a near-duplicate of (another rip or encode)."""
+        match = self.match_near_duplicate(input_file, fingerprint, fingerprint_hash, duration)
+        if match is None:
+            return None
+        
+        duplicate_of, similarity = match
+        logger.info(f"{input_file} is a near-duplicate of {duplicate_of} (similarity {similarity:.3f}), linking instead of uploading")
+        self.near_duplicates.append({
+            "file": input_file,
+            "id": fingerprint_hash,
+            "duplicate_of": duplicate_of,
+            "similarity": round(similarity, 4)
+        })
+        return duplicate_of
+    
+    def claim_fingerprint(self, fingerprint_hash: str, fingerprint: str, duration: Optional[float]) -> None:
+        """Reserve a fingerprint for the calling track until release_fingerprint().
+        
+        If a track with the same fingerprint, or a near-duplicate of it, is being processed, this waits
+        until it is done, so the remote and near-duplicate checks that follow see what it published.
+        """
+        items = None
+        if self._get_fingerprint_index() is not None:
+            try:
+                items = decode_fingerprint(fingerprint)
+            except ValueError:
+                pass
+        while True:
+            with self._in_flight_lock:
+                blocker = self._in_flight_blocker(fingerprint_hash, items, duration)
+                if blocker is None:
+                    self._in_flight[fingerprint_hash] = (threading.Event(), items, duration)
+                    return
+            logger.debug(f"Waiting for a track matching {fingerprint_hash} that is being processed")
+            blocker.wait()
+    
+    def _in_flight_blocker(self, fingerprint_hash: str, items: Optional["np.ndarray"], duration: Optional[float]) -> Optional[threading.Event]:
+        """Done event of a track in flight with this fingerprint or a near-duplicate of it (_in_flight_lock held)."""
+        if fingerprint_hash in self._in_flight:
+            return self._in_flight[fingerprint_hash][0]
+        index = self.fingerprint_index
+        if items is None or index is None or not len(items):
+            return None
+        for done, other_items, other_duration in self._in_flight.values():
+            if other_items is None or not len(other_items):
+                continue
+            if duration and other_duration and abs(duration - other_duration) > index.max_duration_diff:
+                continue
+            if FingerprintIndex.similarity(items, other_items) >= index.threshold:
+                return done
+        return None
+    
+    def release_fingerprint(self, fingerprint_hash: str) -> None:
+        with self._in_flight_lock:
+            claim = self._in_flight.pop(fingerprint_hash, None)
+        if claim is not None:
+            claim[0].set()
+    
+    def index_fingerprint(self, fingerprint_hash: str, fingerprint: str, duration: Optional[float]) -> None:
+        """Add a published track to the similarity index and store its decoded fingerprint in the catalog (or queue database)."""
+        try:
+            index = self._get_fingerprint_index()
+            if index is None or fingerprint_hash in index:
+                return
+            items = decode_fingerprint(fingerprint)
+            index.add(fingerprint_hash, items, duration)
+            if self.worker_queue is not None:
+                # Other workers pick it up on their next merge, the coordinator stores it in its catalog
+                self.worker_queue.share_fingerprints([(fingerprint_hash, duration, items.astype('<u4').tobytes())])
+            else:
+                self._get_catalog().add_fingerprint(fingerprint_hash, duration, items.astype('<u4').tobytes())
+        except ValueError as e:
+            logger.debug(f"Fingerprint {fingerprint_hash} cannot be decoded, not indexing it: {e}")
+        except Exception as e:
+            logger.warning(f"Could not index fingerprint {fingerprint_hash}: {e}")
     
     def get_sha1_hash(self, data: str) -> str:
         """Generate SHA1 hash of the given data."""
         return hashlib.sha1(data.encode('utf-8')).hexdigest()
     
+    @instrumented("extract_metadata")
     def extract_metadata(self, file_path: str) -> Dict:
         """Extract metadata from audio file."""
         metadata: Dict = {
@@ -376,7 +3037,8 @@ class PlaylistGenerator:
             "duration": None,
             "genre": None,
             "cover_data": None,
-            "acoustid_fingerprint": None
+            "acoustid_fingerprint": None,
+            "replaygain_track_gain": None
         }
         
         try:
@@ -394,27 +3056,34 @@ class PlaylistGenerator:
             if hasattr(audio_file, 'tags') and audio_file.tags:
                 tags = audio_file.tags
                 
+                def has_tag(key: str) -> bool:
+                    try:
+                        return key in tags
+                    except ValueError:
+                        # Vorbis comments (FLAC/OGG) reject non-ASCII keys such as the MP4 '\xa9nam'
+                        return False
+                
                 # Title
                 for key in ['TIT2', 'TITLE', '\xa9nam']:
-                    if key in tags:
+                    if has_tag(key):
                         metadata["title"] = str(tags[key][0]) if isinstance(tags[key], list) else str(tags[key])
                         break
                 
                 # Artist
                 for key in ['TPE1', 'ARTIST', '\xa9ART']:
-                    if key in tags:
+                    if has_tag(key):
                         metadata["artist"] = str(tags[key][0]) if isinstance(tags[key], list) else str(tags[key])
                         break
                 
                 # Album
                 for key in ['TALB', 'ALBUM', '\xa9alb']:
-                    if key in tags:
+                    if has_tag(key):
                         metadata["album"] = str(tags[key][0]) if isinstance(tags[key], list) else str(tags[key])
                         break
                 
                 # BPM/Tempo
                 for key in ['TBPM', 'BPM', 'tmpo']:
-                    if key in tags:
+                    if has_tag(key):
                         try:
                             metadata["tempo"] = int(float(str(tags[key][0]) if isinstance(tags[key], list) else str(tags[key])))
                         except (ValueError, TypeError):
@@ -423,16 +3092,22 @@ class PlaylistGenerator:
                 
                 # Genre
                 for key in ['TCON', 'GENRE', '\xa9gen']:
-                    if key in tags:
+                    if has_tag(key):
                         metadata["genre"] = str(tags[key][0]) if isinstance(tags[key], list) else str(tags[key])
                         break
                 
                 # AcoustID fingerprint
                 for key in ['TXXX:ACOUSTID_FINGERPRINT', 'ACOUSTID_FINGERPRINT', 'acoustid_fingerprint', '----:com.apple.iTunes:Acoustid Fingerprint']:
-                    if key in tags:
+                    if has_tag(key):
                         metadata["acoustid_fingerprint"] = str(tags[key][0]) if isinstance(tags[key], list) else str(tags[key])
                         break
                 
+                # ReplayGain track gain (e.g. "-6.32 dB")
+                for key in ['TXXX:REPLAYGAIN_TRACK_GAIN', 'REPLAYGAIN_TRACK_GAIN', 'replaygain_track_gain', '----:com.apple.iTunes:replaygain_track_gain']:
+                    if has_tag(key):
+                        metadata["replaygain_track_gain"] = str(tags[key][0]) if isinstance(tags[key], list) else str(tags[key])
+                        break
+                
                 # Extract cover art
                 metadata["cover_data"] = self.extract_cover_art(audio_file, tags)
                 
@@ -454,6 +3129,7 @@ class PlaylistGenerator:
             # For MP4/M4A files
             if 'covr' in tags:
                 cover = tags['covr'][0]
+                from mutagen.mp4 import MP4Cover
                 if isinstance(cover, MP4Cover):
                     return bytes(cover)
                 return cover
@@ -473,12 +3149,17 @@ class PlaylistGenerator:
 
     def measure_tempo(self, file_path: str) -> Optional[int]:
         """Measure tempo of audio file using librosa."""
-        if not LIBROSA_AVAILABLE or librosa is None:
+        return self.analyze_tempo(file_path)[0]
+
+    @instrumented("measure_tempo", reads=0)
+    def analyze_tempo(self, file_path: str) -> Tuple[Optional[int], Optional[float]]:
+        """Measure tempo and first beat position (seconds) of audio file using librosa."""
+        if not librosa_available():
             logger.warning(f"librosa not available, cannot measure tempo for {file_path}")
-            return None
+            return None, None
         
         try:
-            logger.info(f"Measuring tempo for {file_path}...")
+            logger.debug(f"Measuring tempo for {file_path}...")
             
             # Load audio file
             y, sr = librosa.load(file_path, sr=None)
@@ -498,17 +3179,21 @@ class PlaylistGenerator:
 
             measured_tempo = int(round(tempo_value))
             
-            logger.info(f"Measured tempo: {measured_tempo} BPM for {file_path}")
-            return measured_tempo
+            first_beat = None
+            if len(beats) > 0:
+                first_beat = round(float(librosa.frames_to_time(beats[0], sr=sr)), 3)
+            
+            logger.debug(f"Measured tempo: {measured_tempo} BPM for {file_path}")
+            return measured_tempo, first_beat
             
         except Exception as e:
             logger.error(f"Error measuring tempo for {file_path}: {e}")
-            return None
+            return None, None
     
     def save_tempo_to_metadata(self, file_path: str, tempo: int) -> bool:
         """Save measured tempo to the audio file's metadata."""
         try:
-            logger.info(f"Saving measured tempo ({tempo} BPM) to {file_path}...")
+            logger.debug(f"Saving measured tempo ({tempo} BPM) to {file_path}...")
             
             # Load the audio file for tag editing
             audio_file = mutagen.File(file_path)  # type: ignore
@@ -531,33 +3216,71 @@ class PlaylistGenerator:
             
             # Save the changes
             audio_file.save()
-            logger.info(f"Successfully saved tempo ({tempo} BPM) to {file_path}")
+            logger.debug(f"Successfully saved tempo ({tempo} BPM) to {file_path}")
             return True
             
         except Exception as e:
             logger.warning(f"Could not save tempo to {file_path}: {e}")
             # Don't treat this as a fatal error, just log it
             return False
+    
+    # ReplayGain 2.0 reference loudness
+    REPLAYGAIN_REFERENCE_LUFS = -18.0
+    
+    @instrumented("measure_loudness", reads=0)
+    def measure_loudness(self, file_path: str) -> Optional[float]:
+        """Integrated loudness (LUFS, EBU R128) of an audio file, measured with ffmpeg's ebur128 filter."""
+        try:
+            result = subprocess.run(
+                [which("ffmpeg") or "ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-i", file_path,
+                 "-map", "0:a:0", "-af", "ebur128=framelog=quiet", "-f", "null", "-"],
+                capture_output=True, text=True, check=True)
+            # The summary at the end repeats "I: <value> LUFS"; the last one is the integrated loudness
+            values = [line.split()[1] for line in result.stderr.splitlines()
+                      if line.strip().startswith("I:") and line.strip().endswith("LUFS")]
+            if not values or values[-1] == "-inf":
+                logger.warning(f"No loudness measured for {file_path} (silent or no audio stream)")
+                return None
+            return float(values[-1])
+        except Exception as e:
+            logger.error(f"Error measuring loudness for {file_path}: {e}")
+            return None
+    
+    def save_replaygain_to_file(self, file_path: str, gain_db: float) -> bool:
+        """Save a ReplayGain track gain to the audio file's metadata."""
+        try:
+            logger.debug(f"Saving ReplayGain track gain ({gain_db:.2f} dB) to {file_path}...")
+            
+            audio_file = mutagen.File(file_path)  # type: ignore
+            if audio_file is None:
+                logger.warning(f"Could not open {file_path} for ReplayGain tag writing")
+                return False
+            
+            if not hasattr(audio_file, 'tags') or audio_file.tags is None:
+                audio_file.add_tags()
+            
+            if hasattr(audio_file.tags, 'add'):
+                # For ID3 tags (MP3)
+                from mutagen.id3._frames import TXXX
+                audio_file.tags.add(TXXX(encoding=3, desc='REPLAYGAIN_TRACK_GAIN', text=[f"{gain_db:.2f} dB"]))
+            else:
+                audio_file.tags['REPLAYGAIN_TRACK_GAIN'] = f"{gain_db:.2f} dB"
+            
+            audio_file.save()
+            return True
+            
+        except Exception as e:
+            logger.warning(f"Could not save ReplayGain to {file_path}: {e}")
+            return False
 
     def validate_metadata(self, metadata: Dict, file_path: str) -> bool:
         """Validate that all required metadata is present."""
-        missing_fields = []
-        
-        if not metadata.get("title"):
-            missing_fields.append("title")
-        if not metadata.get("artist"):
-            missing_fields.append("artist")
-        if not metadata.get("album"):
-            missing_fields.append("album")
-        if not metadata.get("tempo"):
-            # Only require tempo if we're not skipping files without tempo
-            if self.skip_no_tempo:
-                logger.warning(f"Missing tempo in {file_path}, skipping due to --skip-no-tempo flag")
-                return False
-            else:
-                missing_fields.append("tempo")
-        if metadata.get("duration") is None:
-            missing_fields.append("duration")
+        missing_fields = self.missing_metadata_fields(metadata)
+        
+        # Only require tempo if we're not skipping files without tempo
+        if "tempo" in missing_fields and self.skip_no_tempo:
+            logger.warning(f"Missing tempo in {file_path}, skipping due to --skip-no-tempo flag")
+            return False
         
         if missing_fields:
             error_msg = f"Missing required metadata fields in {file_path}: {', '.join(missing_fields)}"
@@ -566,10 +3289,18 @@ class PlaylistGenerator:
             return False
         
         return True
+    
+    def missing_metadata_fields(self, metadata: Dict) -> List[str]:
+        """Required playlist fields the metadata lacks."""
+        missing_fields = [field for field in ("title", "artist", "album", "tempo") if not metadata.get(field)]
+        if metadata.get("duration") is None:
+            missing_fields.append("duration")
+        return missing_fields
 
+    @instrumented("save_cover_image")
     def save_cover_image(self, cover_data: bytes, cover_filename: str, temp_dir: str) -> Optional[str]:
         """Save cover image to temporary file."""
-        if not PIL_AVAILABLE or Image is None:
+        if not pil_available():
             logger.warning("PIL/Pillow not available, skipping cover image processing")
             return None
             
@@ -604,7 +3335,7 @@ class PlaylistGenerator:
 
     def create_placeholder_image(self, size: Tuple[int, int] = (512, 512)) -> Optional[bytes]:
         """Create a placeholder image for playlists without cover art."""
-        if not PIL_AVAILABLE or Image is None:
+        if not pil_available():
             logger.warning("PIL/Pillow not available, cannot create placeholder image")
             return None
             
@@ -642,7 +3373,7 @@ class PlaylistGenerator:
 
     def create_collage_from_covers(self, cover_images: List[bytes], size: Tuple[int, int] = (512, 512)) -> Optional[bytes]:
         """Create a 2x2 collage from cover images."""
-        if not PIL_AVAILABLE or Image is None:
+        if not pil_available():
             logger.warning("PIL/Pillow not available, cannot create collage")
             return None
             
@@ -697,7 +3428,7 @@ class PlaylistGenerator:
 
     def generate_playlist_cover(self, songs: List[Dict]) -> Optional[str]:
         """Generate playlist cover image based on songs and configuration."""
-        if not PIL_AVAILABLE or Image is None:
+        if not pil_available():
             logger.warning("PIL/Pillow not available, cannot generate playlist cover")
             return None
             
@@ -730,25 +3461,22 @@ class PlaylistGenerator:
                     logger.error(f"Error processing provided cover image: {e}")
                     # Fall through to automatic generation
             
-            # Use stored album covers from processing
-            albums_with_covers = self.album_covers
+            # Album covers of the playlist's songs stored in the catalog, in random order
+            album_covers = self._get_catalog().playlist_album_covers(cast(str, self.playlist_name))
             
             # If we have 4 or more different albums with covers, create collage
-            if len(albums_with_covers) >= 4:
-                logger.info(f"Creating collage from {len(albums_with_covers)} album covers")
-                album_covers = list(albums_with_covers.values())
-                random.shuffle(album_covers)  # Randomize selection
-                
-                collage_data = self.create_collage_from_covers(album_covers[:4])
+            if len(album_covers) >= 4:
+                logger.info(f"Creating collage from {len(album_covers)} album covers")
+                collage_data = self.create_collage_from_covers(album_covers)
                 if collage_data:
                     with open(cover_path, 'wb') as f:
                         f.write(collage_data)
                     return cover_path
             
             # If we have at least one album cover, use a random one
-            elif albums_with_covers:
+            elif album_covers:
                 logger.info("Using random album cover for playlist")
-                random_cover = random.choice(list(albums_with_covers.values()))
+                random_cover = album_covers[0]
                 
                 try:
                     image = Image.open(io.BytesIO(random_cover))
@@ -783,18 +3511,15 @@ class PlaylistGenerator:
             logger.error(f"Error generating playlist cover: {e}")
             return None
 
+    @instrumented("playlist_cover")
     def generate_and_upload_playlist_cover(self) -> bool:
-        """Generate playlist cover and upload it, then update playlist and style JSON files."""
+        """Generate playlist cover and upload it, then set it on the playlist and its style entry in the catalog."""
         try:
-            # Load current playlist to get songs
-            playlist_file = os.path.join(self.config["output"]["playlists_dir"], f"{self.playlist_name}.json")
-            if not os.path.exists(playlist_file):
-                logger.warning(f"Playlist file {playlist_file} does not exist, cannot generate cover")
+            playlist = self._get_catalog().get_playlist(cast(str, self.playlist_name))
+            if playlist is None:
+                logger.warning(f"Playlist {self.playlist_name} is not in the catalog, cannot generate cover")
                 return False
             
-            with open(playlist_file, 'r') as f:
-                playlist = json.load(f)
-            
             songs = playlist.get("songs", [])
             if not songs:
                 logger.warning("No songs in playlist, cannot generate cover")
@@ -808,23 +3533,14 @@ class PlaylistGenerator:
             
             # Upload playlist cover
             cover_filename = f"{self.playlist_name}_cover.jpg"
-            if self.upload_file_ssh(cover_path, cover_filename, "playlists"):
+            if self.upload_file(cover_path, cover_filename, "playlists"):
                 # Create cover URL
                 base_url = self.config.get("urls", {}).get("base_url", f"https://{self.config['ssh']['hostname']}")
                 playlists_path = self.config["ssh"].get("playlists_path", "public/playlists")
                 cover_url = f"{base_url.rstrip('/')}/{playlists_path.strip('/')}/{cover_filename}"
                 
-                # Update playlist JSON with cover URL
-                playlist["cover"] = cover_url
-                with open(playlist_file, 'w') as f:
-                    json.dump(playlist, f, indent=2)
-                
-                # Re-upload updated playlist
-                playlist_filename = f"{self.playlist_name}.json"
-                if self.upload_file_ssh(playlist_file, playlist_filename, "playlists"):
-                    logger.info(f"Updated playlist {self.playlist_name} with cover image")
-                
-                # Update style file with cover URL
+                # The playlist and style JSON are re-rendered by publish_catalog
+                self._get_catalog().update_playlist(cast(str, self.playlist_name), cover=cover_url)
                 self.update_style_file_with_cover(cover_url)
                 
                 # Clean up temp cover file
@@ -842,35 +3558,14 @@ class PlaylistGenerator:
             return False
 
     def update_style_file_with_cover(self, cover_url: str) -> bool:
-        """Update style file to include cover URL for the playlist."""
+        """Set the cover URL of the playlist entry in its style."""
         try:
-            style_file = os.path.join(self.config["output"]["styles_dir"], f"{self.style}.json")
-            
-            if not os.path.exists(style_file):
-                logger.warning(f"Style file {style_file} does not exist, cannot update with cover")
+            if not self._get_catalog().update_style_playlist(cast(str, self.style), cast(str, self.playlist_name), cover=cover_url):
+                logger.debug(f"Playlist {self.playlist_name} is not in style {self.style} yet, cover is set by update_style_file")
                 return False
             
-            with open(style_file, 'r') as f:
-                style_data = json.load(f)
-            
-            # Find and update the playlist entry
-            for playlist_entry in style_data.get("playlists", []):
-                if playlist_entry.get("id") == self.playlist_name:
-                    playlist_entry["cover"] = cover_url
-                    break
-            
-            # Save updated style file
-            with open(style_file, 'w') as f:
-                json.dump(style_data, f, indent=2)
-            
-            # Upload updated style file
-            style_filename = f"{self.style}.json"
-            if self.upload_file_ssh(style_file, style_filename, "styles"):
-                logger.info(f"Updated style file {self.style} with playlist cover")
-                return True
-            else:
-                logger.warning(f"Failed to upload updated style file {self.style}")
-                return False
+            logger.debug(f"Updated style {self.style} with playlist cover")
+            return True
                 
         except Exception as e:
             logger.error(f"Error updating style file with cover: {e}")
@@ -900,39 +3595,8 @@ class PlaylistGenerator:
         
         return min_tempo, max_tempo
     
-    def create_remote_directory(self, sftp: SFTPClient, remote_dir_path: str) -> bool:
-        """Create remote directory with proper permissions (755) if it doesn't exist."""
-        try:
-            # Try to stat the directory first
-            try:
-                sftp.stat(remote_dir_path)
-                logger.debug(f"Directory {remote_dir_path} already exists")
-                return True
-            except FileNotFoundError:
-                # Directory doesn't exist, create it
-                pass
-            
-            # Create parent directories recursively
-            parent_dir = os.path.dirname(remote_dir_path)
-            if parent_dir and parent_dir != remote_dir_path:
-                self.create_remote_directory(sftp, parent_dir)
-            
-            # Create the directory
-            logger.info(f"Creating remote directory: {remote_dir_path}")
-            sftp.mkdir(remote_dir_path)
-            
-            # Set permissions to 755
-            sftp.chmod(remote_dir_path, 0o755)
-            logger.debug(f"Set directory permissions to 755 for {remote_dir_path}")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error creating remote directory {remote_dir_path}: {e}")
-            return False
-    
     def upload_public_directory(self) -> bool:
-        """Upload entire public directory to the server preserving directory structure."""
+        """Upload entire public directory to every publish target preserving directory structure."""
         try:
             public_dir = "public"
             if not os.path.exists(public_dir):
@@ -940,73 +3604,16 @@ class PlaylistGenerator:
                 return True
             
             logger.info("Uploading public directory to server...")
+            targets = self._get_targets()
+            futures = [(target, target.submit(self._upload_public_to, target, public_dir)) for target in targets]
             
-            ssh_config = self.config["ssh"]
-            
-            ssh = SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Connect using key file
-            key_path = os.path.expanduser(ssh_config["key_filename"])
-            ssh.connect(
-                hostname=ssh_config["hostname"],
-                username=ssh_config["username"],
-                port=ssh_config["port"],
-                key_filename=key_path,
-            )
-            
-            sftp = ssh.open_sftp()
-            
-            # Get the base remote path
-            remote_base_path = ssh_config["remote_path"]
-            
-            uploaded_count = 0
-            skipped_count = 0
             error_count = 0
+            for target, future in futures:
+                uploaded_count, skipped_count, target_errors = future.result()
+                error_count += target_errors
+                logger.info(f"Public directory upload to {target.name} complete: {uploaded_count} uploaded, {skipped_count} skipped, {target_errors} errors")
             
-            # Walk through the public directory recursively
-            for root, dirs, files in os.walk(public_dir):
-                # Create the corresponding remote directory structure
-                relative_path = os.path.relpath(root, ".")
-                remote_dir_path = os.path.join(remote_base_path, relative_path).replace("\\", "/")
-                
-                # Ensure remote directory exists
-                if not self.create_remote_directory(sftp, remote_dir_path):
-                    logger.error(f"Failed to create remote directory: {remote_dir_path}")
-                    error_count += 1
-                    continue
-                
-                # Upload all files in this directory
-                for file in files:
-                    local_file_path = os.path.join(root, file)
-                    remote_file_path = os.path.join(remote_dir_path, file).replace("\\", "/")
-                    
-                    try:
-                        # Check if file already exists on remote server
-                        try:
-                            sftp.stat(remote_file_path)
-                            logger.debug(f"File {remote_file_path} already exists, skipping")
-                            skipped_count += 1
-                            continue
-                        except FileNotFoundError:
-                            # File doesn't exist, proceed with upload
-                            pass
-                        
-                        logger.info(f"Uploading {local_file_path} to {remote_file_path}")
-                        sftp.put(local_file_path, remote_file_path)
-                        
-                        # Set file permissions to 644
-                        sftp.chmod(remote_file_path, 0o644)
-                        uploaded_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Error uploading {local_file_path}: {e}")
-                        error_count += 1
-            
-            sftp.close()
-            ssh.close()
-            
-            logger.info(f"Public directory upload complete: {uploaded_count} uploaded, {skipped_count} skipped, {error_count} errors")
+            self._close_storage()
             return error_count == 0
             
         except Exception as e:
@@ -1014,78 +3621,168 @@ class PlaylistGenerator:
             self.errors.append(f"Public directory upload error: {e}")
             return False
     
-    def upload_file_ssh(self, local_path: str, remote_filename: str, subfolder: str = "audio") -> bool:
-        """Upload file to server via SSH with automatic directory creation and proper permissions."""
-        try:
-            ssh, sftp = self._get_ssh_connection()
-            sftp = cast(SFTPClient, sftp)
-            ssh_config = self.config["ssh"]
-            
-            # Determine the target directory based on subfolder
-            if subfolder == "audio":
-                target_dir = os.path.join(ssh_config["remote_path"], ssh_config.get("audio_path", "public/audio"))
-            elif subfolder == "playlists":
-                target_dir = os.path.join(ssh_config["remote_path"], ssh_config.get("playlists_path", "public/playlists"))
-            elif subfolder == "styles":
-                target_dir = os.path.join(ssh_config["remote_path"], ssh_config.get("styles_path", "public/styles"))
-            else:
-                target_dir = os.path.join(ssh_config["remote_path"], subfolder)
+    def _upload_public_to(self, target: PublishTarget, public_dir: str) -> Tuple[int, int, int]:
+        """Upload files of the public directory that are missing on one target (runs on the target thread)."""
+        storage = target.storage
+        uploaded_count = 0
+        skipped_count = 0
+        error_count = 0
+        
+        # Walk through the public directory recursively
+        for root, dirs, files in os.walk(public_dir):
+            # Create the corresponding remote directory structure
+            remote_dir_path = os.path.relpath(root, ".").replace("\\", "/")
             
-            # Ensure target directory exists
-            if not self.create_remote_directory(sftp, target_dir):
-                return False
+            # Ensure remote directory exists
+            try:
+                storage.makedirs(remote_dir_path)
+            except Exception as e:
+                logger.error(f"Failed to create remote directory {remote_dir_path} on {target.name}: {e}")
+                error_count += 1
+                continue
             
-            remote_path = os.path.join(target_dir, remote_filename)
+            # Upload all files in this directory
+            for file in files:
+                local_file_path = os.path.join(root, file)
+                remote_file_path = posixpath.join(remote_dir_path, file)
+                
+                try:
+                    # Check if file already exists on remote server
+                    try:
+                        storage.stat(remote_file_path)
+                        logger.debug(f"File {remote_file_path} already exists on {target.name}, skipping")
+                        skipped_count += 1
+                        continue
+                    except FileNotFoundError:
+                        # File doesn't exist, proceed with upload
+                        pass
+                    
+                    logger.debug(f"Uploading {local_file_path} to {target.name}/{remote_file_path}")
+                    storage.put(local_file_path, remote_file_path)
+                    uploaded_count += 1
+                    
+                except Exception as e:
+                    logger.error(f"Error uploading {local_file_path} to {target.name}: {e}")
+                    error_count += 1
+        
+        target.uploaded += uploaded_count
+        target.skipped += skipped_count
+        target.failed += error_count
+        return uploaded_count, skipped_count, error_count
+    
+    @instrumented("upload")
+    def upload_file(self, local_path: str, remote_filename: str, subfolder: str = "audio") -> bool:
+        """Publish a file to every target, creating the target directory if needed.
+        
+        All targets start uploading at once. The result is that of the primary target; mirrors finish in
+        the background from a staged copy (so the caller may delete the file) and report per target.
+        """
+        targets = self._get_targets()
+        target_dir = self.get_remote_dir(subfolder)
+        remote_path = posixpath.join(target_dir, remote_filename)
+        # Audio files are content-addressed, so they never change once published
+        immutable = subfolder == "audio"
+        
+        self._submit_to_mirrors(local_path, remote_path, target_dir, immutable)
+        uploaded = targets[0].run(self._publish_to, targets[0], local_path, remote_path, target_dir, immutable,
+                                  priority=upload_priority(remote_path))
+        if uploaded and subfolder == "audio":
+            self._remember_remote_audio(remote_filename)
+        return uploaded
+    
+    def _submit_to_mirrors(self, local_path: str, remote_path: str, target_dir: str, immutable: bool) -> None:
+        """Queue a file for every mirror target from a staged copy."""
+        mirrors = self._get_targets()[1:]
+        if not mirrors:
+            return
+        try:
+            staged_path, release = self._stage_for_mirrors(local_path, immutable, len(mirrors))
+            for target in mirrors:
+                target.submit(self._publish_to, target, staged_path, remote_path, target_dir, immutable, release,
+                              priority=upload_priority(remote_path))
+        except Exception as e:
+            logger.error(f"Error staging {local_path} for mirrors: {e}")
+            self.errors.append(f"Mirror staging error for {local_path}: {e}")
+    
+    @serialized
+    def _remember_remote_audio(self, remote_filename: str) -> None:
+        """Add a published audio file to the cached remote listing, so later lookups see it without relisting."""
+        if self.remote_audio_files is not None and remote_filename not in self.remote_audio_files:
+            bisect.insort(self.remote_audio_files, remote_filename)
+    
+    def is_temp_file(self, local_path: str) -> bool:
+        """Whether a file lives in the generator's temp directory (owned by the run, unlike library files)."""
+        temp_dir = os.path.realpath(self.temp_dir)
+        return os.path.realpath(local_path).startswith(temp_dir + os.sep)
+    
+    def _stage_for_mirrors(self, local_path: str, immutable: bool, users: int) -> Tuple[str, Callable[[], None]]:
+        """Snapshot a file for background mirror uploads; release() removes it after the last one."""
+        staging_dir = os.path.join(self.temp_dir, "mirror_staging")
+        os.makedirs(staging_dir, exist_ok=True)
+        staged_path = os.path.join(staging_dir, f"{next(self._staging_counter)}-{os.path.basename(local_path)}")
+        linked = False
+        if immutable and self.is_temp_file(local_path):
+            try:
+                os.link(local_path, staged_path)
+                linked = True
+            except OSError:
+                pass
+        if not linked:
+            # Playlists and styles are rewritten in place and library files may be retagged, so they are copied
+            shutil.copyfile(local_path, staged_path)
+        
+        remaining = [users]
+        lock = threading.Lock()
+        
+        def release() -> None:
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done and os.path.exists(staged_path):
+                os.remove(staged_path)
+        
+        return staged_path, release
+    
+    def _publish_to(self, target: PublishTarget, local_path: str, remote_path: str, target_dir: str, immutable: bool, on_done: Optional[Callable[[], None]] = None) -> bool:
+        """Upload one file to one target (runs on the target thread)."""
+        started = time.perf_counter()
+        try:
+            storage = target.storage
+            storage.makedirs(target_dir)
             
             # Check if file already exists - only skip for audio files
-            if subfolder == "audio":
+            if immutable:
                 try:
-                    sftp.stat(remote_path)
-                    logger.info(f"Audio file {remote_filename} already exists on server, skipping upload")
+                    storage.stat(remote_path)
+                    logger.debug(f"Audio file {remote_path} already exists on {target.name}, skipping upload")
+                    target.skipped += 1
                     return True
                 except FileNotFoundError:
                     # File doesn't exist, proceed with upload
                     pass
-            else:
-                # For non-audio files (playlists, styles), allow overwriting
-                try:
-                    sftp.stat(remote_path)
-                    logger.info(f"File {remote_filename} exists in {subfolder}, will overwrite")
-                except FileNotFoundError:
-                    # File doesn't exist, proceed with upload
-                    pass
             
-            # Add diagnostic logging
-            logger.info(f"Current working directory: {os.getcwd()}")
-            logger.info(f"Attempting to upload from: {local_path}")
-            logger.info(f"File exists check: {os.path.exists(local_path)}")
-            if os.path.exists(local_path):
-                logger.info(f"File size: {os.path.getsize(local_path)} bytes")
-            else:
-                # Try to find the file in different locations
-                logger.info("File not found, checking alternative paths...")
-                alt_paths = [
-                    os.path.join("scripts", local_path),
-                    os.path.join(os.getcwd(), "scripts", local_path),
-                    os.path.abspath(local_path)
-                ]
-                for alt_path in alt_paths:
-                    logger.info(f"Checking: {alt_path} -> exists: {os.path.exists(alt_path)}")
-            
-            logger.info(f"Uploading {local_path} to {remote_path}...")
-            sftp.put(local_path, remote_path)
-            
-            # Set file permissions to 644
-            sftp.chmod(remote_path, 0o644)
-            logger.debug(f"Set file permissions to 644 for {remote_path}")
-            
-            logger.info(f"Successfully uploaded {remote_filename} to {subfolder} subfolder")
+            logger.debug(f"Uploading {local_path} to {target.name}/{remote_path}...")
+            # Library files (MP3s published as-is) are always copied: a later retag must not reach the server copy
+            storage.put(local_path, remote_path, immutable=immutable and self.is_temp_file(local_path))
+            uploaded_size = os.path.getsize(local_path)
+            self.metrics.add_bytes("upload", "uploaded", uploaded_size)
+            if self.progress is not None:
+                self.progress.add_uploaded(uploaded_size)
+            target.uploaded += 1
+            self._record_remote_object(target, remote_path, uploaded_size)
+            
+            logger.debug(f"Successfully uploaded {remote_path} to {target.name}")
             return True
             
         except Exception as e:
-            logger.error(f"Error uploading {local_path}: {e}")
-            self.errors.append(f"Upload error for {local_path}: {e}")
+            target.failed += 1
+            logger.error(f"Error uploading {local_path} to {target.name}: {e}")
+            self.errors.append(f"Upload error for {local_path} ({target.name}): {e}")
             return False
+        finally:
+            target.seconds += time.perf_counter() - started
+            if on_done is not None:
+                on_done()
     
     def create_playlist_entry(self, metadata: Dict, fingerprint_hash: str, audio_url: str, cover_url: Optional[str] = None) -> Dict:
         """Create a playlist entry from metadata."""
@@ -1102,87 +3799,98 @@ class PlaylistGenerator:
         # Only include cover if it's available
         if cover_url:
             entry["cover"] = cover_url
+        
+        # Playback cue points (seconds) when silence detection / beat tracking ran
+        if metadata.get("start_offset") is not None:
+            entry["startOffset"] = metadata["start_offset"]
+        if metadata.get("end_offset") is not None:
+            entry["endOffset"] = metadata["end_offset"]
+        if metadata.get("first_beat") is not None:
+            entry["firstBeat"] = metadata["first_beat"]
+        
+        if metadata.get("renditions"):
+            entry["renditions"] = metadata["renditions"]
+        
+        if metadata.get("peaks"):
+            entry["peaks"] = metadata["peaks"]
+        if metadata.get("preview"):
+            entry["preview"] = metadata["preview"]
+        if metadata.get("preview_start") is not None:
+            entry["previewStart"] = metadata["preview_start"]
             
         return entry
     
-    def update_playlist_file(self, song_entry: Dict) -> bool:
-        """Update or create playlist file."""
+    # Entry fields measured from the audio, which an entry built from tags (fast lane) can't provide
+    MEASURED_ENTRY_FIELDS = ("startOffset", "endOffset", "firstBeat", "peaks", "previewStart")
+    
+    def add_measured_fields(self, song_entry: Dict) -> Dict:
+        """Fill in the measured fields of a published track from its entries stored in the catalog."""
+        missing = [field for field in self.MEASURED_ENTRY_FIELDS if field not in song_entry]
+        if "preview" not in song_entry and "previewStart" in missing:
+            missing.remove("previewStart")  # The preview clip is gone from the server
+        if missing:
+            for stored in self._get_catalog().track_entries(song_entry["id"]):
+                for field in [field for field in missing if field in stored]:
+                    song_entry[field] = stored[field]
+                    missing.remove(field)
+        return song_entry
+    
+    @instrumented("update_playlist")
+    def update_playlist_file(self, song_entry: Dict, spec: Optional[PlaylistSpec] = None) -> bool:
+        """Add a song to the playlist in the catalog (creating the playlist). Defaults to the generator's playlist."""
+        spec = spec or PlaylistSpec(cast(str, self.style), cast(str, self.playlist_name), self.cover_image)
         try:
-            playlist_file = os.path.join(self.config["output"]["playlists_dir"], f"{self.playlist_name}.json")
-            
-            # Load existing playlist or create new one
-            if os.path.exists(playlist_file):
-                with open(playlist_file, 'r') as f:
-                    playlist = json.load(f)
-            else:
-                # Create new playlist without tempo defaults - will be set from first song
-                assert self.style is not None and self.playlist_name is not None
-                playlist = {
-                    "id": self.playlist_name,
-                    "name": self.playlist_name.replace("_", " ").title(),
-                    "style": self.style.replace("_", " ").title(),
-                    "cover": self.cover_image,
-                    "songs": []
-                }
+            catalog = self._get_catalog()
+            # New playlists get no tempo defaults - the range is computed from the songs
+            catalog.ensure_playlist(spec.playlist, {
+                "id": spec.playlist,
+                "name": spec.playlist.replace("_", " ").title(),
+                "style": spec.style.replace("_", " ").title(),
+                "cover": spec.cover
+            })
             
-            # Check if song already exists
-            existing_ids = [song["id"] for song in playlist["songs"]]
-            if song_entry["id"] not in existing_ids:
-                playlist["songs"].append(song_entry)
-                
-                # Calculate tempo range based on all songs including the new one
-                min_tempo, max_tempo = self.calculate_tempo_range_from_songs(playlist["songs"])
-                playlist["minTempo"] = min_tempo
-                playlist["maxTempo"] = max_tempo
-                
-                # Save playlist locally
-                os.makedirs(os.path.dirname(playlist_file), exist_ok=True)
-                with open(playlist_file, 'w') as f:
-                    json.dump(playlist, f, indent=2)
-                
-                # Upload playlist to remote server
-                playlist_filename = f"{self.playlist_name}.json"
-                if self.upload_file_ssh(playlist_file, playlist_filename, "playlists"):
-                    logger.info(f"Uploaded playlist {playlist_filename} to remote server")
-                else:
-                    logger.warning(f"Failed to upload playlist {playlist_filename} to remote server")
-                
-                logger.info(f"Added song to playlist {self.playlist_name} (tempo range: {min_tempo}-{max_tempo} BPM)")
+            if catalog.add_song(spec.playlist, song_entry):
+                logger.debug(f"Added song {song_entry['id']} to playlist {spec.playlist}")
                 return True
             else:
-                logger.info(f"Song {song_entry['id']} already exists in playlist {self.playlist_name}")
+                logger.debug(f"Song {song_entry['id']} already exists in playlist {spec.playlist}")
                 return False
                 
         except Exception as e:
-            logger.error(f"Error updating playlist {self.playlist_name}: {e}")
-            self.errors.append(f"Playlist update error for {self.playlist_name}: {e}")
+            logger.error(f"Error updating playlist {spec.playlist}: {e}")
+            self.errors.append(f"Playlist update error for {spec.playlist}: {e}")
             return False
     
+    def add_to_playlists(self, input_file: str, song_entry: Dict) -> List[PlaylistSpec]:
+        """Add a song to every playlist its file is routed to whose tempo filter accepts it; returns those added to."""
+        if self.entry_sink is not None:
+            # Queue workers hand the entry back to the coordinator, which owns the playlists
+            self.entry_sink(input_file, song_entry)
+            return []
+        if self.routes is None:
+            specs = [PlaylistSpec(cast(str, self.style), cast(str, self.playlist_name), self.cover_image)]
+        else:
+            specs = self.routes.get(input_file, [])
+        
+        added = []
+        for spec in specs:
+            if not spec.accepts(song_entry.get("tempo")):
+                logger.debug(f"{input_file} ({song_entry.get('tempo')} BPM) is outside the tempo filter of playlist {spec.playlist}")
+                continue
+            if self.update_playlist_file(song_entry, spec):
+                added.append(spec)
+        return added
+    
     def update_style_file(self) -> bool:
-        """Update style file to include new playlist or update existing playlist."""
+        """Add the playlist to its style in the catalog or update its entry."""
         try:
-            style_file = os.path.join(self.config["output"]["styles_dir"], f"{self.style}.json")
-            
-            # Load existing style file or create new one
-            if os.path.exists(style_file):
-                with open(style_file, 'r') as f:
-                    style_data = json.load(f)
-            else:
-                assert self.style is not None
-                style_data = {
-                    "style": self.style.replace("_", " ").title(),
-                    "playlists": []
-                }
-            
-            # Load playlist to get current metadata
-            playlist_file = os.path.join(self.config["output"]["playlists_dir"], f"{self.playlist_name}.json")
-            if not os.path.exists(playlist_file):
-                logger.warning(f"Playlist file {playlist_file} does not exist, cannot update style")
+            assert self.style is not None and self.playlist_name is not None
+            catalog = self._get_catalog()
+            playlist = catalog.get_playlist(self.playlist_name)
+            if playlist is None or "minTempo" not in playlist:
+                logger.warning(f"Playlist {self.playlist_name} has no songs with a tempo in the catalog, cannot update style")
                 return False
             
-            with open(playlist_file, 'r') as f:
-                playlist = json.load(f)
-            
             # Create or update playlist entry
             playlist_entry = {
                 "id": self.playlist_name,
@@ -1190,122 +3898,818 @@ class PlaylistGenerator:
                 "cover": playlist.get("cover"),
                 "minTempo": playlist["minTempo"],
                 "maxTempo": playlist["maxTempo"],
-                "description": playlist.get("description", f"Auto-generated playlist for {playlist['name']}")
+                "description": playlist.get("description", f"Auto-generated playlist for {playlist['name']}"),
+                "version": catalog.version("playlists", self.playlist_name)
             }
             
-            # Check if playlist already exists in style
-            existing_playlist_index = None
-            for i, p in enumerate(style_data["playlists"]):
-                if p["id"] == self.playlist_name:
-                    existing_playlist_index = i
-                    break
-            
-            if existing_playlist_index is not None:
-                # Update existing playlist entry
-                old_entry = style_data["playlists"][existing_playlist_index]
-                style_data["playlists"][existing_playlist_index] = playlist_entry
+            old_entry = catalog.upsert_style_playlist(self.style, {"style": self.style.replace("_", " ").title()}, playlist_entry)
+            if old_entry is not None:
                 logger.info(f"Updated existing playlist {self.playlist_name} in style {self.style} "
                            f"(tempo range: {old_entry.get('minTempo', 'unknown')}-{old_entry.get('maxTempo', 'unknown')} → "
                            f"{playlist_entry['minTempo']}-{playlist_entry['maxTempo']} BPM)")
             else:
-                # Add new playlist entry
-                style_data["playlists"].append(playlist_entry)
                 logger.info(f"Added new playlist {self.playlist_name} to style {self.style} "
                            f"(tempo range: {playlist_entry['minTempo']}-{playlist_entry['maxTempo']} BPM)")
             
-            # Save style file locally
-            os.makedirs(os.path.dirname(style_file), exist_ok=True)
-            with open(style_file, 'w') as f:
-                json.dump(style_data, f, indent=2)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error updating style file {self.style}: {e}")
+            self.errors.append(f"Style file update error for {self.style}: {e}")
+            return False
+    
+    @instrumented("publish_catalog")
+    def publish_catalog(self, upload: bool = True) -> bool:
+        """Render the JSON files of dirty playlists and styles and upload them.
+        
+        A row stays dirty until its file is uploaded, so a failed upload is retried by the next run.
+        Files are replaced under a lock after merging in what other runs published since (see
+        _publish_merged), so parallel runs on the same playlists don't lose each other's songs.
+        With upload=False the files are only written locally and the rows stay dirty.
+        """
+        catalog = self._get_catalog()
+        ok = True
+        # Playlists first: publishing one updates its entries in styles
+        for table in ("playlists", "styles"):
+            for row_id in catalog.dirty(table):
+                try:
+                    if not upload:
+                        self._render_json_file(table, row_id, catalog.version(table, row_id))
+                        continue
+                    if self._publish_on_primary(table, f"{row_id}.json", self._publish_merged, table, row_id):
+                        logger.info(f"Published {table} file {row_id}.json (version {catalog.version(table, row_id)})")
+                    else:
+                        logger.warning(f"Failed to upload {table} file {row_id}.json, it will be retried next run")
+                        ok = False
+                except Exception as e:
+                    logger.error(f"Error publishing {table} file {row_id}.json: {e}")
+                    self.errors.append(f"Publish error for {table}/{row_id}.json: {e}")
+                    ok = False
+        return ok
+    
+    def _render_json_file(self, table: str, row_id: str, version: int) -> str:
+        """Write the local JSON file of a catalog playlist or style with the given version; returns its path."""
+        catalog = self._get_catalog()
+        data = cast(Dict, catalog.get_playlist(row_id) if table == "playlists" else catalog.get_style(row_id))
+        data["version"] = version
+        local_dir = self.config["output"][f"{table}_dir"]
+        os.makedirs(local_dir, exist_ok=True)
+        local_file = os.path.join(local_dir, f"{row_id}.json")
+        with open(local_file, 'w') as f:
+            json.dump(data, f, indent=2)
+        return local_file
+    
+    def _publish_on_primary(self, subfolder: str, remote_filename: str, publish: Callable[..., Optional[str]], *args) -> bool:
+        """Run a locked publish step on the primary target, then queue the file it published for the mirrors.
+        
+        publish runs on the primary target thread and returns the local file it published, or None if
+        there was nothing to publish. The server copy on the primary is the one runs coordinate on;
+        mirrors just receive the result.
+        """
+        primary = self._get_targets()[0]
+        started = time.perf_counter()
+        try:
+            local_file = primary.run(publish, primary, *args, priority=upload_priority(remote_filename))
+        except Exception as e:
+            primary.failed += 1
+            logger.error(f"Error publishing {subfolder}/{remote_filename} to {primary.name}: {e}")
+            self.errors.append(f"Upload error for {subfolder}/{remote_filename} ({primary.name}): {e}")
+            return False
+        finally:
+            primary.seconds += time.perf_counter() - started
+        if local_file is not None:
+            target_dir = self.get_remote_dir(subfolder)
+            self._submit_to_mirrors(local_file, posixpath.join(target_dir, remote_filename), target_dir, False)
+        return True
+    
+    def _publish_merged(self, target: PublishTarget, table: str, row_id: str) -> str:
+        """Publish a catalog playlist or style, merging in the server copy first (runs on the target thread).
+        
+        Under the file's lock, the server copy is merged into the catalog (songs and style entries
+        other runs added since are kept), and the file is rendered with the next version and replaced.
+        """
+        catalog = self._get_catalog()
+        storage = target.storage
+        target_dir = self.get_remote_dir(table)
+        remote_path = posixpath.join(target_dir, f"{row_id}.json")
+        storage.makedirs(target_dir)
+        with self._remote_file_lock(storage, remote_path) as lock_path:
+            version = catalog.version(table, row_id)
+            remote = self._read_remote_json(storage, remote_path)
+            if remote is not None:
+                remote_version = remote.get("version", 0)
+                version = max(version, remote_version)
+                merge = catalog.merge_playlist if table == "playlists" else catalog.merge_style
+                added, conflicts = merge(row_id, remote)
+                if added:
+                    logger.info(f"Merged {added} {'songs' if table == 'playlists' else 'playlist entries'} "
+                                f"from version {remote_version} of {remote_path} published by another run")
+                if conflicts:
+                    logger.warning(f"Fields of {remote_path} changed both by another run and locally, keeping local values: {', '.join(conflicts)}")
+            if table == "styles":
+                self._sync_style_playlists(storage, row_id)
+            local_file = self._render_json_file(table, row_id, version + 1)
+            self._replace_locked(target, lock_path, local_file, remote_path)
+        catalog.mark_published(table, row_id, version + 1)
+        return local_file
+    
+    def _sync_style_playlists(self, storage: StorageBackend, style_id: str) -> None:
+        """Fetch playlists of a style that other runs published since this catalog last saw them (target thread).
+        
+        Their local files are rewritten too, so the tempo index covers every playlist of the style.
+        """
+        catalog = self._get_catalog()
+        dirty = set(catalog.dirty("playlists"))
+        for entry in cast(Dict, catalog.get_style(style_id)).get("playlists", []):
+            playlist_id = entry["id"]
+            if playlist_id in dirty or entry.get("version", 0) <= catalog.version("playlists", playlist_id):
+                continue
+            remote = self._read_remote_json(storage, posixpath.join(self.get_remote_dir("playlists"), f"{playlist_id}.json"))
+            if remote is None:
+                continue
+            remote_version = remote.get("version", 0)
+            added, _ = catalog.merge_playlist(playlist_id, remote)
+            catalog.mark_published("playlists", playlist_id, remote_version)
+            self._render_json_file("playlists", playlist_id, remote_version)
+            logger.info(f"Fetched version {remote_version} of playlist {playlist_id} published by another run ({added} new songs)")
+    
+    @staticmethod
+    def _read_remote_json(storage: StorageBackend, remote_path: str) -> Optional[Dict]:
+        try:
+            return json.loads(storage.read(remote_path))
+        except FileNotFoundError:
+            return None
+    
+    def _lock_holder(self, storage: StorageBackend, lock_path: str) -> Optional[Dict]:
+        """Owner and expiry of a remote lock, or None if it is not held."""
+        try:
+            return json.loads(storage.read(lock_path))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Being written right now (or left half-written by a crash): judge it by its age
+            try:
+                return {"owner": "unknown", "expires": storage.stat(lock_path).mtime + self.lock_lease}
+            except FileNotFoundError:
+                return None
+    
+    @contextlib.contextmanager
+    def _remote_file_lock(self, storage: StorageBackend, remote_path: str) -> Iterator[str]:
+        """Hold the lock file next to a remote file (runs on the target thread); yields the lock path.
+        
+        The lock names its owner and lease expiry. An expired lock is taken over, so a crashed run holds
+        up others for at most lock_lease seconds; waiting longer than lock_timeout raises TimeoutError.
+        """
+        lock_path = f"{remote_path}.lock"
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            lock = {"owner": self.lock_owner, "expires": time.time() + self.lock_lease}
+            if storage.create_exclusive(lock_path, json.dumps(lock).encode()):
+                break
+            holder = self._lock_holder(storage, lock_path)
+            if holder is not None and holder.get("expires", 0) < time.time():
+                self._take_over_lock(storage, lock_path, holder)
+                continue
+            # Held by another run, or released between the create and the read
+            owner = holder.get("owner") if holder is not None else "nobody"
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for lock {lock_path} held by {owner}")
+            logger.debug(f"Waiting for lock {lock_path} held by {owner}")
+            time.sleep(random.uniform(0.5, 1.5))
+        try:
+            yield lock_path
+        finally:
+            try:
+                if (self._lock_holder(storage, lock_path) or {}).get("owner") == self.lock_owner:
+                    storage.remove(lock_path)
+            except Exception as e:
+                logger.warning(f"Could not release lock {lock_path}: {e}")
+    
+    def _take_over_lock(self, storage: StorageBackend, lock_path: str, holder: Dict) -> None:
+        """Remove an expired lock, unless it was replaced by a live one since it was read as `holder`.
+        
+        The lock is renamed to a name of our own first, so of several runs taking it over only one
+        rename succeeds. The moved file is deleted only if it is still the expired lock; a live lock
+        moved by mistake is put back (its owner notices the loss in _replace_locked if that fails).
+        """
+        stale_path = f"{lock_path}.{self.lock_owner}.stale"
+        try:
+            storage.rename(lock_path, stale_path)
+        except OSError:
+            return  # Another run took it over first
+        moved = self._lock_holder(storage, stale_path)
+        try:
+            if moved == holder:
+                logger.warning(f"Took over expired lock {lock_path} of {holder.get('owner')}")
+            elif moved is not None and not storage.create_exclusive(lock_path, storage.read(stale_path)):
+                logger.warning(f"Lock {lock_path} of {moved.get('owner')} was replaced while being put back")
+        finally:
+            try:
+                storage.remove(stale_path)
+            except FileNotFoundError:
+                pass
+    
+    def _replace_locked(self, target: PublishTarget, lock_path: str, local_path: str, remote_path: str) -> None:
+        """Upload next to remote_path and rename over it, but only if the lock is still ours (compare before rename)."""
+        storage = target.storage
+        staged = f"{remote_path}.{self.lock_owner}.new"
+        storage.put(local_path, staged)
+        if (self._lock_holder(storage, lock_path) or {}).get("owner") != self.lock_owner:
+            storage.remove(staged)
+            raise RuntimeError(f"Lost lock {lock_path} (lease expired), not replacing {remote_path}")
+        storage.rename(staged, remote_path)
+        
+        uploaded_size = os.path.getsize(local_path)
+        self.metrics.add_bytes("upload", "uploaded", uploaded_size)
+        if self.progress is not None:
+            self.progress.add_uploaded(uploaded_size)
+        target.uploaded += 1
+        self._record_remote_object(target, remote_path, uploaded_size)
+    
+    def _publish_tempo_index(self, target: PublishTarget, index_file: str, style: str, style_version: int) -> Optional[str]:
+        """Replace the tempo index of a style unless the server has one built from a newer style version (target thread)."""
+        storage = target.storage
+        target_dir = self.get_remote_dir("tempo_index")
+        remote_path = posixpath.join(target_dir, f"{style}.json")
+        storage.makedirs(target_dir)
+        with self._remote_file_lock(storage, remote_path) as lock_path:
+            remote = self._read_remote_json(storage, remote_path)
+            if remote is not None and remote.get("styleVersion", 0) > style_version:
+                logger.info(f"Tempo index for style {style} on the server is newer (style version {remote['styleVersion']}), keeping it")
+                return None
+            self._replace_locked(target, lock_path, index_file, remote_path)
+        return index_file
+    
+    @instrumented("tempo_index")
+    def update_tempo_index(self, style: str, upload: bool = True) -> bool:
+        """Rebuild the tempo index of a style, reusing entries of playlists whose songs did not change.
+        
+        The index is a sorted array of [tempo, song id, playlist index] so BPM ranges are a binary search away.
+        It records the style version it was built from, so a run never replaces a newer index on the server.
+        Playlists are compared by the songs hash stored in the catalog; only changed ones are read.
+        """
+        try:
+            catalog = self._get_catalog()
+            style_data = catalog.get_style(style)
+            if style_data is None:
+                logger.warning(f"Style {style} is not in the catalog, cannot build tempo index")
+                return False
+            
+            index_dir = self.config["output"].get("tempo_index_dir", "public/tempo_index")
+            index_file = os.path.join(index_dir, f"{style}.json")
+            
+            # Existing entries grouped by playlist id, with the content hash they were built from
+            previous_tracks: Dict[str, List] = {}
+            previous_hashes: Dict[str, str] = {}
+            previous_version = None
+            if os.path.exists(index_file):
+                with open(index_file, 'r') as f:
+                    previous = json.load(f)
+                previous_version = previous.get("styleVersion")
+                previous_ids = [p["id"] for p in previous.get("playlists", [])]
+                for p in previous.get("playlists", []):
+                    previous_hashes[p["id"]] = p["hash"]
+                for tempo, song_id, playlist_index in previous.get("tracks", []):
+                    previous_tracks.setdefault(previous_ids[playlist_index], []).append((tempo, song_id))
+            
+            playlists = []
+            tracks = []
+            rebuilt = []
+            for entry in style_data.get("playlists", []):
+                playlist_id = entry["id"]
+                content_hash = catalog.songs_hash(playlist_id)
+                if content_hash is None:
+                    continue
+                
+                if previous_hashes.get(playlist_id) == content_hash:
+                    playlist_tracks = previous_tracks.get(playlist_id, [])
+                else:
+                    playlist_tracks = catalog.playlist_tempos(playlist_id)
+                    rebuilt.append(playlist_id)
+                
+                playlist_index = len(playlists)
+                playlists.append({"id": playlist_id, "hash": content_hash})
+                tracks.extend([tempo, song_id, playlist_index] for tempo, song_id in playlist_tracks)
             
-            # Upload style file to remote server
-            style_filename = f"{self.style}.json"
-            if self.upload_file_ssh(style_file, style_filename, "styles"):
-                logger.info(f"Uploaded style file {style_filename} to remote server")
+            removed = set(previous_hashes) - {p["id"] for p in playlists}
+            style_version = catalog.version("styles", style)
+            if not rebuilt and not removed and previous_version == style_version:
+                # The local file is current, but it may never have reached the server
+                if not upload or not catalog.tempo_index_pending(style):
+                    logger.debug(f"Tempo index for style {style} is up to date")
+                    return True
+                logger.info(f"Uploading tempo index for style {style} left pending by an earlier run")
             else:
-                logger.warning(f"Failed to upload style file {style_filename} to remote server")
+                tracks.sort()
+                index = {
+                    "style": style_data.get("style", style),
+                    "styleVersion": style_version,
+                    "playlists": playlists,
+                    "tracks": tracks
+                }
+                
+                os.makedirs(index_dir, exist_ok=True)
+                with open(index_file, 'w') as f:
+                    json.dump(index, f, separators=(',', ':'))
+                # Pending until uploaded, like dirty playlists and styles
+                catalog.mark_tempo_index(style, True)
+                
+                logger.info(f"Updated tempo index for style {style}: {len(tracks)} tracks "
+                            f"({len(rebuilt)} playlists rebuilt, {len(removed)} removed)")
+            
+            if upload:
+                if not self._publish_on_primary("tempo_index", f"{style}.json", self._publish_tempo_index, index_file, style, style_version):
+                    logger.warning(f"Failed to upload tempo index for style {style}, it is retried by the next run")
+                    return False
+                catalog.mark_tempo_index(style, False)
             
             return True
             
         except Exception as e:
-            logger.error(f"Error updating style file {self.style}: {e}")
-            self.errors.append(f"Style file update error for {self.style}: {e}")
+            logger.error(f"Error updating tempo index for style {style}: {e}")
+            self.errors.append(f"Tempo index error for {style}: {e}")
             return False
     
+    def update_all_tempo_indexes(self, upload: bool = True) -> None:
+        """Update tempo indexes of every style in the catalog (unchanged ones are neither rewritten nor uploaded)."""
+        for style in self._get_catalog().style_ids():
+            self.update_tempo_index(style, upload=upload)
+    
     def recalculate_all_playlist_tempos(self) -> None:
-        """Recalculate tempo ranges for all existing playlists."""
-        playlists_dir = self.config["output"]["playlists_dir"]
-        if not os.path.exists(playlists_dir):
-            return
-        
+        """Recalculate tempo ranges for all playlists in the catalog."""
         logger.info("Recalculating tempo ranges for existing playlists...")
         
-        for playlist_file in os.listdir(playlists_dir):
-            if playlist_file.endswith('.json'):
-                playlist_path = os.path.join(playlists_dir, playlist_file)
-                try:
-                    with open(playlist_path, 'r') as f:
-                        playlist = json.load(f)
-                    
-                    if 'songs' in playlist and playlist['songs']:
-                        # Recalculate tempo range
-                        min_tempo, max_tempo = self.calculate_tempo_range_from_songs(playlist['songs'])
-                        
-                        # Update if changed
-                        if playlist.get('minTempo') != min_tempo or playlist.get('maxTempo') != max_tempo:
-                            playlist['minTempo'] = min_tempo
-                            playlist['maxTempo'] = max_tempo
-                            
-                            with open(playlist_path, 'w') as f:
-                                json.dump(playlist, f, indent=2)
-                            
-                            logger.info(f"Updated tempo range for {playlist['name']}: {min_tempo}-{max_tempo} BPM")
-                
-                except Exception as e:
-                    logger.error(f"Error recalculating tempo for {playlist_file}: {e}")
+        catalog = self._get_catalog()
+        for playlist_id in catalog.recalculate_tempo_ranges():
+            playlist = catalog.get_playlist(playlist_id)
+            if playlist is not None:
+                logger.info(f"Updated tempo range for {playlist.get('name', playlist_id)}: "
+                            f"{playlist.get('minTempo')}-{playlist.get('maxTempo')} BPM")
+    
+    def referenced_objects(self) -> set:
+        """Names of the files referenced by the playlist and style JSONs on the primary and in the catalog.
+        
+        Every URL or path value counts, so fields pointing at published files are covered wherever they
+        are. Raises if a remote JSON cannot be listed or read: collecting against an incomplete set of
+        references would delete live files. Catalog rows cover playlists not published yet.
+        """
+        referenced = set()
+        
+        def collect(value) -> None:
+            if isinstance(value, dict):
+                for item in value.values():
+                    collect(item)
+            elif isinstance(value, list):
+                for item in value:
+                    collect(item)
+            elif isinstance(value, str) and value:
+                referenced.add(posixpath.basename(urlsplit(value).path))
+        
+        target = self._get_targets()[0]
+        for subfolder in ("playlists", "styles"):
+            remote_dir = self.get_remote_dir(subfolder)
+            try:
+                entries = target.run(target.storage.list, remote_dir)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.is_dir and entry.name.endswith(".json"):
+                    collect(target.run(self._read_remote_json, target.storage, posixpath.join(remote_dir, entry.name)))
+        
+        catalog = self._get_catalog()
+        for playlist_id in catalog.playlist_ids():
+            collect(catalog.get_playlist(playlist_id))
+        for style_id in catalog.style_ids():
+            collect(catalog.get_style(style_id))
+        return referenced
+    
+    def collect_garbage(self, action: str = "report", grace_days: Optional[float] = None) -> Dict:
+        """Find published files that no playlist or style references and remove them from every target.
+        
+        Candidates are the tracks, renditions, previews and covers in the audio folder, playlist covers
+        in the playlists folder, and partial uploads left in either. Files newer than the grace period
+        are kept, so uploads of runs that haven't published their playlists yet survive. action is
+        "report" (dry run), "quarantine" (move below gc.quarantine_path, keeping their paths) or
+        "delete". Returns the report.
+        """
+        gc_config = self.config.get("gc", {})
+        grace_days = gc_config.get("grace_days", 7) if grace_days is None else grace_days
+        cutoff = time.time() - grace_days * 86400
+        
+        logger.info("Collecting files referenced by playlists and styles...")
+        referenced = self.referenced_objects()
+        if not referenced:
+            raise RuntimeError("No playlist or style references any file, refusing to collect garbage")
+        logger.info(f"{len(referenced)} files are referenced")
+        
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "action": action,
+            "grace_days": grace_days,
+            "referenced": len(referenced),
+            "targets": [self._collect_target_garbage(target, target_config, referenced, cutoff, action, index == 0)
+                        for index, (target_config, target) in enumerate(zip(storage_configs(self.config), self._get_targets()))]
+        }
+        if action != "report":
+            # The listing no longer matches the server
+            self.remote_audio_files = None
+        return report
+    
+    def _collect_target_garbage(self, target: PublishTarget, target_config: Dict, referenced: set, cutoff: float, action: str, primary: bool) -> Dict:
+        audio_suffixes = tuple(f".{ext}" for ext, _, _ in RENDITION_FORMATS.values())
+        orphans = []
+        inventory = 0
+        recent = 0
+        for subfolder, suffixes in (("audio", audio_suffixes + (".jpg", ".part")), ("playlists", (".jpg", ".part"))):
+            remote_dir = self.get_remote_dir(subfolder)
+            try:
+                entries = target.run(target.storage.list, remote_dir)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_dir or not entry.name.endswith(suffixes):
+                    continue
+                inventory += 1
+                if entry.name in referenced:
+                    continue
+                if entry.mtime > cutoff:
+                    recent += 1
+                    continue
+                orphans.append({"path": posixpath.join(remote_dir, entry.name), "size": entry.size, "mtime": entry.mtime})
+        orphans.sort(key=lambda orphan: orphan["path"])
+        orphan_bytes = sum(orphan["size"] for orphan in orphans)
+        logger.info(f"{target.name}: {len(orphans)} of {inventory} files are unreferenced ({orphan_bytes / (1024 * 1024):.1f} MB), "
+                    f"{recent} more are within the grace period")
+        
+        removed: List[str] = []
+        failed: List[str] = []
+        if orphans and action != "report":
+            removed, failed = self._remove_orphans(target, target_config, [orphan["path"] for orphan in orphans], action)
+            catalog = self._get_catalog()
+            catalog.forget_remote_objects(target.name, removed)
+            if primary:
+                # Collected tracks must not be linked to as near-duplicates any more
+                catalog.remove_fingerprints([posixpath.basename(path)[:-4] for path in removed
+                                             if path.endswith(".mp3") and posixpath.basename(path).count(".") == 1])
+        
+        return {
+            "target": target.name,
+            "inventory": inventory,
+            "recent": recent,
+            "orphan_bytes": orphan_bytes,
+            "removed": len(removed),
+            "failed": failed,
+            "orphans": orphans
+        }
+    
+    def _remove_orphans(self, target: PublishTarget, target_config: Dict, paths: List[str], action: str) -> Tuple[List[str], List[str]]:
+        """Delete or quarantine paths in batches over gc.connections parallel connections to the target."""
+        gc_config = self.config.get("gc", {})
+        batch_size = gc_config.get("batch_size", 200)
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        quarantine_dir = posixpath.join(gc_config.get("quarantine_path", "gc_quarantine"), time.strftime("%Y%m%d-%H%M%S"))
+        
+        # Each batch runs on a connection of its own, so latency-bound removals overlap
+        connections: "queue.Queue[StorageBackend]" = queue.Queue()
+        backends = [create_storage(target_config, self.config["ssh"]) for _ in range(min(gc_config.get("connections", 4), len(batches)))]
+        for backend in backends:
+            connections.put(backend)
+        
+        def remove_batch(batch: List[str]) -> Tuple[List[str], List[str]]:
+            storage = connections.get()
+            done, errors = [], []
+            try:
+                for path in batch:
+                    try:
+                        if action == "quarantine":
+                            quarantined = posixpath.join(quarantine_dir, path)
+                            storage.makedirs(posixpath.dirname(quarantined))
+                            storage.rename(path, quarantined)
+                        else:
+                            storage.remove(path)
+                        done.append(path)
+                    except FileNotFoundError:
+                        # Removed by someone else meanwhile
+                        done.append(path)
+                    except Exception as e:
+                        errors.append(f"{path}: {e}")
+            finally:
+                connections.put(storage)
+            return done, errors
+        
+        removed: List[str] = []
+        failed: List[str] = []
+        try:
+            with ThreadPoolExecutor(max_workers=len(backends), thread_name_prefix=f"gc-{target.name}") as executor:
+                for done, errors in executor.map(remove_batch, batches):
+                    removed.extend(done)
+                    failed.extend(errors)
+                    logger.info(f"{target.name}: {len(removed) + len(failed)}/{len(paths)} unreferenced files processed")
+        finally:
+            for backend in backends:
+                backend.close()
+        
+        for error in failed:
+            logger.error(f"Could not {action} {error} on {target.name}")
+            self.errors.append(f"GC error on {target.name}: {error}")
+        if action == "quarantine" and removed:
+            logger.info(f"Quarantined {len(removed)} files on {target.name} below {quarantine_dir}")
+        return removed, failed
+    
+    def format_gc_summary(self, report: Dict) -> str:
+        """Summary of a --gc run: unreferenced files per target and what was done with them."""
+        action = "report (dry run)" if report["action"] == "report" else report["action"]
+        summary = f"""
+Garbage Collection Summary
+==========================
+
+Action: {action}
+Grace period: {report['grace_days']} days
+Files referenced by playlists and styles: {report['referenced']}
+"""
+        summary += "\n"
+        for target in report["targets"]:
+            summary += (f"{target['target']}: {len(target['orphans'])} of {target['inventory']} files unreferenced "
+                        f"({target['orphan_bytes'] / (1024 * 1024):.1f} MB), {target['recent']} within the grace period, "
+                        f"{target['removed']} removed\n")
+        
+        if self.errors:
+            summary += "\nErrors:\n"
+            for error in self.errors:
+                summary += f"  ✗ {error}\n"
+        return summary
     
     def process_directory(self, input_dir: str, temp_dir: str) -> None:
         """Process all audio files in the input directory recursively."""
-        input_path = Path(input_dir)
         temp_path = Path(temp_dir)
         temp_path.mkdir(exist_ok=True)
         
-        # Supported audio formats
-        audio_extensions = {'.mp3', '.wav', '.flac', '.aac', '.m4a', '.ogg', '.wma'}
-        
         logger.info(f"Processing directory: {input_dir}")
         
         # Fetch list of remote audio files at the beginning to optimize processing
         logger.info("Fetching remote audio files list for duplicate checking...")
         self.fetch_remote_audio_files()
         
-        for file_path in input_path.rglob('*'):
-            if file_path.suffix.lower() in audio_extensions:
-                self.process_audio_file(str(file_path), str(temp_path))
+        # Files are streamed from the scanner as they are found, so processing starts before the walk ends
+        self.progress = ProgressReporter(0, interval=self.progress_interval) if self.show_progress else None
+        audio_files = scan_audio_files(input_dir, workers=self.scan_workers, sort_by_size=self.sort_by_size,
+                                       on_found=self.progress.add_total if self.progress is not None else None)
+        found = self._process_files(audio_files, str(temp_path))
+        logger.info(f"Processed {found} audio files from {input_dir} ({self.fast_lane_files} already on the server)")
+        
+        self.finish_playlists(self.playlist_specs)
+    
+    def process_manifest(self, temp_dir: str) -> None:
+        """Fill every playlist of a batch manifest in one run.
+        
+        Each unique input file is analysed and uploaded once and added to every playlist whose inputs
+        and tempo filter match it; the remote listing, storage connections and heavy imports are shared,
+        and the changed playlists and styles are published together at the end.
+        """
+        temp_path = Path(temp_dir)
+        temp_path.mkdir(exist_ok=True)
+        
+        logger.info("Fetching remote audio files list for duplicate checking...")
+        self.fetch_remote_audio_files()
+        
+        self.routes = self.route_manifest_inputs()
+        
+        audio_files = list(self.routes)
+        if self.sort_by_size:
+            audio_files.sort(key=os.path.getsize, reverse=True)
+        logger.info(f"Processing {len(audio_files)} unique audio files for {len(self.playlist_specs)} playlists")
+        
+        self.progress = ProgressReporter(len(audio_files), interval=self.progress_interval) if self.show_progress else None
+        self._process_files(audio_files, str(temp_path))
+        logger.info(f"Processed {len(audio_files)} audio files ({self.fast_lane_files} already on the server)")
+        
+        self.finish_playlists(self.playlist_specs)
+    
+    def route_manifest_inputs(self) -> Dict[str, List[PlaylistSpec]]:
+        """Route every input file of the manifest to its playlists; the same file under several inputs appears once."""
+        routes: Dict[str, List[PlaylistSpec]] = {}
+        for spec in self.playlist_specs:
+            matched = 0
+            for file_path in resolve_playlist_inputs(spec, workers=self.scan_workers):
+                specs = routes.setdefault(os.path.realpath(file_path), [])
+                if spec not in specs:
+                    specs.append(spec)
+                    matched += 1
+            logger.info(f"Playlist {spec.style}/{spec.playlist}: {matched} input files")
+        return routes
+    
+    def _process_files(self, audio_files: Iterable[str], temp_dir: str) -> int:
+        """Process audio files longest-expected-first on the track workers; returns the number of files."""
+        if self.job_queue is not None:
+            return self._process_distributed(audio_files, temp_dir)
+        
+        found = 0
+        with self.progress if self.progress is not None else contextlib.nullcontext():
+            scheduler = CostScheduler(lambda input_file: self._process_scheduled(input_file, temp_dir), self.workers)
+            try:
+                for file_path in audio_files:
+                    if self.cancelled():
+                        logger.info("Run cancelled, not queueing further files")
+                        break
+                    found += 1
+                    # Tags are read up front: they drive the cost estimate and the fast lane
+                    metadata = self.extract_metadata(file_path)
+                    if self.is_already_uploaded(metadata):
+                        self.fast_lane_files += 1
+                        self._process_scheduled(file_path, temp_dir, metadata)
+                    else:
+                        scheduler.submit(self.estimate_track_cost(file_path, metadata), file_path)
+            finally:
+                scheduler.close()
+        self.progress = None
+        return found
+    
+    def _process_distributed(self, audio_files: Iterable[str], temp_dir: str) -> int:
+        """Coordinator side of a distributed run: queue tracks for workers and apply their results.
         
+        Tracks already on the server take the fast lane locally. Results are collected while scanning and
+        until every queued job is finished; playlists are only ever updated here. The catalog's fingerprints
+        are shared with the workers first, and the fingerprints and uploads they report are stored in it.
+        """
+        queue_ = cast(JobQueue, self.job_queue)
+        run_id = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+        self.share_fingerprints()
+        found = 0
+        batch: List[Tuple[str, float]] = []
+        with self.progress if self.progress is not None else contextlib.nullcontext():
+            for file_path in audio_files:
+                if self.cancelled():
+                    break
+                found += 1
+                metadata = self.extract_metadata(file_path)
+                if self.is_already_uploaded(metadata):
+                    self.fast_lane_files += 1
+                    self._process_scheduled(file_path, temp_dir, metadata)
+                    continue
+                batch.append((os.path.abspath(file_path), self.estimate_track_cost(file_path, metadata)))
+                if len(batch) >= 100:
+                    queue_.enqueue(run_id, batch)
+                    batch = []
+                    self._apply_queue_results(run_id)
+            if batch:
+                queue_.enqueue(run_id, batch)
+            logger.info(f"Queued tracks of run {run_id} in {queue_.path}, waiting for workers...")
+            
+            dropped = False
+            while True:
+                self._apply_queue_results(run_id)
+                if self.cancelled() and not dropped:
+                    logger.info(f"Run cancelled, {queue_.cancel_run(run_id)} queued tracks dropped")
+                    dropped = True
+                if not queue_.outstanding(run_id):
+                    break
+                time.sleep(self.poll_interval)
+        self.progress = None
+        return found
+    
+    def _apply_queue_results(self, run_id: str) -> None:
+        job_queue = cast(JobQueue, self.job_queue)
+        catalog = self._get_catalog()
+        for path, status, result, error in job_queue.collect(run_id):
+            if status == "failed":
+                logger.error(f"Worker failed to process {path}: {error}")
+                self.errors.append(f"Worker error for {path}: {error}")
+            entry = (result or {}).get("entry")
+            if entry is None:
+                self.skipped_files.append(path)
+            else:
+                if result.get("album_cover") and entry.get("album"):
+                    catalog.add_album_cover(entry["album"], base64.b64decode(result["album_cover"]))
+                self.add_measured_fields(entry)
+                added = self.add_to_playlists(path, entry)
+                for spec in added:
+                    self.processed_files.append({
+                        "original_file": path,
+                        "fingerprint_hash": entry["id"],
+                        "style": spec.style,
+                        "playlist": spec.playlist,
+                        "worker": result.get("worker")
+                    })
+                if not added:
+                    self.skipped_files.append(path)
+            for worker_error in (result or {}).get("errors", []):
+                self.errors.append(f"{result.get('worker')}: {worker_error}")
+            if self.progress is not None:
+                self.progress.file_done()
+        # After the results: workers write these before finishing a job. Mirror uploads that complete
+        # after the last job are collected by the next distributed run.
+        self.merge_shared_fingerprints()
+        for target, remote_path, size in job_queue.collect_remote_objects():
+            catalog.record_remote_object(target, remote_path, size)
+    
+    def finish_playlists(self, specs: List[PlaylistSpec]) -> None:
+        """Recalculate tempo ranges, build covers and style entries, then publish and update tempo indexes."""
         # Recalculate tempo ranges for all playlists after processing
         logger.info("Recalculating tempo ranges for all playlists...")
         self.recalculate_all_playlist_tempos()
-
-        # Generate and upload playlist cover image
-        logger.info("Generating playlist cover image...")
-        self.generate_and_upload_playlist_cover()
-
-        logger.info("Updating styles...")
-        self.update_style_file()
+        
+        catalog = self._get_catalog()
+        for spec in specs:
+            if catalog.get_playlist(spec.playlist) is None:
+                logger.warning(f"Playlist {spec.playlist} has no songs, skipping cover and style update")
+                continue
+            
+            with self._use_playlist(spec):
+                # Generate and upload playlist cover image
+                logger.info(f"Generating playlist cover image for {spec.playlist}...")
+                self.generate_and_upload_playlist_cover()
+                
+                logger.info(f"Updating style {spec.style}...")
+                self.update_style_file()
+        
+        logger.info("Publishing changed playlists and styles...")
+        self.publish_catalog()
+        
+        logger.info("Updating tempo index...")
+        for style in dict.fromkeys(spec.style for spec in specs):
+            self.update_tempo_index(style)
         
         logger.info("Processing complete!")
         
-        # Close SSH connection when done
-        self._close_ssh_connection()
+        # Close SSH connection when done (a daemon keeps it open and only waits for mirror uploads)
+        if self.keep_connections:
+            for target in self._get_targets():
+                target.flush()
+        else:
+            self._close_storage()
+    
+    # Relative cost weights per minute of audio, roughly proportional to measured stage timings
+    COST_WEIGHTS = {
+        "read": 0.05,          # metadata, hashing, upload of an MP3 as-is
+        "fingerprint": 0.3,    # fpcalc decodes the first two minutes
+        "tempo": 2.0,          # librosa beat tracking
+        "transcode": 1.0,      # decode + MP3 encode
+        "decode": 0.4,         # extra decode for silence/peaks/renditions/preview
+        "rendition": 0.6,      # per extra bitrate rendition
+    }
+    
+    def is_already_uploaded(self, metadata: Dict) -> bool:
+        """Whether the tagged fingerprint already exists on the server with all its renditions (the fast lane).
+        
+        A published track missing a rendition is scheduled like a new one, so encoding the rendition
+        doesn't hold up the scan.
+        """
+        fingerprint = metadata.get("acoustid_fingerprint")
+        if not fingerprint:
+            return False
+        fingerprint_hash = self.get_sha1_hash(fingerprint)
+        return f"{fingerprint_hash}.mp3" in self.fetch_remote_audio_files() and not self.missing_renditions(fingerprint_hash)
+    
+    def track_minutes(self, file_path: str, metadata: Dict) -> float:
+        """Length of a track in minutes from its tags."""
+        minutes = (metadata.get("duration") or 0) / 60
+        if not minutes:
+            # No duration in the container: assume ~1 MB per minute (128k MP3)
+            minutes = os.path.getsize(file_path) / (1024 * 1024)
+        return minutes
+    
+    def planned_stages(self, file_path: str, metadata: Dict) -> Dict[str, int]:
+        """Ingest stages a track that is not on the server yet goes through, with how often each runs."""
+        stages = {"read": 1}
+        if not metadata.get("acoustid_fingerprint"):
+            stages["fingerprint"] = 1
+        if not metadata.get("tempo") and not self.skip_no_tempo:
+            stages["tempo"] = 1
+        if Path(file_path).suffix.lower() != '.mp3' or self.silence_mode == "trim" or self.encoding_profile == "streaming":
+            stages["transcode"] = 1
+        if self.needs_decoded_audio():
+            stages["decode"] = 1
+            if self.config["audio"].get("renditions"):
+                stages["rendition"] = len(self.config["audio"]["renditions"])
+        return stages
+    
+    def estimate_track_cost(self, file_path: str, metadata: Dict) -> float:
+        """Expected processing cost of a track from cheap signals: format, duration/size and tags."""
+        cost = sum(self.COST_WEIGHTS[stage] * count for stage, count in self.planned_stages(file_path, metadata).items())
+        return cost * max(self.track_minutes(file_path, metadata), 0.1)
     
-    def process_audio_file(self, input_file: str, temp_dir: str) -> None:
-        """Process a single audio file."""
+    def _process_scheduled(self, input_file: str, temp_dir: str, metadata: Optional[Dict] = None) -> None:
+        # Queued files of a cancelled run are dropped; files already being processed finish
+        if not self.cancelled():
+            self.process_audio_file(input_file, temp_dir, metadata)
+        if self.progress is not None:
+            self.progress.file_done()
+    
+    @instrumented("process_audio_file", per_file=True, profile=False)
+    def process_audio_file(self, input_file: str, temp_dir: str, metadata: Optional[Dict] = None) -> None:
+        """Process a single audio file. Metadata already read by the scheduler can be passed in.
+        
+        The track's fingerprint is claimed while it is processed, and its temp files go to a directory
+        of its own, so parallel workers never race on the same track or temp file.
+        """
+        claimed = None
+        job_dir = None
         try:
-            logger.info(f"Processing: {input_file}")
+            logger.debug(f"Processing: {input_file}")
             
             # Extract metadata first
-            metadata = self.extract_metadata(input_file)
+            if metadata is None:
+                metadata = self.extract_metadata(input_file)
             
             # Get or calculate AcoustID fingerprint early, before heavy processing
             existing_fingerprint = metadata.get("acoustid_fingerprint")
@@ -1313,10 +4717,10 @@ class PlaylistGenerator:
             
             if existing_fingerprint:
                 fingerprint = existing_fingerprint
-                logger.info(f"Using existing AcoustID fingerprint for {input_file}")
+                logger.debug(f"Using existing AcoustID fingerprint for {input_file}")
             else:
                 # Need to calculate fingerprint - do this early
-                logger.info(f"No existing AcoustID fingerprint found for {input_file}, calculating...")
+                logger.debug(f"No existing AcoustID fingerprint found for {input_file}, calculating...")
                 fingerprint = self.get_acoustid_fingerprint(input_file, None, None)
                 if not fingerprint:
                     logger.error(f"Failed to generate AcoustID fingerprint for {input_file}")
@@ -1326,10 +4730,28 @@ class PlaylistGenerator:
             fingerprint_hash = self.get_sha1_hash(fingerprint)
             remote_filename = f"{fingerprint_hash}.mp3"
             
+            # Duplicate inputs processed in parallel wait here for the first one, then link to or skip it
+            self.claim_fingerprint(fingerprint_hash, fingerprint, metadata.get("duration"))
+            claimed = fingerprint_hash
+            job_dir = tempfile.mkdtemp(prefix=f"{fingerprint_hash}.", dir=temp_dir)
+            temp_dir = job_dir
+            
             # Check if file with this AcoustID already exists on remote server
             remote_audio_files = self.fetch_remote_audio_files()
-            if remote_filename in remote_audio_files:
-                logger.info(f"File with AcoustID {fingerprint_hash} already exists on server, skipping processing and upload")
+            already_uploaded = remote_filename in remote_audio_files
+            duplicate_of = None
+            if already_uploaded:
+                self.index_fingerprint(fingerprint_hash, fingerprint, metadata.get("duration"))
+            else:
+                # Another rip or encode of a published recording is linked to its file instead of uploaded
+                duplicate_of = self.find_near_duplicate(input_file, fingerprint, fingerprint_hash, metadata.get("duration"))
+                if duplicate_of is not None:
+                    fingerprint_hash = duplicate_of
+                    remote_filename = f"{duplicate_of}.mp3"
+                    already_uploaded = True
+            
+            if already_uploaded:
+                logger.debug(f"File with AcoustID {fingerprint_hash} already exists on server, skipping processing and upload")
                 
                 # Still add to playlist even if file exists on server
                 # But first validate basic metadata requirements
@@ -1343,18 +4765,34 @@ class PlaylistGenerator:
                 audio_path = self.config["ssh"].get("audio_path", "public/audio")
                 audio_url = f"{base_url.rstrip('/')}/{audio_path.strip('/')}/{remote_filename}"
                 
-                # Create playlist entry with minimal metadata
+                # Renditions added to the config since the track was published are encoded from this file
+                # (not from another rip linked to it)
+                added_renditions = self.backfill_renditions(input_file, fingerprint_hash, temp_dir) if duplicate_of is None else []
+                
+                # Reference renditions that were published by earlier runs
+                existing_renditions = [r for r in self.config["audio"].get("renditions", [])
+                                       if r in added_renditions or self.get_rendition_filename(fingerprint_hash, r) in remote_audio_files]
+                if existing_renditions:
+                    metadata["renditions"] = self.create_rendition_entries(fingerprint_hash, existing_renditions)
+                if f"{fingerprint_hash}.preview.mp3" in remote_audio_files:
+                    metadata["preview"] = self.get_audio_url(f"{fingerprint_hash}.preview.mp3")
+                
+                # Create playlist entry from the tags, plus what earlier runs measured (queue workers: the coordinator adds it)
                 song_entry = self.create_playlist_entry(metadata, fingerprint_hash, audio_url)
+                if self.entry_sink is None:
+                    self.add_measured_fields(song_entry)
+                if metadata.get("cover_data") and metadata.get("album"):
+                    self._get_catalog().add_album_cover(metadata["album"], metadata["cover_data"])
                 
                 # Update playlist file
-                if self.update_playlist_file(song_entry):
-                    logger.info(f"Added existing file {input_file} to playlist")
+                if self.add_to_playlists(input_file, song_entry):
+                    logger.debug(f"Added existing file {input_file} to playlist")
                 
                 self.skipped_files.append(input_file)
                 return
             
             # File doesn't exist on server, proceed with full processing
-            logger.info(f"File {remote_filename} not found on server, proceeding with processing...")
+            logger.debug(f"File {remote_filename} not found on server, proceeding with processing...")
             
             # Handle missing tempo
             if not metadata.get("tempo"):
@@ -1364,12 +4802,13 @@ class PlaylistGenerator:
                     return
                 else:
                     # Try to measure tempo
-                    logger.info(f"No tempo found in metadata for {input_file}, attempting to measure...")
-                    measured_tempo = self.measure_tempo(input_file)
+                    logger.debug(f"No tempo found in metadata for {input_file}, attempting to measure...")
+                    measured_tempo, first_beat = self.analyze_tempo(input_file)
                     
                     if measured_tempo:
                         # Update metadata with measured tempo
                         metadata["tempo"] = measured_tempo
+                        metadata["first_beat"] = first_beat
                         
                         # Save tempo back to the original file
                         if self.save_tempo_to_metadata(input_file, measured_tempo):
@@ -1377,7 +4816,7 @@ class PlaylistGenerator:
                                 "file": input_file,
                                 "measured_tempo": measured_tempo
                             })
-                            logger.info(f"Successfully measured and saved tempo ({measured_tempo} BPM) for {input_file}")
+                            logger.debug(f"Successfully measured and saved tempo ({measured_tempo} BPM) for {input_file}")
                         else:
                             logger.warning(f"Measured tempo ({measured_tempo} BPM) but failed to save to {input_file}")
                     else:
@@ -1389,37 +4828,73 @@ class PlaylistGenerator:
             if not self.validate_metadata(metadata, input_file):
                 return
             
-            # Convert to MP3 if necessary
+            # Decode once for all sample-based stages, starting with silence detection
+            audio = self.load_audio(input_file) if self.needs_decoded_audio() else None
+            trim_range = None
+            if audio is not None and self.silence_mode:
+                trim_range = self.apply_silence_bounds(audio, metadata)
+                if trim_range:
+                    audio = audio[trim_range[0]:trim_range[1]]
+            
+            waveform_points = self.config["audio"].get("waveform_points", 0)
+            if audio is not None and waveform_points:
+                metadata["peaks"] = self.compute_waveform_peaks(audio, waveform_points)
+            
+            # Save fingerprint to original file if it was calculated, before an as-is MP3 is copied for upload
+            if not existing_fingerprint:
+                self.save_acoustid_fingerprint_to_file(input_file, fingerprint)
+            
+            # Convert to MP3 if necessary (trimming always requires re-encoding)
             file_path = Path(input_file)
-            if file_path.suffix.lower() != '.mp3':
-                temp_mp3_path = os.path.join(temp_dir, f"{file_path.stem}.mp3")
-                if not self.convert_to_mp3(input_file, temp_mp3_path):
+            if file_path.suffix.lower() != '.mp3' or trim_range:
+                temp_mp3_path = os.path.join(temp_dir, f"{fingerprint_hash}.mp3")
+                if not self.convert_to_mp3(input_file, temp_mp3_path, audio):
                     return
                 working_file = temp_mp3_path
             else:
                 working_file = input_file
-            
-            # Save fingerprint to original file if it was calculated
-            if not existing_fingerprint:
-                self.save_acoustid_fingerprint_to_file(input_file, fingerprint)
+                # Streaming profile: MP3s that would be uploaded as-is get rewritten for fast start
+                if self.encoding_profile == "streaming":
+                    optimized_path = os.path.join(temp_dir, f"{fingerprint_hash}.stream.mp3")
+                    if self.optimize_mp3_for_streaming(input_file, optimized_path):
+                        working_file = optimized_path
             
             # Upload audio file to server
-            if not self.upload_file_ssh(working_file, remote_filename, "audio"):
+            if not self.upload_file(working_file, remote_filename, "audio"):
                 return
+            self.index_fingerprint(fingerprint_hash, fingerprint, metadata.get("duration"))
+            
+            # Encode and upload additional bitrate renditions from a single decode
+            if audio is not None and self.config["audio"].get("renditions"):
+                uploaded_renditions = []
+                for rendition, rendition_path in self.create_renditions(audio, fingerprint_hash, temp_dir):
+                    if self.upload_file(rendition_path, os.path.basename(rendition_path), "audio"):
+                        uploaded_renditions.append(rendition)
+                    os.remove(rendition_path)
+                metadata["renditions"] = self.create_rendition_entries(fingerprint_hash, uploaded_renditions)
+            
+            # Short preview clip starting at the drop
+            if audio is not None and self.config["audio"].get("preview_seconds"):
+                preview = self.create_preview_clip(audio, fingerprint_hash, temp_dir)
+                if preview:
+                    preview_path, preview_start_ms = preview
+                    if self.upload_file(preview_path, os.path.basename(preview_path), "audio"):
+                        metadata["preview"] = self.get_audio_url(os.path.basename(preview_path))
+                        metadata["preview_start"] = round(preview_start_ms / 1000, 1)
+                    os.remove(preview_path)
             
             # Handle cover image
             cover_url = None
             if metadata.get("cover_data"):
                 # Store cover data for playlist cover generation
-                album = metadata.get("album")
-                if album and album not in self.album_covers:
-                    self.album_covers[album] = metadata["cover_data"]
+                if metadata.get("album"):
+                    self._get_catalog().add_album_cover(metadata["album"], metadata["cover_data"])
                 
                 cover_filename = f"{fingerprint_hash}.jpg"
                 cover_path = self.save_cover_image(metadata["cover_data"], cover_filename, temp_dir)
                 if cover_path:
                     # Upload cover image
-                    if self.upload_file_ssh(cover_path, cover_filename, "audio"):
+                    if self.upload_file(cover_path, cover_filename, "audio"):
                         # Use base URL from config
                         base_url = self.config.get("urls", {}).get("base_url", f"https://{self.config['ssh']['hostname']}")
                         audio_path = self.config["ssh"].get("audio_path", "public/audio")
@@ -1435,16 +4910,16 @@ class PlaylistGenerator:
             song_entry = self.create_playlist_entry(metadata, fingerprint_hash, audio_url, cover_url)
             
             # Update playlist file
-            if self.update_playlist_file(song_entry):
-                # Update style file
+            added = self.add_to_playlists(input_file, song_entry)
+            for spec in added:
                 self.processed_files.append({
                     "original_file": input_file,
                     "fingerprint_hash": fingerprint_hash,
-                    "style": self.style,
-                    "playlist": self.playlist_name,
+                    "style": spec.style,
+                    "playlist": spec.playlist,
                     "metadata": metadata
                 })
-            else:
+            if not added:
                 self.skipped_files.append(input_file)
             
             # Clean up temporary file
@@ -1454,6 +4929,425 @@ class PlaylistGenerator:
         except Exception as e:
             logger.error(f"Error processing {input_file}: {e}")
             self.errors.append(f"Processing error for {input_file}: {e}")
+        finally:
+            if job_dir is not None:
+                shutil.rmtree(job_dir, ignore_errors=True)
+            if claimed is not None:
+                self.release_fingerprint(claimed)
+    
+    # Columns of the --analyze-only report
+    ANALYSIS_FIELDS = ["file", "fingerprint", "tempo", "tempo_status", "loudness_lufs", "replaygain", "replaygain_status", "changed"]
+    
+    def analyze_library(self, input_dir: str, report_path: str, loudness: bool = False) -> List[Dict]:
+        """Backfill fingerprint, tempo (and optionally ReplayGain) tags across a library without touching the server.
+        
+        Files run longest-expected-first on the track workers; later ingests of the tagged files take the
+        cheap path (existing fingerprint and tempo, fast lane when already published). Writes a report of
+        every file to report_path (CSV for a .csv path, JSON otherwise) and returns its rows.
+        """
+        rows: List[Dict] = []
+        rows_lock = threading.Lock()
+        
+        def analyze(job: Tuple[str, Dict]) -> None:
+            row = self.analyze_file(job[0], job[1], loudness)
+            with rows_lock:
+                rows.append(row)
+            if self.progress is not None:
+                self.progress.file_done()
+        
+        self.progress = ProgressReporter(0, interval=self.progress_interval) if self.show_progress else None
+        with self.progress if self.progress is not None else contextlib.nullcontext():
+            scheduler = CostScheduler(analyze, self.workers)
+            try:
+                for file_path in scan_audio_files(input_dir, workers=self.scan_workers, sort_by_size=self.sort_by_size):
+                    if self.progress is not None:
+                        self.progress.add_total()
+                    metadata = self.extract_metadata(file_path)
+                    cost = self.COST_WEIGHTS["read"]
+                    if not metadata.get("acoustid_fingerprint"):
+                        cost += self.COST_WEIGHTS["fingerprint"]
+                    if not metadata.get("tempo") and not self.skip_no_tempo:
+                        cost += self.COST_WEIGHTS["tempo"]
+                    if loudness and not metadata.get("replaygain_track_gain"):
+                        cost += self.COST_WEIGHTS["decode"]
+                    scheduler.submit(cost * max((metadata.get("duration") or 0) / 60, 0.1), (file_path, metadata))
+            finally:
+                scheduler.close()
+        self.progress = None
+        
+        rows.sort(key=lambda row: row["file"])
+        self.write_analysis_report(rows, report_path)
+        return rows
+    
+    @instrumented("analyze_file", per_file=True, profile=False)
+    def analyze_file(self, input_file: str, metadata: Dict, loudness: bool = False) -> Dict:
+        """Compute the fingerprint, tempo and loudness a file's tags lack and write them back; returns its report row.
+        
+        Statuses: tagged (already present), written, unsaved (computed but the tag write failed),
+        failed (could not be computed), skipped (not requested).
+        """
+        row: Dict[str, Any] = {"file": input_file, "fingerprint": "tagged", "tempo": metadata.get("tempo"),
+                               "tempo_status": "tagged", "loudness_lufs": None,
+                               "replaygain": metadata.get("replaygain_track_gain"), "replaygain_status": "tagged"}
+        try:
+            if not metadata.get("acoustid_fingerprint"):
+                row["fingerprint"] = "failed"
+                try:
+                    _, fingerprint = acoustid.fingerprint_file(input_file)
+                except Exception as e:
+                    logger.error(f"Error generating fingerprint for {input_file}: {e}")
+                    self.errors.append(f"Fingerprint error for {input_file}: {e}")
+                    fingerprint = None
+                if fingerprint is not None:
+                    saved = self.save_acoustid_fingerprint_to_file(input_file, fingerprint.decode('utf-8'))
+                    row["fingerprint"] = "written" if saved else "unsaved"
+            
+            if not metadata.get("tempo"):
+                if self.skip_no_tempo:
+                    row["tempo_status"] = "skipped"
+                else:
+                    tempo, _ = self.analyze_tempo(input_file)
+                    row["tempo"] = tempo
+                    if not tempo:
+                        row["tempo_status"] = "failed"
+                    elif self.save_tempo_to_metadata(input_file, tempo):
+                        row["tempo_status"] = "written"
+                        self.tempo_measured_files.append({"file": input_file, "measured_tempo": tempo})
+                    else:
+                        row["tempo_status"] = "unsaved"
+            
+            if not loudness:
+                row["replaygain_status"] = "skipped" if not row["replaygain"] else "tagged"
+            elif not row["replaygain"]:
+                row["loudness_lufs"] = self.measure_loudness(input_file)
+                if row["loudness_lufs"] is None:
+                    row["replaygain_status"] = "failed"
+                else:
+                    gain = self.REPLAYGAIN_REFERENCE_LUFS - row["loudness_lufs"]
+                    row["replaygain"] = f"{gain:.2f} dB"
+                    row["replaygain_status"] = "written" if self.save_replaygain_to_file(input_file, gain) else "unsaved"
+        except Exception as e:
+            logger.error(f"Error analyzing {input_file}: {e}")
+            self.errors.append(f"Analysis error for {input_file}: {e}")
+        
+        row["changed"] = "written" in (row["fingerprint"], row["tempo_status"], row["replaygain_status"])
+        return row
+    
+    def write_analysis_report(self, rows: List[Dict], report_path: str) -> None:
+        """Write --analyze-only results as CSV (for a .csv path) or JSON."""
+        if os.path.dirname(report_path):
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, 'w', newline='') as f:
+            if report_path.lower().endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=self.ANALYSIS_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                json.dump(rows, f, indent=2)
+        logger.info(f"Analysis report written to {report_path}")
+    
+    def format_analysis_summary(self, rows: List[Dict]) -> str:
+        """Summary of an --analyze-only run: counts per tag and status, and errors."""
+        summary = f"""
+Tag Analysis Summary
+====================
+
+Files analyzed: {len(rows)}
+Files with new tags: {sum(1 for row in rows if row['changed'])}
+Metadata errors: {len(self.metadata_errors)}
+Processing errors: {len(self.errors)}
+"""
+        summary += "\n"
+        for label, column in (("Fingerprint", "fingerprint"), ("Tempo", "tempo_status"), ("ReplayGain", "replaygain_status")):
+            counts: Dict[str, int] = {}
+            for row in rows:
+                counts[row[column]] = counts.get(row[column], 0) + 1
+            summary += f"{label}: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) + "\n"
+        
+        if self.errors or self.metadata_errors:
+            summary += "\nErrors:\n"
+            for error in self.metadata_errors + self.errors:
+                summary += f"  ✗ {error}\n"
+        
+        if self.metrics.enabled:
+            summary += self.format_metrics_summary()
+        return summary
+    
+    # Benchmark stages (benchmark_playlist.py results) that calibrate the --plan CPU rates
+    CALIBRATION_STAGES = {
+        "read": "extract_metadata",
+        "fingerprint": "fingerprint",
+        "tempo": "measure_tempo",
+        "transcode": "convert_to_mp3",
+    }
+    
+    # Plan statuses whose files are handed to the track workers by --execute-plan
+    PLAN_RUN_STATUSES = ("fast_lane", "linked", "process")
+    
+    def load_plan_rates(self, calibration_path: Optional[str] = None) -> Dict[str, float]:
+        """CPU seconds per minute of audio for each ingest stage.
+        
+        Without a calibration file the cost weights are taken as-is. A benchmark_playlist.py result
+        calibrates the stages it timed without errors from their mean time per corpus minute; decode and rendition,
+        which the benchmark doesn't time on their own, are scaled with the calibrated transcode rate.
+        Raises ValueError for a file that isn't a benchmark result.
+        """
+        rates = dict(self.COST_WEIGHTS)
+        if not calibration_path:
+            return rates
+        
+        with open(calibration_path, 'r') as f:
+            results = json.load(f)
+        corpus_minutes = (results.get("corpus", {}).get("duration_s") or 0) / 60
+        if not corpus_minutes or not results.get("stages"):
+            raise ValueError(f"{calibration_path} is not a benchmark result with stage timings")
+        for stage, benchmark_stage in self.CALIBRATION_STAGES.items():
+            timing = results["stages"].get(benchmark_stage, {})
+            if timing.get("errors"):
+                # Failed calls return early, so the mean understates the stage
+                logger.warning(f"Benchmark stage {benchmark_stage} had {timing['errors']} errors, using the default {stage} rate")
+                continue
+            if timing.get("mean_s"):
+                rates[stage] = timing["mean_s"] / corpus_minutes
+        scale = rates["transcode"] / self.COST_WEIGHTS["transcode"]
+        for stage in ("decode", "rendition"):
+            rates[stage] = self.COST_WEIGHTS[stage] * scale
+        return rates
+    
+    @staticmethod
+    def encoded_bytes(seconds: float, bitrate) -> int:
+        """Size of `seconds` of audio encoded at a bitrate like "128k"."""
+        return int(seconds * int(str(bitrate).rstrip("kK")) * 1000 / 8)
+    
+    def estimate_upload_bytes(self, file_path: str, metadata: Dict, stages: Dict[str, int]) -> int:
+        """Bytes a processed track puts on each publish target: audio, renditions, preview and cover."""
+        encoded_bytes = self.encoded_bytes
+        audio_config = self.config["audio"]
+        seconds = metadata.get("duration") or self.track_minutes(file_path, metadata) * 60
+        if "transcode" in stages:
+            upload_bytes = encoded_bytes(seconds, audio_config["bitrate"])
+        else:
+            upload_bytes = os.path.getsize(file_path)
+        if "decode" in stages:
+            for rendition in audio_config.get("renditions", []):
+                upload_bytes += encoded_bytes(seconds, rendition["bitrate"])
+            if audio_config.get("preview_seconds"):
+                upload_bytes += encoded_bytes(min(audio_config["preview_seconds"], seconds), audio_config.get("preview_bitrate", "96k"))
+        if metadata.get("cover_data"):
+            upload_bytes += len(metadata["cover_data"])
+        return upload_bytes
+    
+    def plan_run(self, input_dir: Optional[str] = None, calibration_path: Optional[str] = None) -> Dict:
+        """Plan a run from cheap checks only: tags, the remote listing and the fingerprint index.
+        
+        Nothing is decoded, written or uploaded. Every input file gets a status (fast_lane, linked,
+        process, invalid for files that will fail validate_metadata, skip), the stages it goes through,
+        its estimated CPU time and upload size, and its playlists, so --execute-plan can run the plan
+        without scanning the inputs again. Without input_dir the manifest inputs are planned.
+        """
+        rates = self.load_plan_rates(calibration_path)
+        
+        logger.info("Fetching remote audio files list for duplicate checking...")
+        remote_audio_files = set(self.fetch_remote_audio_files())
+        if input_dir is None:
+            routes = self.route_manifest_inputs()
+        else:
+            routes = {os.path.realpath(file_path): self.playlist_specs[:1]
+                      for file_path in scan_audio_files(input_dir, workers=self.scan_workers)}
+        logger.info(f"Planning {len(routes)} audio files for {len(self.playlist_specs)} playlists")
+        
+        files = []
+        for file_path, specs in routes.items():
+            try:
+                metadata = self.extract_metadata(file_path)
+                fingerprint = metadata.get("acoustid_fingerprint")
+                fingerprint_hash = self.get_sha1_hash(fingerprint) if fingerprint else None
+                missing = self.missing_metadata_fields(metadata)
+                minutes = self.track_minutes(file_path, metadata)
+                stages = {"read": 1}
+                upload_bytes = 0
+                
+                if fingerprint_hash and f"{fingerprint_hash}.mp3" in remote_audio_files:
+                    status = "fast_lane"
+                    backfill = self.missing_renditions(fingerprint_hash)
+                    if backfill:
+                        stages.update(decode=1, rendition=len(backfill))
+                        seconds = metadata.get("duration") or minutes * 60
+                        upload_bytes = sum(self.encoded_bytes(seconds, rendition["bitrate"]) for rendition in backfill)
+                elif fingerprint_hash and self.match_near_duplicate(file_path, fingerprint, fingerprint_hash, metadata.get("duration")):
+                    status = "linked"
+                elif "tempo" in missing and self.skip_no_tempo:
+                    status = "skip"
+                elif [field for field in missing if field != "tempo"]:
+                    # Missing tempo is measured; anything else fails validation after fingerprinting
+                    status = "invalid"
+                else:
+                    status = "process"
+                    stages = self.planned_stages(file_path, metadata)
+                    upload_bytes = self.estimate_upload_bytes(file_path, metadata, stages)
+                if status in ("fast_lane", "linked") and [field for field in missing if field in ("title", "artist", "album")]:
+                    status = "skip"
+                
+                file_stat = os.stat(file_path)
+                files.append({
+                    "file": file_path,
+                    "playlists": [self.playlist_specs.index(spec) for spec in specs],
+                    "size": file_stat.st_size,
+                    "mtime": file_stat.st_mtime,
+                    "minutes": round(minutes, 2),
+                    "status": status,
+                    "stages": stages,
+                    "missing": missing,
+                    "cpu_s": round(sum(rates[stage] * count for stage, count in stages.items()) * max(minutes, 0.1), 3),
+                    "upload_bytes": upload_bytes
+                })
+            except Exception as e:
+                logger.error(f"Error planning {file_path}: {e}")
+                self.errors.append(f"Planning error for {file_path}: {e}")
+        files.sort(key=lambda entry: entry["cpu_s"], reverse=True)
+        
+        statuses: Dict[str, int] = {}
+        stage_files: Dict[str, int] = {}
+        cpu_seconds: Dict[str, float] = {}
+        for entry in files:
+            statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+            for stage, count in entry["stages"].items():
+                stage_files[stage] = stage_files.get(stage, 0) + count
+                cpu_seconds[stage] = cpu_seconds.get(stage, 0.0) + rates[stage] * count * max(entry["minutes"], 0.1)
+        targets = len(self._get_targets())
+        upload_bytes = sum(entry["upload_bytes"] for entry in files)
+        cpu_total = sum(cpu_seconds.values())
+        
+        return {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "input_dir": input_dir,
+            "playlists": [dict(spec._asdict(), inputs=list(spec.inputs)) for spec in self.playlist_specs],
+            "options": {"skip_no_tempo": self.skip_no_tempo, "silence_mode": self.silence_mode,
+                        "encoding_profile": self.encoding_profile},
+            "rates": {stage: round(rate, 4) for stage, rate in rates.items()},
+            "calibration": calibration_path,
+            "totals": {
+                "files": len(files),
+                "statuses": statuses,
+                "audio_minutes": round(sum(entry["minutes"] for entry in files if entry["status"] == "process"), 1),
+                "stages": stage_files,
+                "cpu_seconds": {stage: round(seconds, 1) for stage, seconds in cpu_seconds.items()},
+                "cpu_total_s": round(cpu_total, 1),
+                "wall_estimate_s": round(cpu_total / max(self.workers, 1), 1),
+                "workers": self.workers,
+                "upload_bytes": upload_bytes,
+                "targets": targets,
+                "upload_bytes_all_targets": upload_bytes * targets
+            },
+            "files": files
+        }
+    
+    def write_report(self, report: Dict, report_path: str, kind: str = "Report") -> None:
+        """Write a --plan or --gc result as JSON."""
+        if os.path.dirname(report_path):
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"{kind} written to {report_path}")
+    
+    def format_plan_summary(self, plan: Dict) -> str:
+        """Summary of a --plan run: files per status, stage counts, CPU time and upload volume."""
+        totals = plan["totals"]
+        statuses = totals["statuses"]
+        summary = f"""
+Run Plan
+========
+
+Files planned: {totals['files']}
+Already on the server: {statuses.get('fast_lane', 0)} ({statuses.get('linked', 0)} more linked to near-duplicates)
+To process: {statuses.get('process', 0)} ({totals['audio_minutes']} minutes of audio)
+Will fail metadata validation: {statuses.get('invalid', 0)}
+Skipped: {statuses.get('skip', 0)}
+Planning errors: {len(self.errors)}
+"""
+        summary += f"\nStages (CPU rates {'calibrated from ' + plan['calibration'] if plan['calibration'] else 'uncalibrated'}):\n"
+        summary += f"  {'stage':<12} {'runs':>6} {'cpu s':>9}\n"
+        for stage, count in sorted(totals["stages"].items(), key=lambda item: totals["cpu_seconds"][item[0]], reverse=True):
+            summary += f"  {stage:<12} {count:>6} {totals['cpu_seconds'][stage]:>9.1f}\n"
+        summary += (f"\nEstimated CPU time: {totals['cpu_total_s']:.0f}s "
+                    f"(~{totals['wall_estimate_s']:.0f}s with {totals['workers']} workers)\n")
+        summary += (f"Estimated upload: {totals['upload_bytes'] / (1024 * 1024):.1f} MB to each of "
+                    f"{totals['targets']} targets ({totals['upload_bytes_all_targets'] / (1024 * 1024):.1f} MB total)\n")
+        
+        invalid = [entry for entry in plan["files"] if entry["status"] == "invalid"]
+        if invalid:
+            summary += "\nFiles failing metadata validation:\n"
+            for entry in invalid:
+                summary += f"  ✗ {entry['file']}: missing {', '.join(entry['missing'])}\n"
+        
+        if self.errors:
+            summary += "\nErrors:\n"
+            for error in self.errors:
+                summary += f"  ✗ {error}\n"
+        return summary
+    
+    def execute_plan(self, plan: Dict, temp_dir: str) -> None:
+        """Run a --plan result without scanning the inputs again.
+        
+        Files planned as fast_lane, linked or process go to the track workers with their planned
+        playlists; invalid and skipped files are left out. Tags are still read per file, so a file that
+        changed since planning takes the path its current tags call for.
+        """
+        temp_path = Path(temp_dir)
+        temp_path.mkdir(exist_ok=True)
+        
+        logger.info("Fetching remote audio files list for duplicate checking...")
+        self.fetch_remote_audio_files()
+        
+        self.routes = {}
+        for entry in plan["files"]:
+            if entry["status"] not in self.PLAN_RUN_STATUSES:
+                continue
+            file_path = entry["file"]
+            if not os.path.isfile(file_path):
+                logger.error(f"Planned file {file_path} no longer exists")
+                self.errors.append(f"Planned file missing: {file_path}")
+                continue
+            file_stat = os.stat(file_path)
+            if file_stat.st_size != entry["size"] or file_stat.st_mtime != entry["mtime"]:
+                logger.info(f"{file_path} changed since planning, processing it as its tags are now")
+            self.routes[file_path] = [self.playlist_specs[i] for i in entry["playlists"]]
+        
+        audio_files = list(self.routes)
+        logger.info(f"Executing plan from {plan['created']}: {len(audio_files)} audio files for {len(self.playlist_specs)} playlists")
+        self.progress = ProgressReporter(len(audio_files), interval=self.progress_interval) if self.show_progress else None
+        self._process_files(audio_files, str(temp_path))
+        logger.info(f"Processed {len(audio_files)} audio files ({self.fast_lane_files} already on the server)")
+        
+        self.finish_playlists(self.playlist_specs)
+    
+    def format_metrics_summary(self, top_n: int = 10) -> str:
+        """Per-stage timing table and the slowest files for the summary."""
+        data = self.metrics.to_dict()
+        summary = f"\nStage Timings (peak RSS: {data['peak_rss_kb'] / 1024:.0f} MB):\n"
+        summary += f"  {'stage':<20} {'calls':>6} {'total s':>9} {'p50 s':>8} {'p95 s':>8} {'cpu s':>8} {'MB':>8}\n"
+        for name, stage in sorted(data["stages"].items(), key=lambda item: item[1]["wall_total_s"], reverse=True):
+            megabytes = sum(stage["bytes"].values()) / (1024 * 1024)
+            summary += (f"  {name:<20} {stage['count']:>6} {stage['wall_total_s']:>9.2f} "
+                        f"{stage['wall_p50_s'] or 0:>8.3f} {stage['wall_p95_s'] or 0:>8.3f} "
+                        f"{stage['cpu_total_s']:>8.2f} {megabytes:>8.1f}\n")
+        if not data["child_cpu"]:
+            summary += f"  (cpu s excludes ffmpeg/fpcalc child processes with {self.workers} track workers)\n"
+        
+        slowest = self.metrics.slowest_files(top_n)
+        if slowest:
+            summary += f"\nSlowest Files (top {len(slowest)}):\n"
+            for file_path, seconds in slowest:
+                summary += f"  ⏱ {seconds:8.2f}s  {file_path}\n"
+        
+        return summary
+    
+    def write_metrics(self) -> None:
+        """Write the metrics files when --metrics-dir is set."""
+        if not self.metrics.enabled or not self.metrics_dir:
+            return
+        json_path, prom_path = self.metrics.write(self.metrics_dir)
+        logger.info(f"Metrics written to {json_path} and {prom_path}")
     
     def generate_summary(self) -> str:
         """Generate a summary report of the processing."""
@@ -1466,16 +5360,51 @@ Files skipped (duplicates): {len(self.skipped_files)}
 Tempo measurements performed: {len(self.tempo_measured_files)}
 Metadata errors: {len(self.metadata_errors)}
 Processing errors: {len(self.errors)}
-
-Style: {self.style}
-Playlist: {self.playlist_name}
+Near-duplicates linked: {len(self.near_duplicates)}
 """
         
+        if len(self.playlist_specs) > 1:
+            summary += "\nPlaylists:\n"
+            for spec in self.playlist_specs:
+                added = sum(1 for entry in self.processed_files if entry["playlist"] == spec.playlist)
+                summary += f"  ♫ {spec.style}/{spec.playlist}: {added} tracks added\n"
+        else:
+            summary += f"\nStyle: {self.style}\nPlaylist: {self.playlist_name}\n"
+        
         if self.tempo_measured_files:
             summary += "\nTempo Measurements:\n"
             for entry in self.tempo_measured_files:
                 summary += f"  ♪ {entry['file']}: {entry['measured_tempo']} BPM\n"
         
+        if self.near_duplicates:
+            summary += "\nNear-Duplicates Linked:\n"
+            for entry in self.near_duplicates:
+                summary += f"  ≈ {entry['file']}: {entry['id']} → {entry['duplicate_of']} (similarity {entry['similarity']:.3f})\n"
+        
+        if self.metrics.enabled:
+            summary += self.format_metrics_summary()
+        
+        upload = self.bandwidth.stats()
+        if upload["bytes"]:
+            cap = f"{upload['configured_kbps']:.0f} kbit/s configured" if upload["configured_kbps"] else "no cap"
+            summary += (f"\nUpload Throughput: {upload['bytes'] / (1024 * 1024):.1f} MB in {upload['busy_s']:.1f}s of uploading, "
+                        f"{upload['achieved_kbps'] or 0:.0f} kbit/s achieved ({cap})\n")
+        
+        if self.targets and len(self.targets) > 1:
+            summary += "\nPublish Targets:\n"
+            for target in self.targets:
+                megabytes = target.storage.bytes_put / (1024 * 1024)
+                rate = megabytes / target.seconds if target.seconds else 0.0
+                summary += (f"  {'✓' if not target.failed else '✗'} {target.name}: {target.uploaded} uploaded, {target.skipped} skipped, "
+                            f"{target.failed} failed, {megabytes:.1f} MB in {target.seconds:.1f}s ({rate:.2f} MB/s)\n")
+        
+        if self.encoding_savings:
+            total_saved = sum(e["original_bytes"] - e["optimized_bytes"] for e in self.encoding_savings)
+            summary += f"\nStreaming Profile (total saved: {total_saved / 1024:.1f} KB):\n"
+            for entry in self.encoding_savings:
+                saved = entry["original_bytes"] - entry["optimized_bytes"]
+                summary += f"  ↓ {entry['file']}: {entry['original_bytes']} → {entry['optimized_bytes']} bytes ({saved / 1024:.1f} KB saved)\n"
+        
         if self.metadata_errors:
             summary += "\nMetadata Errors:\n"
             for error in self.metadata_errors:
@@ -1489,6 +5418,398 @@ Playlist: {self.playlist_name}
         return summary
 
 
+class IngestJob:
+    """An ingest request queued on the daemon: a directory for one playlist, or manifest playlists."""
+    
+    def __init__(self, job_id: str, playlists: List[PlaylistSpec], input_dir: Optional[str] = None):
+        self.id = job_id
+        self.playlists = playlists
+        self.input_dir = input_dir
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.cancel_event = threading.Event()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.summary: Optional[str] = None
+        self.counts: Dict[str, int] = {}
+        self.error: Optional[str] = None
+    
+    def to_dict(self, progress: Optional[Dict] = None) -> Dict:
+        job = {
+            "id": self.id,
+            "status": self.status,
+            "input_dir": self.input_dir,
+            "playlists": [f"{spec.style}/{spec.playlist}" for spec in self.playlists],
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "counts": self.counts,
+            "summary": self.summary,
+            "error": self.error
+        }
+        if progress is not None:
+            job["progress"] = progress
+        return job
+
+
+class IngestDaemon:
+    """Keeps a PlaylistGenerator warm and runs ingest jobs from a queue, one at a time.
+    
+    Imports, storage connections, the remote listing, the catalog and the fingerprint index stay loaded
+    between jobs, so a small ingest only pays for its own tracks. Tracks within a job still run on the
+    generator's workers. The remote listing is refreshed when older than inventory_ttl seconds.
+    """
+    
+    def __init__(self, generator: "PlaylistGenerator", temp_dir: str, inventory_ttl: float = 600.0):
+        self.generator = generator
+        self.temp_dir = temp_dir
+        self.inventory_ttl = inventory_ttl
+        self.jobs: Dict[str, IngestJob] = {}
+        self.current: Optional[IngestJob] = None
+        self._ids = itertools.count(1)
+        self._queue: "queue.Queue[Optional[IngestJob]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._inventory_at = 0.0
+        generator.keep_connections = True
+        self._worker = threading.Thread(target=self._run_jobs, name="ingest-daemon", daemon=True)
+    
+    def start(self) -> None:
+        """Load heavy dependencies, connect storage and fetch the remote listing, then start taking jobs."""
+        started = time.perf_counter()
+        librosa_available()
+        numpy_available()
+        pil_available()
+        self.generator._get_catalog()
+        self.generator._get_fingerprint_index()
+        self.generator.fetch_remote_audio_files()
+        self._inventory_at = time.monotonic()
+        logger.info(f"Daemon warmed up in {time.perf_counter() - started:.1f}s")
+        self._worker.start()
+    
+    def submit(self, request: Dict) -> IngestJob:
+        """Queue a job from {"input_dir", "style", "playlist", "cover"}, {"manifest": path} or {"playlists": [...]}.
+        
+        Raises ValueError for an invalid request.
+        """
+        input_dir = None
+        if request.get("manifest"):
+            playlists = load_manifest(request["manifest"])
+        elif request.get("playlists"):
+            playlists = parse_manifest({"playlists": request["playlists"]}, os.getcwd())
+        else:
+            missing = [key for key in ("input_dir", "style", "playlist") if not request.get(key)]
+            if missing:
+                raise ValueError(f"Missing {', '.join(missing)} (or manifest/playlists)")
+            input_dir = request["input_dir"]
+            if not os.path.isdir(input_dir):
+                raise ValueError(f"Input directory does not exist: {input_dir}")
+            playlists = [PlaylistSpec(request["style"], request["playlist"], request.get("cover"))]
+        
+        with self._lock:
+            job = IngestJob(str(next(self._ids)), playlists, input_dir)
+            self.jobs[job.id] = job
+        self._queue.put(job)
+        logger.info(f"Queued job {job.id} for {', '.join(f'{spec.style}/{spec.playlist}' for spec in playlists)}")
+        return job
+    
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        """Cancel a queued job, or stop a running one after the tracks in progress (it still publishes them)."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = time.time()
+            job.cancel_event.set()
+        return job
+    
+    def describe(self, job: IngestJob) -> Dict:
+        progress = self.generator.progress
+        return job.to_dict(progress.snapshot() if job is self.current and progress is not None else None)
+    
+    def _run_jobs(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+                self.current = job
+            try:
+                self._run(job)
+                job.status = "cancelled" if job.cancel_event.is_set() else "done"
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                self.current = None
+            logger.info(f"Job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s")
+    
+    def _run(self, job: IngestJob) -> None:
+        generator = self.generator
+        if time.monotonic() - self._inventory_at > self.inventory_ttl:
+            generator.remote_audio_files = None
+            self._inventory_at = time.monotonic()
+        
+        generator.reset_run(job.playlists, job.cancel_event)
+        if job.input_dir is not None:
+            generator.process_directory(job.input_dir, self.temp_dir)
+        else:
+            generator.process_manifest(self.temp_dir)
+        
+        job.summary = generator.generate_summary()
+        job.counts = {
+            "processed": len(generator.processed_files),
+            "skipped": len(generator.skipped_files),
+            "near_duplicates": len(generator.near_duplicates),
+            "errors": len(generator.errors)
+        }
+    
+    def close(self) -> None:
+        """Cancel queued and running jobs, wait for the running one to wrap up and close storage."""
+        with self._lock:
+            for job in self.jobs.values():
+                if job.status in ("queued", "running"):
+                    job.cancel_event.set()
+                if job.status == "queued":
+                    job.status = "cancelled"
+        self._queue.put(None)
+        if self._worker.is_alive():
+            self._worker.join()
+        self.generator._close_storage()
+
+
+def serve_daemon(daemon: IngestDaemon, address: str) -> None:
+    """Serve the daemon's job API on "host:port" (HTTP) or "unix:/path" until SIGINT/SIGTERM.
+    
+        POST   /jobs        queue a job (JSON body, see IngestDaemon.submit) -> 202 job
+        GET    /jobs        all jobs
+        GET    /jobs/<id>   job status, progress while running, summary when finished
+        DELETE /jobs/<id>   cancel a job
+    
+    There is no authentication: bind to localhost or a Unix socket with restricted permissions.
+    """
+    # http.server is only needed in daemon mode, keep it out of CLI startup
+    import signal
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class JobRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload) -> None:
+            body = json.dumps(payload, indent=2).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def _job_id(self) -> Optional[str]:
+            parts = self.path.rstrip("/").split("/")
+            return parts[2] if len(parts) == 3 and parts[1] == "jobs" else None
+        
+        def do_GET(self) -> None:
+            if self.path.rstrip("/") == "/jobs":
+                self._send_json(200, [daemon.describe(job) for job in list(daemon.jobs.values())])
+                return
+            job = daemon.jobs.get(self._job_id() or "")
+            if job is None:
+                self._send_json(404, {"error": "not found"})
+            else:
+                self._send_json(200, daemon.describe(job))
+        
+        def do_POST(self) -> None:
+            if self.path.rstrip("/") != "/jobs":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                job = daemon.submit(json.loads(self.rfile.read(length) or b"{}"))
+            except (OSError, ValueError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_json(202, daemon.describe(job))
+        
+        def do_DELETE(self) -> None:
+            job = daemon.cancel(self._job_id() or "")
+            if job is None:
+                self._send_json(404, {"error": "not found"})
+            else:
+                self._send_json(200, daemon.describe(job))
+        
+        def log_message(self, format: str, *args) -> None:
+            logger.debug(f"API: {format % args}")
+    
+    class UnixHTTPServer(ThreadingHTTPServer):
+        address_family = socket.AF_UNIX
+        
+        def server_bind(self) -> None:
+            socketserver.TCPServer.server_bind(self)
+            self.server_name, self.server_port = "localhost", 0
+        
+        def get_request(self):
+            request, _ = super().get_request()
+            return request, ("local", 0)
+    
+    if address.startswith("unix:"):
+        socket_path = address[len("unix:"):]
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, JobRequestHandler)
+        os.chmod(socket_path, 0o600)
+    else:
+        socket_path = None
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), JobRequestHandler)
+    
+    def stop(signum, frame) -> None:
+        logger.info("Shutting down daemon...")
+        # shutdown() waits for serve_forever, which runs on this thread
+        threading.Thread(target=server.shutdown).start()
+    
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    logger.info(f"Ingest daemon listening on {address}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        daemon.close()
+
+
+class QueueWorker:
+    """Worker side of a distributed run: claims tracks from the shared queue and runs the track pipeline.
+    
+    Each of the generator's workers holds one leased job at a time, renewed by a heartbeat. Analysis,
+    transcoding and uploads run here; the playlist entry and album art go back through the queue to the
+    coordinator, which owns playlists and styles. Input paths must be reachable under the same path.
+    
+    The local catalog is not used for tracks: near-duplicate checks run against the fingerprints shared
+    in the queue database, and new fingerprints and uploaded objects are written there for the coordinator.
+    """
+    
+    def __init__(self, generator: "PlaylistGenerator", job_queue: JobQueue, temp_dir: str, worker_id: Optional[str] = None, inventory_ttl: float = 600.0):
+        self.generator = generator
+        self.job_queue = job_queue
+        self.temp_dir = temp_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.inventory_ttl = inventory_ttl
+        self.stop_event = threading.Event()
+        self.completed = 0
+        self.failed = 0
+        self._entries: Dict[str, Dict] = {}
+        self._held: Dict[int, str] = {}  # Leased job id -> path
+        self._lock = threading.Lock()
+        self._inventory_at = time.monotonic()
+        generator.entry_sink = self._entry_ready
+        generator.worker_queue = job_queue
+        Path(temp_dir).mkdir(exist_ok=True)
+    
+    def _entry_ready(self, input_file: str, song_entry: Dict) -> None:
+        with self._lock:
+            self._entries[input_file] = song_entry
+    
+    def run(self, exit_when_idle: bool = False) -> None:
+        """Process jobs until stopped (or, with exit_when_idle, until the queue has no pending or leased jobs)."""
+        logger.info(f"Worker {self.worker_id} taking jobs from {self.job_queue.path} with {self.generator.workers} threads")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(done,), name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        threads = [threading.Thread(target=self._work, args=(exit_when_idle,), name=f"queue-worker-{i}")
+                   for i in range(self.generator.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1.0)
+        except KeyboardInterrupt:
+            logger.info("Stopping worker after the tracks in progress...")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            done.set()
+            heartbeat.join()
+            self.generator._close_storage()
+        logger.info(f"Worker {self.worker_id} finished: {self.completed} tracks done, {self.failed} failed")
+    
+    def _heartbeat(self, done: threading.Event) -> None:
+        lease_seconds = self.generator.lease_seconds
+        while not done.wait(lease_seconds / 3):
+            with self._lock:
+                held = list(self._held)
+            try:
+                self.job_queue.renew(held, self.worker_id, lease_seconds)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not renew leases: {e}")
+    
+    def _work(self, exit_when_idle: bool) -> None:
+        while not self.stop_event.is_set():
+            claimed = self.job_queue.claim(self.worker_id, self.generator.lease_seconds)
+            if claimed is None:
+                if exit_when_idle and self.job_queue.idle():
+                    return
+                self.stop_event.wait(self.generator.poll_interval)
+                continue
+            
+            job_id, path = claimed
+            with self._lock:
+                self._held[job_id] = path
+            result, error = None, None
+            try:
+                result = self._process(path)
+            except Exception as e:
+                error = str(e)
+            finally:
+                with self._lock:
+                    self._held.pop(job_id, None)
+            
+            if not self.job_queue.finish(job_id, self.worker_id, result, error):
+                logger.warning(f"Lease on {path} was lost before it finished, result discarded")
+            elif error:
+                self.failed += 1
+                logger.error(f"Failed to process {path}: {error}")
+            else:
+                self.completed += 1
+    
+    def _process(self, path: str) -> Dict:
+        """Run the track pipeline on one file; the result carries its playlist entry for the coordinator."""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} is not reachable from {self.worker_id}")
+        
+        generator = self.generator
+        with self._lock:
+            if time.monotonic() - self._inventory_at > self.inventory_ttl:
+                generator.remote_audio_files = None
+                self._inventory_at = time.monotonic()
+            # Tracks other workers published since the last job
+            generator.merge_shared_fingerprints()
+        
+        errors_before = len(generator.errors)
+        generator.process_audio_file(path, self.temp_dir)
+        with self._lock:
+            entry = self._entries.pop(path, None)
+        
+        result = {
+            "worker": self.worker_id,
+            "entry": entry,
+            "errors": [error for error in generator.errors[errors_before:] if path in error]
+        }
+        if entry and entry.get("album"):
+            cover = generator._get_catalog().album_cover(entry["album"])
+            if cover:
+                result["album_cover"] = base64.b64encode(cover).decode('ascii')
+        return result
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate playlists from music files")
     parser.add_argument("input_dir", nargs='?', help="Directory containing music files")
@@ -1496,10 +5817,37 @@ def main():
     parser.add_argument("--temp-dir", help="Temporary directory for conversions", default="/tmp/playlist_gen")
     parser.add_argument("--style", help="Music style (e.g., bachata, salsa, west_coast_swing)")
     parser.add_argument("--playlist", help="Playlist name")
-    parser.add_argument("--recalculate-tempos", action="store_true", help="Recalculate tempo ranges for all existing playlists without processing new files")
+    parser.add_argument("--manifest", help="Batch manifest (JSON) mapping input folders/globs and tempo filters to several style/playlist pairs, processed in one run")
+    parser.add_argument("--recalculate-tempos", action="store_true", help="Recalculate tempo ranges for all existing playlists without processing new files, and publish the changed playlists, styles and tempo indexes")
+    parser.add_argument("--local-only", action="store_true", help="With --recalculate-tempos, only write the changed files locally")
     parser.add_argument("--skip-no-tempo", action="store_true", help="Skip songs that don't have tempo in metadata instead of measuring tempo")
     parser.add_argument("--upload-public", action="store_true", help="Upload all files from public directory to server")
+    parser.add_argument("--import-json", action="store_true", help="Import the local playlist and style JSON files into the catalog, replacing catalog rows with the same ids")
     parser.add_argument("--cover", help="Path to cover image file for playlist")
+    parser.add_argument("--encoding-profile", choices=["default", "streaming"], help="MP3 encoding profile; 'streaming' strips large ID3 frames, writes a Xing/LAME header and optionally re-encodes oversized MP3s")
+    parser.add_argument("--silence", choices=["off", "offsets", "trim"], help="Detect leading/trailing silence and record it as playlist cue points (offsets) or cut it while transcoding (trim)")
+    parser.add_argument("--metrics-dir", help="Collect per-stage timing/resource metrics and write metrics.json and metrics.prom to this directory")
+    parser.add_argument("--profile", action="append", choices=list(ProfilingHooks.MODES) + ["all"], help="Profile the run: per-stage cProfile dumps, tracemalloc snapshots around metadata/decoding/conversion, or stack sampling of all threads (repeatable)")
+    parser.add_argument("--profile-dir", help="Run directory for profiling output (default: profiles/<timestamp>)")
+    parser.add_argument("--scan-workers", type=int, help="Threads listing directories in parallel while scanning the input (default: 8, raise for network mounts)")
+    parser.add_argument("--sort-by-size", action="store_true", help="Scan the whole input first and process the largest files first")
+    parser.add_argument("--workers", type=int, help="Tracks processed in parallel, longest expected first (default: processing.workers from config, 1)")
+    parser.add_argument("--no-progress", action="store_true", help="Disable live progress reporting (progress bar on a terminal, periodic log line otherwise)")
+    parser.add_argument("--progress-interval", type=float, default=30.0, help="Seconds between progress log lines when not running on a terminal (default: 30)")
+    parser.add_argument("--no-dedup", action="store_true", help="Disable near-duplicate detection by fingerprint similarity")
+    parser.add_argument("--dedup-threshold", type=float, help="Fingerprint similarity (1 - bit error rate) at which a track is linked to an existing one (default: dedup.threshold from config, 0.85)")
+    parser.add_argument("--serve", nargs='?', const="", metavar="ADDRESS", help="Run as a daemon that keeps the generator warm and takes ingest jobs over HTTP on host:port or unix:/path (default: daemon.address from config, 127.0.0.1:8765)")
+    parser.add_argument("--queue", help="Shared job queue (SQLite file on a shared mount): with an input directory or manifest, queue tracks for --worker machines and apply their results; with --worker, process queued tracks")
+    parser.add_argument("--worker", action="store_true", help="Run as a worker taking tracks from --queue")
+    parser.add_argument("--exit-when-idle", action="store_true", help="Stop the worker once the queue has no pending or leased tracks")
+    parser.add_argument("--analyze-only", action="store_true", help="Only compute missing fingerprints and tempos of the files in input_dir and write them to their tags, without connecting to the server")
+    parser.add_argument("--loudness", action="store_true", help="With --analyze-only, also measure loudness (EBU R128) and write a ReplayGain track gain tag")
+    parser.add_argument("--report", help="With --analyze-only, report of every file and what was written (CSV for a .csv path, JSON otherwise; default: analysis_report.json); with --gc, the JSON report of unreferenced files (default: gc_report.json)")
+    parser.add_argument("--plan", metavar="PLAN", help="Only plan the run from tags, the remote listing and the fingerprint index: write per-file stages, CPU and upload estimates to this JSON file and print a summary")
+    parser.add_argument("--calibration", help="With --plan, benchmark_playlist.py results to calibrate the per-stage CPU rates")
+    parser.add_argument("--execute-plan", metavar="PLAN", help="Run a plan written by --plan for its playlists, without scanning the inputs again")
+    parser.add_argument("--gc", nargs='?', const="report", choices=["report", "quarantine", "delete"], help="Find published audio files and covers no playlist or style references and report them (default), move them to gc.quarantine_path or delete them")
+    parser.add_argument("--grace-days", type=float, help="With --gc, keep unreferenced files younger than this (default: gc.grace_days from config, 7)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose logging")
     
     args = parser.parse_args()
@@ -1512,6 +5860,7 @@ def main():
             # Only upload public directory without processing new files
             logger.info("Uploading public directory to server...")
             dummy_generator = PlaylistGenerator(args.config, "dummy", "dummy", allow_dummy=True)
+            require_dependencies(*storage_dependencies(dummy_generator.config))
             if dummy_generator.upload_public_directory():
                 logger.info("Public directory upload complete!")
             else:
@@ -1519,35 +5868,159 @@ def main():
                 sys.exit(1)
             return
         
+        if args.import_json:
+            # Bring the catalog in line with hand-edited or restored JSON files
+            dummy_generator = PlaylistGenerator(args.config, "dummy", "dummy", allow_dummy=True, temp_dir=args.temp_dir)
+            playlists, styles = dummy_generator._get_catalog().import_json(dummy_generator.config["output"]["playlists_dir"],
+                                                                           dummy_generator.config["output"]["styles_dir"])
+            logger.info(f"Imported {playlists} playlists and {styles} styles into the catalog")
+            return
+        
         if args.recalculate_tempos:
             # Only recalculate tempo ranges without processing new files
             logger.info("Recalculating tempo ranges for all existing playlists...")
             dummy_generator = PlaylistGenerator(args.config, "dummy", "dummy", allow_dummy=True, temp_dir=args.temp_dir)
+            upload = not args.local_only
+            if upload:
+                require_dependencies(*storage_dependencies(dummy_generator.config))
             dummy_generator.recalculate_all_playlist_tempos()
+            published = dummy_generator.publish_catalog(upload=upload)
+            dummy_generator.update_all_tempo_indexes(upload=upload)
+            dummy_generator._close_storage()
+            if not published or dummy_generator.errors:
+                logger.error("Tempo recalculation finished with errors, changed files that failed to upload stay pending")
+                sys.exit(1)
             logger.info("Tempo recalculation complete!")
             return
         
-        # Standard processing mode - require all arguments
-        if not args.input_dir:
-            logger.error("Input directory is required unless using --recalculate-tempos")
+        if args.gc:
+            # Garbage collection: no input files, only the published JSONs and the remote inventory
+            dummy_generator = PlaylistGenerator(args.config, "dummy", "dummy", allow_dummy=True, temp_dir=args.temp_dir)
+            require_dependencies(*storage_dependencies(dummy_generator.config))
+            report = dummy_generator.collect_garbage(args.gc, args.grace_days)
+            dummy_generator.write_report(report, args.report or "gc_report.json", "Garbage collection report")
+            dummy_generator._close_storage()
+            print(dummy_generator.format_gc_summary(report))
+            if dummy_generator.errors:
+                sys.exit(1)
+            return
+        
+        if args.serve is not None:
+            # Daemon mode: jobs bring their own input directory and playlists
+            require_dependencies(*AUDIO_DEPENDENCIES)
+            generator = PlaylistGenerator(args.config, allow_dummy=True, skip_no_tempo=args.skip_no_tempo, temp_dir=args.temp_dir, silence_mode=args.silence, encoding_profile=args.encoding_profile, show_progress=not args.no_progress, progress_interval=args.progress_interval, scan_workers=args.scan_workers, sort_by_size=args.sort_by_size, workers=args.workers, dedup=not args.no_dedup, dedup_threshold=args.dedup_threshold)
+            if not which("ffmpeg"):
+                raise RuntimeError("ffmpeg is required but not found in PATH")
+            require_dependencies(*storage_dependencies(generator.config))
+            daemon_config = generator.config.get("daemon", {})
+            daemon = IngestDaemon(generator, args.temp_dir, daemon_config.get("inventory_ttl", 600))
+            daemon.start()
+            serve_daemon(daemon, args.serve or daemon_config.get("address", "127.0.0.1:8765"))
+            return
+        
+        if args.analyze_only:
+            # Tag backfill: no storage, catalog or playlists involved
+            if not args.input_dir or not os.path.isdir(args.input_dir):
+                logger.error("--analyze-only requires an existing input directory")
+                sys.exit(1)
+            require_dependencies(mutagen, acoustid)
+            if args.loudness and not which("ffmpeg"):
+                raise RuntimeError("ffmpeg is required for --loudness but not found in PATH")
+            generator = PlaylistGenerator(args.config, allow_dummy=True, skip_no_tempo=args.skip_no_tempo, temp_dir=args.temp_dir, metrics_dir=args.metrics_dir, show_progress=not args.no_progress, progress_interval=args.progress_interval, scan_workers=args.scan_workers, sort_by_size=args.sort_by_size, workers=args.workers)
+            rows = generator.analyze_library(args.input_dir, args.report or "analysis_report.json", loudness=args.loudness)
+            print(generator.format_analysis_summary(rows))
+            generator.write_metrics()
+            return
+        
+        if args.worker:
+            # Distributed worker: tracks come from the queue, the coordinator owns the playlists
+            if not args.queue:
+                logger.error("--worker requires --queue")
+                sys.exit(1)
+            require_dependencies(*AUDIO_DEPENDENCIES)
+            generator = PlaylistGenerator(args.config, allow_dummy=True, skip_no_tempo=args.skip_no_tempo, temp_dir=args.temp_dir, silence_mode=args.silence, encoding_profile=args.encoding_profile, show_progress=False, workers=args.workers, dedup=not args.no_dedup, dedup_threshold=args.dedup_threshold)
+            if not which("ffmpeg"):
+                raise RuntimeError("ffmpeg is required but not found in PATH")
+            require_dependencies(*storage_dependencies(generator.config))
+            job_queue = JobQueue(args.queue, generator.config.get("distributed", {}).get("max_attempts", 3))
+            worker = QueueWorker(generator, job_queue, args.temp_dir, inventory_ttl=generator.config.get("daemon", {}).get("inventory_ttl", 600))
+            worker.run(exit_when_idle=args.exit_when_idle)
+            return
+        
+        if args.execute_plan:
+            # Planned run: files, playlists and processing options come from the plan
+            try:
+                plan, playlists = load_plan(args.execute_plan)
+            except (OSError, ValueError) as e:
+                logger.error(f"Invalid plan {args.execute_plan}: {e}")
+                sys.exit(1)
+            require_dependencies(*AUDIO_DEPENDENCIES)
+            options = plan.get("options", {})
+            generator = PlaylistGenerator(args.config, temp_dir=args.temp_dir, skip_no_tempo=args.skip_no_tempo or options.get("skip_no_tempo", False), silence_mode=args.silence or options.get("silence_mode"), encoding_profile=args.encoding_profile or options.get("encoding_profile"), metrics_dir=args.metrics_dir, show_progress=not args.no_progress, progress_interval=args.progress_interval, workers=args.workers, dedup=not args.no_dedup, dedup_threshold=args.dedup_threshold, playlists=playlists)
+            require_dependencies(*storage_dependencies(generator.config))
+            if args.queue:
+                generator.job_queue = JobQueue(args.queue, generator.config.get("distributed", {}).get("max_attempts", 3))
+            generator.execute_plan(plan, args.temp_dir)
+            print(generator.generate_summary())
+            generator.write_metrics()
+            return
+        
+        # Standard processing mode - require all arguments (or a manifest)
+        playlists = None
+        if args.manifest:
+            try:
+                playlists = load_manifest(args.manifest)
+            except (OSError, ValueError) as e:
+                logger.error(f"Invalid manifest {args.manifest}: {e}")
+                sys.exit(1)
+        elif not args.input_dir:
+            logger.error("Input directory is required unless using --manifest or --recalculate-tempos")
             sys.exit(1)
-        if not args.style:
+        elif not args.style:
             logger.error("Style is required unless using --recalculate-tempos")
             sys.exit(1)
-        if not args.playlist:
+        elif not args.playlist:
             logger.error("Playlist name is required unless using --recalculate-tempos")
             sys.exit(1)
-        
-        if not os.path.exists(args.input_dir):
+        elif not os.path.exists(args.input_dir):
             logger.error(f"Input directory does not exist: {args.input_dir}")
             sys.exit(1)
         
-        generator = PlaylistGenerator(args.config, args.style, args.playlist, skip_no_tempo=args.skip_no_tempo, cover_image=args.cover)
-        generator.process_directory(args.input_dir, args.temp_dir)
+        # Planning only reads tags; the audio toolchain is needed once the plan runs
+        if args.plan:
+            require_dependencies(mutagen)
+        else:
+            require_dependencies(*AUDIO_DEPENDENCIES)
+        
+        profiler = None
+        if args.profile:
+            profile_dir = args.profile_dir or os.path.join("profiles", time.strftime("%Y%m%d-%H%M%S"))
+            profiler = ProfilingHooks(args.profile, profile_dir)
+        
+        generator = PlaylistGenerator(args.config, args.style, args.playlist, allow_dummy=bool(args.plan), temp_dir=args.temp_dir, skip_no_tempo=args.skip_no_tempo, cover_image=args.cover, silence_mode=args.silence, encoding_profile=args.encoding_profile, metrics_dir=args.metrics_dir, profiler=profiler, show_progress=not args.no_progress, progress_interval=args.progress_interval, scan_workers=args.scan_workers, sort_by_size=args.sort_by_size, workers=args.workers, dedup=not args.no_dedup, dedup_threshold=args.dedup_threshold, playlists=playlists)
+        require_dependencies(*storage_dependencies(generator.config))
+        if args.plan:
+            plan = generator.plan_run(None if playlists else args.input_dir, args.calibration)
+            generator.write_report(plan, args.plan, "Plan")
+            print(generator.format_plan_summary(plan))
+            generator._close_storage()
+            return
+        if args.queue:
+            generator.job_queue = JobQueue(args.queue, generator.config.get("distributed", {}).get("max_attempts", 3))
+        try:
+            if playlists:
+                generator.process_manifest(args.temp_dir)
+            else:
+                generator.process_directory(args.input_dir, args.temp_dir)
+        finally:
+            if profiler is not None:
+                written = profiler.close()
+                logger.info(f"Profiling output ({len(written)} files) written to {profiler.run_dir}")
         
         # Generate and print summary
         summary = generator.generate_summary()
         print(summary)
+        generator.write_metrics()
         
     except Exception as e:
         logger.error(f"Fatal error: {e}")
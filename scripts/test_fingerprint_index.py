@@ -0,0 +1,139 @@
+"""Tests for near-duplicate detection: chromaprint fingerprint decoding and the similarity index."""
+
+import base64
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from generate_playlist import FingerprintIndex, decode_fingerprint, numpy_available  # noqa: E402
+
+numpy_available()  # Binds the module's lazily imported numpy
+
+
+def encode_fingerprint(items, algorithm=1):
+    """Reference encoder: chromaprint's compressed fingerprint format, as fpcalc prints it."""
+    gaps = []
+    previous = 0
+    for value in items:
+        delta = value ^ previous
+        previous = value
+        bit, last = 1, 0
+        while delta:
+            if delta & 1:
+                gaps.append(bit - last)
+                last = bit
+            delta >>= 1
+            bit += 1
+        gaps.append(0)
+
+    def pack(values, width):
+        packed = 0
+        for i, value in enumerate(values):
+            packed |= value << (i * width)
+        return packed.to_bytes((len(values) * width + 7) // 8, 'little')
+
+    header = bytes([algorithm, (len(items) >> 16) & 255, (len(items) >> 8) & 255, len(items) & 255])
+    data = header + pack([min(gap, 7) for gap in gaps], 3) + pack([gap - 7 for gap in gaps if gap >= 7], 5)
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def random_items(rng, count):
+    items = rng.integers(0, 2 ** 32, count, dtype=np.uint64).astype(np.uint32)
+    # Runs of repeated items (zero deltas) and lone high bits (gaps over 7, the exception stream)
+    items[rng.random(count) < 0.1] = 0
+    items[rng.random(count) < 0.1] = np.uint32(1 << 31)
+    repeat = rng.random(count) < 0.1
+    repeat[0] = False
+    items[repeat] = items[np.flatnonzero(repeat) - 1]
+    return items
+
+
+def noisy_copy(rng, items, bit_error_rate):
+    flips = rng.random((len(items), 32)) < bit_error_rate
+    return items ^ (flips.astype(np.uint64) << np.arange(32, dtype=np.uint64)).sum(axis=1).astype(np.uint32)
+
+
+def test_decode_matches_reference_encoder():
+    rng = np.random.default_rng(41)
+    for _ in range(200):
+        items = random_items(rng, int(rng.integers(1, 400)))
+        decoded = decode_fingerprint(encode_fingerprint([int(value) for value in items]))
+        assert decoded.dtype == np.uint32
+        np.testing.assert_array_equal(decoded, items)
+
+
+def test_decode_empty_and_malformed():
+    assert len(decode_fingerprint(encode_fingerprint([]))) == 0
+    fingerprint = encode_fingerprint([0xFFFFFFFF, 1, 2, 3])
+    with pytest.raises(ValueError):
+        decode_fingerprint(fingerprint[:8])
+    with pytest.raises(ValueError):
+        decode_fingerprint("AQ")
+    with pytest.raises(ValueError):
+        decode_fingerprint("not base64!")
+
+
+def test_find_threshold():
+    rng = np.random.default_rng(1)
+    index = FingerprintIndex(threshold=0.9)
+    original = rng.integers(0, 2 ** 32, 300, dtype=np.uint64).astype(np.uint32)
+    index.add("original", original, 200)
+    for i in range(20):
+        index.add(f"other-{i}", rng.integers(0, 2 ** 32, 300, dtype=np.uint64).astype(np.uint32), 200)
+
+    assert index.find(original, 200) == ("original", 1.0)
+    track_id, similarity = index.find(noisy_copy(rng, original, 0.05), 200)
+    assert track_id == "original"
+    assert 0.93 < similarity < 0.97
+    # A shifted encode (different leading silence) still matches
+    assert index.find(np.concatenate([rng.integers(0, 2 ** 32, 40, dtype=np.uint64).astype(np.uint32), original]), 205)[0] == "original"
+    assert index.find(noisy_copy(rng, original, 0.15), 200) is None
+    assert index.find(rng.integers(0, 2 ** 32, 300, dtype=np.uint64).astype(np.uint32), 200) is None
+    assert index.find(np.zeros(0, dtype=np.uint32), 200) is None
+
+    strict = FingerprintIndex(threshold=0.97)
+    strict.add("original", original, 200)
+    assert strict.find(noisy_copy(rng, original, 0.05), 200) is None
+
+
+def test_find_duration_gate():
+    rng = np.random.default_rng(2)
+    index = FingerprintIndex(threshold=0.9, max_duration_diff=10)
+    original = rng.integers(0, 2 ** 32, 300, dtype=np.uint64).astype(np.uint32)
+    index.add("original", original, 200)
+    index.add("unknown-duration", original ^ np.uint32(1), None)
+
+    assert index.find(original, 210)[0] == "original"
+    # Too far apart in duration for "original"; only the track without a duration is left
+    assert index.find(original, 211)[0] == "unknown-duration"
+    assert index.find(original, None)[0] == "original"
+
+
+def test_candidates_from_pending_and_merged_keys():
+    rng = np.random.default_rng(3)
+    index = FingerprintIndex()
+    tracks = [rng.integers(0, 2 ** 32, 250, dtype=np.uint64).astype(np.uint32) for _ in range(FingerprintIndex.MERGE_EVERY + 10)]
+
+    for i, items in enumerate(tracks[:10]):
+        index.add(f"track-{i}", items)
+    assert len(index._keys) == 0 and len(index._pending_keys) == 10
+    assert index._candidates(index._bucket_keys(tracks[3]))[0] == 3
+
+    for i, items in enumerate(tracks[10:], 10):
+        index.add(f"track-{i}", items)
+    # The MERGE_EVERY-th addition sorted the pending keys in; the rest are pending again
+    assert len(index._pending_keys) == 10
+    assert len(index._keys) == sum(len(index._bucket_keys(items)) for items in tracks[:FingerprintIndex.MERGE_EVERY])
+    assert np.all(index._keys[1:] >= index._keys[:-1])
+
+    merged, pending = 3, FingerprintIndex.MERGE_EVERY + 5
+    for slot in (merged, pending):
+        candidates = index._candidates(index._bucket_keys(noisy_copy(rng, tracks[slot], 0.03)))
+        assert candidates[0] == slot
+        assert index.find(tracks[slot]) == (f"track-{slot}", 1.0)
+
+    before = {slot: list(index._candidates(index._bucket_keys(tracks[slot]))) for slot in (merged, pending)}
+    index._merge_pending()
+    assert index._pending_keys == []
+    assert {slot: list(index._candidates(index._bucket_keys(tracks[slot]))) for slot in (merged, pending)} == before
@@ -0,0 +1,226 @@
+"""Tests for publishing playlists and styles from several runs: catalog merges and remote file locks."""
+
+import json
+import os
+import time
+
+import pytest
+
+from generate_playlist import Catalog, PlaylistGenerator
+
+
+def song(track_id, tempo=120):
+    return {"id": track_id, "title": track_id, "artist": "Artist", "album": "Album", "tempo": tempo}
+
+
+def make_generator(tmp_path, name):
+    """A generator publishing into the shared tmp_path/root, with its own catalog and output directories."""
+    run_dir = tmp_path / name
+    config = {
+        "storage": {"type": "local", "root": str(tmp_path / "root")},
+        "catalog": {"path": str(run_dir / "catalog.db")},
+        "output": {"playlists_dir": str(run_dir / "playlists"), "styles_dir": str(run_dir / "styles"),
+                   "tempo_index_dir": str(run_dir / "tempo_index")},
+        "locking": {"lease_seconds": 60, "timeout": 0},
+    }
+    run_dir.mkdir(parents=True, exist_ok=True)
+    config_path = run_dir / "config.json"
+    config_path.write_text(json.dumps(config))
+    return PlaylistGenerator(str(config_path), allow_dummy=True, temp_dir=str(run_dir / "temp"))
+
+
+@pytest.fixture
+def runs(tmp_path):
+    first, second = make_generator(tmp_path, "first"), make_generator(tmp_path, "second")
+    yield first, second
+    for generator in (first, second):
+        generator._get_catalog().close()
+
+
+def publish(generator, table, row_id):
+    return generator._publish_merged(generator._get_targets()[0], table, row_id)
+
+
+def remote_json(tmp_path, table, row_id):
+    with open(tmp_path / "root" / "public" / table / f"{row_id}.json") as f:
+        return json.load(f)
+
+
+def test_concurrent_song_appends_are_merged(tmp_path, runs):
+    first, second = runs
+    for generator in runs:
+        catalog = generator._get_catalog()
+        catalog.ensure_playlist("p", {"name": "P"})
+        catalog.add_song("p", song("shared"))
+    publish(first, "playlists", "p")
+    publish(second, "playlists", "p")
+
+    # Both runs append a different song to version 2 of the file
+    first._get_catalog().add_song("p", song("from-first", 100))
+    second._get_catalog().add_song("p", song("from-second", 140))
+    publish(first, "playlists", "p")
+    publish(second, "playlists", "p")
+
+    playlist = remote_json(tmp_path, "playlists", "p")
+    assert playlist["version"] == 4
+    assert [entry["id"] for entry in playlist["songs"]] == ["shared", "from-second", "from-first"]
+    assert (playlist["minTempo"], playlist["maxTempo"]) == (100, 140)
+    assert not [name for name in os.listdir(tmp_path / "root" / "public" / "playlists") if not name.endswith(".json")]
+
+    # The first run picks up the second run's song on its next publish instead of dropping it
+    publish(first, "playlists", "p")
+    assert [entry["id"] for entry in remote_json(tmp_path, "playlists", "p")["songs"]] == ["shared", "from-first", "from-second"]
+
+
+def test_merge_playlist_is_idempotent(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.db"))
+    remote = {"name": "P", "version": 3, "songs": [song("a"), song("b")]}
+    assert catalog.merge_playlist("p", remote) == (2, [])
+    assert catalog.merge_playlist("p", remote) == (0, [])
+    assert [entry["id"] for entry in catalog.get_playlist("p")["songs"]] == ["a", "b"]
+    catalog.close()
+
+
+def test_concurrent_style_entries_are_merged(tmp_path, runs):
+    first, second = runs
+    for generator in runs:
+        generator._get_catalog().upsert_style_playlist("s", {"name": "S"}, {"id": "shared", "version": 1})
+    publish(first, "styles", "s")
+    publish(second, "styles", "s")
+
+    first._get_catalog().upsert_style_playlist("s", {"name": "S"}, {"id": "from-first", "version": 1})
+    first._get_catalog().update_style_playlist("s", "shared", version=2)
+    second._get_catalog().upsert_style_playlist("s", {"name": "S"}, {"id": "from-second", "version": 1})
+    publish(first, "styles", "s")
+
+    changed, conflicts = second._get_catalog().merge_style("s", remote_json(tmp_path, "styles", "s"))
+    assert (changed, conflicts) == (2, [])
+    entries = {entry["id"]: entry for entry in second._get_catalog().get_style("s")["playlists"]}
+    assert list(entries) == ["shared", "from-second", "from-first"]
+    assert entries["shared"]["version"] == 2
+
+    # An older entry in the file does not replace a newer local one
+    second._get_catalog().update_style_playlist("s", "from-first", version=5)
+    changed, _ = second._get_catalog().merge_style("s", remote_json(tmp_path, "styles", "s"))
+    assert changed == 0
+    assert second._get_catalog().get_style("s")["playlists"][2]["version"] == 5
+
+
+def test_field_conflicts_are_decided_against_the_base(tmp_path, runs):
+    first, second = runs
+    for generator in runs:
+        catalog = generator._get_catalog()
+        catalog.ensure_playlist("p", {"name": "P", "description": "old", "cover": "old.jpg", "mood": "calm"})
+    publish(first, "playlists", "p")
+    publish(second, "playlists", "p")
+
+    first._get_catalog().update_playlist("p", description="first", cover="new.jpg")
+    second._get_catalog().update_playlist("p", description="second", mood="dark")
+    publish(first, "playlists", "p")
+
+    merged, conflicts = second._get_catalog().merge_playlist("p", remote_json(tmp_path, "playlists", "p"))
+    assert (merged, conflicts) == (0, ["description"])
+    playlist = second._get_catalog().get_playlist("p")
+    assert playlist["description"] == "second"  # Changed on both sides: local wins
+    assert playlist["cover"] == "new.jpg"  # Changed remotely only
+    assert playlist["mood"] == "dark"  # Changed locally only
+
+
+def test_merge_fields_keeps_removals_from_one_side():
+    base = {"a": 1, "b": 2}
+    merged, conflicts = Catalog._merge_fields(base, {"a": 1, "b": 2}, {"a": 1, "c": 3})
+    assert merged == {"a": 1, "c": 3}
+    assert conflicts == []
+    merged, conflicts = Catalog._merge_fields(base, {"a": 1}, {"a": 5, "b": 2})
+    assert merged == {"a": 5}
+    assert conflicts == []
+    # Removed locally, changed remotely: a conflict, and the local removal wins
+    merged, conflicts = Catalog._merge_fields(base, {"a": 1}, {"a": 1, "b": 3})
+    assert merged == {"a": 1}
+    assert conflicts == ["b"]
+    # An explicit null is a value like any other
+    merged, conflicts = Catalog._merge_fields(base, {"a": None, "b": 2}, {"a": 1, "b": 2})
+    assert merged == {"a": None, "b": 2}
+
+
+def write_lock(storage, lock_path, owner, expires):
+    storage.makedirs(os.path.dirname(lock_path))
+    with open(storage._path(lock_path), 'w') as f:
+        json.dump({"owner": owner, "expires": expires}, f)
+
+
+def test_expired_lock_is_taken_over(tmp_path, runs):
+    generator = runs[0]
+    storage = generator._get_targets()[0].storage
+    lock_path = "public/playlists/p.json.lock"
+    write_lock(storage, lock_path, "crashed-run", time.time() - 1)
+
+    with generator._remote_file_lock(storage, "public/playlists/p.json") as held:
+        assert held == lock_path
+        assert generator._lock_holder(storage, lock_path)["owner"] == generator.lock_owner
+    assert generator._lock_holder(storage, lock_path) is None
+    assert os.listdir(tmp_path / "root" / "public" / "playlists") == []
+
+
+def test_live_lock_is_not_taken_over(tmp_path, runs):
+    generator = runs[0]
+    storage = generator._get_targets()[0].storage
+    lock_path = "public/playlists/p.json.lock"
+    write_lock(storage, lock_path, "other-run", time.time() + 60)
+
+    with pytest.raises(TimeoutError):
+        with generator._remote_file_lock(storage, "public/playlists/p.json"):
+            pass
+    assert generator._lock_holder(storage, lock_path)["owner"] == "other-run"
+
+
+def test_takeover_puts_back_a_lock_replaced_since_it_was_read(tmp_path, runs):
+    generator = runs[0]
+    storage = generator._get_targets()[0].storage
+    lock_path = "public/playlists/p.json.lock"
+    expired = {"owner": "crashed-run", "expires": time.time() - 1}
+    # Another run took the expired lock over between our read and our rename
+    write_lock(storage, lock_path, "other-run", time.time() + 60)
+
+    generator._take_over_lock(storage, lock_path, expired)
+    assert generator._lock_holder(storage, lock_path)["owner"] == "other-run"
+    assert os.listdir(tmp_path / "root" / "public" / "playlists") == ["p.json.lock"]
+
+
+def test_replace_refuses_after_losing_the_lock(tmp_path, runs):
+    generator = runs[0]
+    target = generator._get_targets()[0]
+    storage = target.storage
+    remote_path = "public/playlists/p.json"
+    local_path = tmp_path / "p.json"
+    storage.makedirs("public/playlists")
+    (tmp_path / "root" / remote_path).write_text('{"version": 1}')
+    local_path.write_text('{"version": 2}')
+
+    with generator._remote_file_lock(storage, remote_path) as lock_path:
+        # Our lease expired and another run took the lock over
+        write_lock(storage, lock_path, "other-run", time.time() + 60)
+        with pytest.raises(RuntimeError, match="Lost lock"):
+            generator._replace_locked(target, lock_path, str(local_path), remote_path)
+
+    assert (tmp_path / "root" / remote_path).read_text() == '{"version": 1}'
+    assert sorted(os.listdir(tmp_path / "root" / "public" / "playlists")) == ["p.json", "p.json.lock"]
+    assert generator._lock_holder(storage, remote_path + ".lock")["owner"] == "other-run"
+    assert target.uploaded == 0
+
+
+def test_replace_while_holding_the_lock(tmp_path, runs):
+    generator = runs[0]
+    target = generator._get_targets()[0]
+    storage = target.storage
+    remote_path = "public/playlists/p.json"
+    local_path = tmp_path / "p.json"
+    local_path.write_text('{"version": 2}')
+    storage.makedirs("public/playlists")
+
+    with generator._remote_file_lock(storage, remote_path) as lock_path:
+        generator._replace_locked(target, lock_path, str(local_path), remote_path)
+
+    assert (tmp_path / "root" / remote_path).read_text() == '{"version": 2}'
+    assert os.listdir(tmp_path / "root" / "public" / "playlists") == ["p.json"]
+    assert target.uploaded == 1